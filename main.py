@@ -1,17 +1,62 @@
 import argparse
+import sys
 
-import sample.dataset.dataset_pipeline as dp
-import sample.training.train_classifier as tc
+# Modules of the pipeline are imported by the commands that need them, such that startup is fast
 
+commands = ['run', 'dataset', 'export', 'train', 'check-config']
 
-def main() -> None:
-    parser = argparse.ArgumentParser(description="Run classifiers")
-    parser.add_argument('model_type', type=str, help='Type of the model (gat, gcn, transformer, sage, fcnn, dt, rf')
-    args = parser.parse_args()
-    
+
+def run_dataset(args) -> None:
+    import sample.dataset.dataset_pipeline as dp
     dp.main()
+
+
+def run_export(args) -> None:
+    import sample.dataset.dataset_pipeline as dp
+    dp.main(export_only=True)
+
+
+def run_train(args) -> None:
+    import sample.training.train_classifier as tc
     tc.main(args)
 
 
+def run_check_config(args) -> None:
+    import sample.training.train_classifier as tc
+    tc.validate_config(args.model_type)
+    print(f'Config of {args.model_type} is valid')
+
+
+def run_all(args) -> None:
+    run_check_config(args)
+    run_dataset(args)
+    run_train(args)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run classifiers")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    model_type_help = 'Type of the model (gat, gcn, transformer, sage, fcnn, dt, rf'
+    parser_run = subparsers.add_parser('run', help='Create the dataset and train a classifier')
+    parser_run.add_argument('model_type', type=str, help=model_type_help)
+    parser_run.set_defaults(function=run_all)
+    parser_dataset = subparsers.add_parser('dataset', help='Create the dataset in the DB and export it')
+    parser_dataset.set_defaults(function=run_dataset)
+    parser_export = subparsers.add_parser('export', help='Export a dataset that was created in the DB before')
+    parser_export.set_defaults(function=run_export)
+    parser_train = subparsers.add_parser('train', help='Train a classifier on an exported dataset')
+    parser_train.add_argument('model_type', type=str, help=model_type_help)
+    parser_train.set_defaults(function=run_train)
+    parser_check = subparsers.add_parser('check-config', help='Check the config of a classifier')
+    parser_check.add_argument('model_type', type=str, help=model_type_help)
+    parser_check.set_defaults(function=run_check_config)
+    argv = sys.argv[1:]
+    # `main.py <model_type>` (without command) creates the dataset and trains the classifier
+    if argv and argv[0] not in commands and not argv[0].startswith('-'):
+        argv = ['run'] + argv
+    args = parser.parse_args(argv)
+    args.function(args)
+
+
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,67 @@
+"""
+ |---------------------------------------------------------------------------------------------------------------------|
+ | Benchmark for the building-level features: PL/pgSQL vs. Python engine (Shapely/NumPy).
+ | Both engines must produce the same features (up to numerical precision).
+ |---------------------------------------------------------------------------------------------------------------------|
+"""
+
+import time
+
+import numpy as np
+
+import sample.db_interaction as db
+import sample.dataset.create_dataset as cd
+import sample.dataset.sql_queries.sql_create_dataset as sqlds
+import sample.dataset.engines.building_level as blp
+
+# Extract in Northern Munich
+x_min, x_max, y_min, y_max = 11.4951, 11.6949, 48.1166, 48.2763
+type = 'circ'
+subsample_fraction = 0.004
+buildings_in_graph = 20
+# Maximum absolute difference between the engines
+tolerance = 1e-6
+columns = blp.feature_columns + blp.interacting_columns
+
+features_query = f'''
+    SELECT id, {', '.join(columns)}
+    FROM building_level_features
+    JOIN building_level_features_interacting_blocks
+    USING (id)
+    ORDER BY id
+'''
+
+
+def main() -> None:
+    cd.create_functions()
+    stages = sqlds.computation_stages(subsample_fraction, 4, buildings_in_graph, type, x_min, x_max, y_min, y_max)
+    stages = stages[:[name for name, _ in stages].index('features_prepare') + 1]
+    with db.session() as connection:
+        for _, statement in stages:
+            db.execute_statement(statement, connection)
+        num_buildings = int(db.sql_to_float('SELECT COUNT(1) FROM buildings_with_features', connection))
+
+        start = time.perf_counter()
+        db.execute_statement('SELECT public.building_level(); SELECT public.block_level(true);', connection)
+        sql_runtime = time.perf_counter() - start
+        sql_features = db.sql_to_df(features_query, connection)
+
+        start = time.perf_counter()
+        blp.building_level(connection)
+        python_runtime = time.perf_counter() - start
+        python_features = db.sql_to_df(features_query, connection)
+    cd.drop_functions()
+
+    print(f'{num_buildings} buildings, SQL: {sql_runtime:.3f} s (including blocks), Python: {python_runtime:.3f} s')
+    if not np.array_equal(sql_features['id'], python_features['id']):
+        raise ValueError('Both engines must compute features for the same buildings')
+    for column in columns:
+        difference = np.nanmax(np.abs(sql_features[column].to_numpy(dtype=float) -
+                                      python_features[column].to_numpy(dtype=float)))
+        print(f'{column}: maximum difference {difference:.2e}')
+        if difference > tolerance:
+            raise ValueError(f'Engines differ for {column}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+ |---------------------------------------------------------------------------------------------------------------------|
+ | Benchmark for the circ subgraphs: growing buffer loop vs. radius from the k-th nearest building (KNN).
+ | Both modes must create the same subgraphs (up to buildings right at the buffer border, which `ST_Buffer` only
+ | approximates).
+ |---------------------------------------------------------------------------------------------------------------------|
+"""
+
+import time
+
+import sample.db_interaction as db
+import sample.dataset.create_dataset as cd
+import sample.dataset.sql_queries.sql_create_dataset as sqlds
+
+# Extract in Northern Munich
+x_min, x_max, y_min, y_max = 11.4951, 11.6949, 48.1166, 48.2763
+subsample_fraction = 0.004
+buildings_in_graph = 20
+
+
+def main() -> None:
+    cd.create_functions()
+    db.execute_statement(sqlds.create_building_store)
+    stages = sqlds.computation_stages(subsample_fraction, 4, buildings_in_graph, 'circ', x_min, x_max, y_min, y_max)
+    with db.session() as connection:
+        for name, statement in stages[:2]:
+            db.execute_statement(statement, connection)
+        for knn_radius in [False, True]:
+            start = time.perf_counter()
+            db.execute_statement(f'SELECT public.create_subgraphs(4, {buildings_in_graph}, false, {knn_radius})',
+                                 connection)
+            runtime = time.perf_counter() - start
+            db.execute_statement(f'''
+                DROP TABLE IF EXISTS nodes_{'knn' if knn_radius else 'loop'};
+                CREATE TEMP TABLE nodes_{'knn' if knn_radius else 'loop'} AS
+                (
+                    SELECT UNNEST(center_ids) AS center_id, id
+                    FROM nodes
+                );
+            ''', connection)
+            print(f'{"KNN" if knn_radius else "Loop"}: {runtime:.3f} s')
+        difference = int(db.sql_to_float('''
+            SELECT COUNT(1)
+            FROM (
+                (SELECT * FROM nodes_loop EXCEPT SELECT * FROM nodes_knn)
+                UNION ALL
+                (SELECT * FROM nodes_knn EXCEPT SELECT * FROM nodes_loop)
+            ) a
+        ''', connection))
+        num_nodes = int(db.sql_to_float('SELECT COUNT(1) FROM nodes_loop', connection))
+        print(f'{difference} of {num_nodes} (center, building) pairs differ')
+    cd.drop_functions()
+
+
+if __name__ == '__main__':
+    main()
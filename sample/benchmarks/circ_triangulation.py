@@ -0,0 +1,57 @@
+"""
+ |---------------------------------------------------------------------------------------------------------------------|
+ | Benchmark for the edges of circ subgraphs: Delaunay triangulation per subgraph vs. one global triangulation
+ | (induced subgraphs). Reports the runtime and how many edges of both modes agree.
+ |---------------------------------------------------------------------------------------------------------------------|
+"""
+
+import time
+
+import sample.db_interaction as db
+import sample.dataset.create_dataset as cd
+import sample.dataset.sql_queries.sql_create_dataset as sqlds
+
+# Extract in Northern Munich
+x_min, x_max, y_min, y_max = 11.4951, 11.6949, 48.1166, 48.2763
+subsample_fraction = 0.004
+buildings_in_graph = 20
+
+
+def main() -> None:
+    cd.create_functions()
+    db.execute_statement(sqlds.create_building_store)
+    stages = sqlds.computation_stages(subsample_fraction, 4, buildings_in_graph, 'circ', x_min, x_max, y_min, y_max)
+    with db.session() as connection:
+        for name, statement in stages[:2]:
+            db.execute_statement(statement, connection)
+        for global_triangulation in [False, True]:
+            mode = 'global' if global_triangulation else 'per_center'
+            start = time.perf_counter()
+            db.execute_statement(f'''
+                SELECT public.create_subgraphs(4, {buildings_in_graph}, false, true, {global_triangulation})
+            ''', connection)
+            runtime = time.perf_counter() - start
+            db.execute_statement(f'''
+                DROP TABLE IF EXISTS edges_{mode};
+                CREATE TEMP TABLE edges_{mode} AS
+                (
+                    SELECT LEAST(start_id, end_id) AS a, GREATEST(start_id, end_id) AS b, center_id
+                    FROM edges
+                );
+            ''', connection)
+            num_edges = int(db.sql_to_float(f'SELECT COUNT(1) FROM edges_{mode}', connection))
+            print(f'{mode}: {runtime:.3f} s (including subgraphs with KNN radius), {num_edges} edges')
+        common = int(db.sql_to_float('''
+            SELECT COUNT(1)
+            FROM (
+                SELECT * FROM edges_per_center
+                INTERSECT
+                SELECT * FROM edges_global
+            ) a
+        ''', connection))
+        print(f'{common} edges in both modes')
+    cd.drop_functions()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+ |---------------------------------------------------------------------------------------------------------------------|
+ | Benchmark for the removal of nested and duplicate buildings in `extract_buildings`:
+ | previous implementation (NOT IN) vs. anti-join with geometry hashes, on synthetic buildings of growing size
+ |---------------------------------------------------------------------------------------------------------------------|
+"""
+
+import time
+
+import sample.db_interaction as db
+
+# Number of buildings per side of the synthetic grid
+grid_sizes = [30, 100, 300]
+
+
+def synthetic_buildings(side):
+    """
+    Grid of square buildings (10 m x 10 m), with some nested buildings and some duplicates
+    :param side: number of buildings per side of the grid
+    """
+    query = f'''
+        DROP TABLE IF EXISTS buildings_splitted;
+        CREATE TEMP TABLE buildings_splitted AS
+        (
+            SELECT  ROW_NUMBER() OVER() AS id,
+                    geom
+            FROM (
+                SELECT ST_MakeEnvelope(x * 20, y * 20, x * 20 + 10, y * 20 + 10, 3035) AS geom
+                FROM generate_series(0, {side - 1}) x, generate_series(0, {side - 1}) y
+                UNION ALL
+                -- Nested buildings
+                SELECT ST_MakeEnvelope(x * 20 + 2, y * 20 + 2, x * 20 + 5, y * 20 + 5, 3035) AS geom
+                FROM generate_series(0, {side - 1}) x, generate_series(0, {side - 1}) y
+                WHERE (x + y) % 20 = 0
+                UNION ALL
+                -- Duplicates of nested buildings
+                SELECT ST_MakeEnvelope(x * 20 + 2, y * 20 + 2, x * 20 + 5, y * 20 + 5, 3035) AS geom
+                FROM generate_series(0, {side - 1}) x, generate_series(0, {side - 1}) y
+                WHERE (x + y) % 40 = 0
+            ) a
+        );
+        CREATE INDEX ON buildings_splitted USING gist(geom);
+        ANALYZE buildings_splitted;
+    '''
+    return query
+
+
+cleanup_not_in = '''
+    DROP TABLE IF EXISTS buildings_without_inner_buildings;
+    CREATE TEMP TABLE buildings_without_inner_buildings AS (
+        SELECT  ROW_NUMBER() OVER() AS id,
+                geom
+        FROM buildings_splitted
+        WHERE id NOT IN (
+            SELECT a.id
+            FROM buildings_splitted a
+            JOIN buildings_splitted b
+            ON a.id <> b.id AND ST_Contains(b.geom, a.geom)
+            GROUP BY a.id
+        )
+    );
+    WITH to_keep AS (
+       SELECT MIN(id) AS id
+       FROM buildings_without_inner_buildings
+       GROUP BY geom
+    )
+    DELETE FROM buildings_without_inner_buildings
+    WHERE id NOT IN (
+        SELECT id
+        FROM to_keep
+    );
+'''
+
+cleanup_anti_join = '''
+    DROP TABLE IF EXISTS buildings_without_inner_buildings;
+    CREATE TEMP TABLE buildings_without_inner_buildings AS (
+        SELECT  ROW_NUMBER() OVER() AS id,
+                geom,
+                MD5(ST_AsBinary(geom)) AS geom_hash
+        FROM buildings_splitted a
+        WHERE NOT EXISTS (
+            SELECT 1
+            FROM buildings_splitted b
+            WHERE b.geom ~ a.geom
+              AND b.id <> a.id
+              AND ST_Contains(b.geom, a.geom)
+        )
+    );
+    CREATE INDEX ON buildings_without_inner_buildings USING hash(geom_hash);
+    DELETE FROM buildings_without_inner_buildings a
+    WHERE EXISTS (
+        SELECT 1
+        FROM buildings_without_inner_buildings b
+        WHERE b.geom_hash = a.geom_hash
+          AND b.id < a.id
+          AND b.geom = a.geom
+    );
+'''
+
+
+def main() -> None:
+    with db.session() as connection:
+        for side in grid_sizes:
+            db.execute_statement(synthetic_buildings(side), connection)
+            num_buildings = int(db.sql_to_float('SELECT COUNT(1) FROM buildings_splitted', connection))
+            results = []
+            for name, query in [('NOT IN', cleanup_not_in), ('anti-join', cleanup_anti_join)]:
+                start = time.perf_counter()
+                db.execute_statement(query, connection)
+                runtime = time.perf_counter() - start
+                remaining = int(db.sql_to_float('SELECT COUNT(1) FROM buildings_without_inner_buildings', connection))
+                results.append(remaining)
+                print(f'{num_buildings} buildings, {name}: {runtime:.3f} s ({remaining} buildings remaining)')
+            if results[0] != results[1]:
+                raise ValueError('Both implementations must remove the same buildings')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+ |---------------------------------------------------------------------------------------------------------------------|
+ | Benchmark for startup time: commands that do not need PyTorch, scikit-learn or the DB must start quickly
+ |---------------------------------------------------------------------------------------------------------------------|
+"""
+
+import subprocess
+import sys
+import time
+
+# Maximum startup time in seconds
+threshold = 1.0
+# Modules that must not be imported at startup
+heavy_modules = ['torch', 'torch_geometric', 'sklearn', 'pandas', 'sqlalchemy']
+
+commands = [
+    [sys.executable, 'main.py', '--help'],
+    [sys.executable, 'main.py', 'check-config', 'gcn'],
+    [sys.executable, '-c', 'import sample.db_interaction, sample.dataset.create_dataset'],
+]
+
+
+def measure(command, repetitions=5):
+    """
+    Measure the runtime of a command (best of several repetitions)
+    :param command: command as list
+    :param repetitions: number of repetitions
+    :return: runtime in seconds
+    """
+    runtimes = []
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+        runtimes.append(time.perf_counter() - start)
+    return min(runtimes)
+
+
+def imported_heavy_modules():
+    """
+    :return: heavy modules that are imported by the entry points
+    """
+    script = ('import sys, main, sample.db_interaction, sample.dataset.create_dataset, '
+              'sample.training.train_classifier; '
+              f'print(",".join(m for m in {heavy_modules} if m in sys.modules))')
+    output = subprocess.run([sys.executable, '-c', script], check=True, capture_output=True, text=True).stdout
+    return [module for module in output.strip().split(',') if module]
+
+
+def main() -> None:
+    failed = False
+    for command in commands:
+        runtime = measure(command)
+        print(f'{" ".join(command[1:])}: {runtime:.3f} s')
+        failed |= runtime > threshold
+    modules = imported_heavy_modules()
+    if modules:
+        print(f'Imported at startup: {", ".join(modules)}')
+        failed = True
+    if failed:
+        print(f'Startup is too slow (threshold: {threshold} s)')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+ |---------------------------------------------------------------------------------------------------------------------|
+ | Benchmark for the shared walls: intersections of buffered exterior rings in PL/pgSQL vs. segment matching
+ | (Shapely/NumPy). The number of touching buildings must be the same. The shared wall lengths differ by the rounded
+ | corners of the buffered rings, which segment matching does not count.
+ | `synthetic` measures the segment matching alone on generated rows of terraced houses (no DB needed). Recorded:
+ | 1,000,000 houses with 36 segments each in 194 s (2 processes on a single core, peak memory below 4 GB).
+ |---------------------------------------------------------------------------------------------------------------------|
+"""
+
+import sys
+import time
+
+import numpy as np
+import shapely
+
+import sample.db_interaction as db
+import sample.dataset.create_dataset as cd
+import sample.dataset.sql_queries.sql_create_dataset as sqlds
+import sample.dataset.engines.shared_walls as sw
+
+# Extract in Northern Munich
+x_min, x_max, y_min, y_max = 11.4951, 11.6949, 48.1166, 48.2763
+type = 'circ'
+subsample_fraction = 0.004
+buildings_in_graph = 20
+
+features_query = '''
+    SELECT id, shared_wall_length, count_touches
+    FROM building_level_features_interacting_blocks
+    ORDER BY id
+'''
+
+# Terraced houses for `synthetic`: width and depth of a house, houses per row, gap between rows (in meters) and
+# maximum length of the wall segments (detailed footprints have many vertices)
+house_width, house_depth, houses_per_row, row_gap, segment_length = 8, 10, 20, 6, 1.0
+
+
+def main() -> None:
+    cd.create_functions()
+    stages = sqlds.computation_stages(subsample_fraction, 4, buildings_in_graph, type, x_min, x_max, y_min, y_max)
+    stages = stages[:[name for name, _ in stages].index('features_prepare') + 1]
+    with db.session() as connection:
+        for _, statement in stages:
+            db.execute_statement(statement, connection)
+        num_buildings = int(db.sql_to_float('SELECT COUNT(1) FROM buildings_with_features', connection))
+
+        start = time.perf_counter()
+        db.execute_statement('SELECT public.block_level(true);', connection)
+        sql_runtime = time.perf_counter() - start
+        sql_features = db.sql_to_df(features_query, connection)
+
+        start = time.perf_counter()
+        sw.shared_walls(connection)
+        python_runtime = time.perf_counter() - start
+        python_features = db.sql_to_df(features_query, connection)
+    cd.drop_functions()
+
+    print(f'{num_buildings} buildings, SQL: {sql_runtime:.3f} s (including blocks), Python: {python_runtime:.3f} s')
+    if not np.array_equal(sql_features['id'], python_features['id']):
+        raise ValueError('Both engines must compute features for the same buildings')
+    touches = np.sum(sql_features['count_touches'].to_numpy() != python_features['count_touches'].to_numpy())
+    print(f'count_touches: {touches} of {num_buildings} buildings differ')
+    if touches:
+        raise ValueError('Both methods must find the same touching buildings')
+    difference = sql_features['shared_wall_length'].to_numpy() - python_features['shared_wall_length'].to_numpy()
+    print(f'shared_wall_length: mean difference {np.mean(difference):.3f} m, '
+          f'maximum difference {np.max(np.abs(difference)):.3f} m')
+
+
+def synthetic_buildings(num_buildings):
+    """
+    :param num_buildings: number of houses
+    :return: IDs, geometries (WKB)
+    """
+    index = np.arange(num_buildings)
+    rows_per_line = int(np.ceil(np.sqrt(num_buildings / houses_per_row)))
+    row, house = index // houses_per_row, index % houses_per_row
+    x = (row % rows_per_line) * (houses_per_row * house_width + row_gap) + house * house_width
+    y = (row // rows_per_line) * (house_depth + row_gap)
+    geoms = shapely.segmentize(shapely.box(x, y, x + house_width, y + house_depth), segment_length)
+    return index + 1, np.array(shapely.to_wkb(geoms), dtype=object)
+
+
+def synthetic(num_buildings=1000000, num_processes=4):
+    ids, wkb = synthetic_buildings(num_buildings)
+    start = time.perf_counter()
+    features = sw.compute_features(ids, wkb, ids, wkb, num_processes)
+    runtime = time.perf_counter() - start
+    # Every house shares its side walls with its neighbours in the row
+    expected = np.where(np.isin(ids % houses_per_row, [0, 1]), house_depth, 2 * house_depth)
+    difference = np.max(np.abs(features['shared_wall_length'] - expected))
+    print(f'{num_buildings} buildings, {num_processes} processes: {runtime:.1f} s, '
+          f'maximum difference {difference:.2e} m')
+    if difference > 1e-6:
+        raise ValueError('Wrong shared wall length')
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['synthetic']:
+        synthetic()
+    else:
+        main()
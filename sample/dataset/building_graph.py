@@ -0,0 +1,126 @@
+"""
+ |---------------------------------------------------------------------------------------------------------------------|
+ | Global building graph of a region, computed once and stored as NumPy files (memory-mapped when loaded).
+ | Node features of all buildings and the Delaunay edges as CSR adjacency. Subgraphs of both types can be created from
+ | it without the DB (see `sample.dataset.subgraph_generator`).
+ |---------------------------------------------------------------------------------------------------------------------|
+"""
+
+import os
+import functools
+
+import numpy as np
+
+import sample.db_interaction as db
+import sample.dataset.preprocessing as pp
+import sample.dataset.copy_export as ce
+import sample.dataset.create_dataset as cd
+import sample.dataset.engines.n_hop as nh
+import sample.dataset.sql_queries.sql_create_dataset as sqlds
+import sample.util.feature_names as fn
+
+# Files of the graph: one array each
+arrays = ['x', 'y', 'points', 'osm_id', 'lon', 'lat', 'id', 'pointer', 'neighbors', 'distance']
+
+
+def export_graph(connection, path):
+    """
+    Write the features of all buildings and the Delaunay edges into NumPy files. The feature matrix is written directly
+    into a memory-mapped file, so it does not have to fit into RAM.
+    :param connection: connection of the session with the TEMP tables of the pipeline
+    :param path: folder of the graph
+    """
+    os.makedirs(path, exist_ok=True)
+    num_nodes = int(db.sql_to_float('SELECT COUNT(1) FROM node_features_with_labels', connection))
+    numerical_columns = fn.feature_groups_names['Building-level features'] \
+                        + fn.feature_groups_names['Block-level features'] \
+                        + fn.feature_groups_names['UA coverage']
+    categorical_columns = [('land_cover_ua_clc', 'Land cover indicators'),
+                           ('degurba', 'Urbanization indicators'),
+                           ('country', 'Country indicators')]
+    num_features = len(numerical_columns) + sum(len(fn.feature_groups_names[group])
+                                                for _, group in categorical_columns)
+    x = np.lib.format.open_memmap(os.path.join(path, 'x.npy'), mode='w+', dtype=np.float32,
+                                  shape=(num_nodes, num_features))
+    x[:] = 0
+    # Same feature matrix as in `GNNDataset`
+    select = [f"COALESCE({column}::DOUBLE PRECISION, 'NaN') AS {column}" for column in numerical_columns]
+    columns = [(column, 'float8', x[:, i]) for i, column in enumerate(numerical_columns)]
+    for column, group in categorical_columns:
+        categories = ', '.join(f"'{category}'" for category in fn.feature_groups_names[group])
+        select.append(f'COALESCE(ARRAY_POSITION(ARRAY[{categories}], {column}::TEXT) - 1, -1)::SMALLINT AS {column}')
+        columns.append((column, 'int2', np.int16))
+    select += ['osm_id::BIGINT AS osm_id', 'lon', 'lat', 'numerical_label::BIGINT AS y', 'id::INTEGER AS id',
+               'ST_X(ST_Centroid(geom)) AS point_x', 'ST_Y(ST_Centroid(geom)) AS point_y',
+               'ROW_NUMBER() OVER (ORDER BY id) - 1 AS row']
+    columns += [('osm_id', 'int8', np.int64), ('lon', 'float8', np.float32), ('lat', 'float8', np.float32),
+                ('y', 'int8', np.int64), ('id', 'int4', np.int64), ('point_x', 'float8', np.float64),
+                ('point_y', 'float8', np.float64), ('row', 'int8', np.int64)]
+    nodes = ce.copy_to_columns(f'SELECT {", ".join(select)} FROM node_features_with_labels', columns, num_nodes,
+                               index='row', connection=connection)
+    offset = len(numerical_columns)
+    for column, group in categorical_columns:
+        pp.one_hot_encoding_array(x, nodes.pop(column).astype(np.int64), offset, group)
+        offset += len(fn.feature_groups_names[group])
+    # Statistics over all buildings (each once), written to `scaling_parameters/graph.json`
+    pp.scale_node_features_array(x, 'graph')
+    x.flush()
+    nodes['points'] = np.column_stack([nodes.pop('point_x'), nodes.pop('point_y')])
+    del nodes['row']
+    # Delaunay edges between buildings with features, as node indices (the rows are sorted by ID)
+    num_edges = int(db.sql_to_float('SELECT COUNT(1) FROM delaunay', connection))
+    edges = ce.copy_to_columns('SELECT start_id, end_id, distance FROM delaunay',
+                               [('start_id', 'int4', np.int64), ('end_id', 'int4', np.int64),
+                                ('distance', 'float8', np.float64)], num_edges, connection=connection)
+    start = np.searchsorted(nodes['id'], edges['start_id'])
+    end = np.searchsorted(nodes['id'], edges['end_id'])
+    known = (start < num_nodes) & (end < num_nodes)
+    known[known] = (nodes['id'][start[known]] == edges['start_id'][known]) \
+                   & (nodes['id'][end[known]] == edges['end_id'][known])
+    nodes['pointer'], nodes['neighbors'], nodes['distance'] = nh.csr_adjacency(start[known], end[known],
+                                                                               edges['distance'][known], num_nodes)
+    for name, values in nodes.items():
+        np.save(os.path.join(path, f'{name}.npy'), values)
+
+
+def create_building_graph(x_min, x_max, y_min, y_max, path, session_settings=None, engines=None, num_processes=4):
+    """
+    Compute the features of all buildings of the extract and the Delaunay triangulation of their centroids once
+    :param x_min, x_max, y_min, y_max: coordinates of the extract (EPSG:4326)
+    :param path: folder of the graph
+    :param session_settings: settings for the DB session, ex. {'work_mem': '1GB'}
+    :param engines: engine per stage, ex. {'building_level': 'python'} (see `cd.apply_engines`)
+    :param num_processes: number of worker processes of the Python engines
+    """
+    cd.create_functions()
+    db.execute_statement(sqlds.create_building_store)
+    db.execute_statement(sqlds.create_land_use_reference)
+    # Pipeline of the n_hop method without centers: the subgraph expansion is replaced by all buildings as nodes
+    engines = {**(engines or {}), 'n_hop': 'sql', 'hops': 'sql'}
+    stages = sqlds.computation_stages(0, 0, 0, 'n_hop', x_min, x_max, y_min, y_max,
+                                      {**cd.in_db(engines), 'n_hop': False})
+    names = [name for name, _ in stages]
+    stages.insert(names.index('create_subgraphs') + 1, ('graph_nodes', sqlds.building_graph_nodes))
+    stages[-1] = ('export_graph', functools.partial(export_graph, path=path))
+    cd.run_stages(cd.apply_engines(stages, 'n_hop', engines, num_processes), session_settings)
+    cd.drop_functions()
+
+
+def load_arrays(path):
+    """
+    :param path: folder of the graph
+    :return: dict with one memory-mapped array per file
+    """
+    return {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r') for name in arrays}
+
+
+def load_building_graph(path):
+    """
+    :param path: folder of the graph
+    :return: building graph for the subgraph generator (see `sample.dataset.subgraph_generator`)
+    """
+    # PyTorch is only imported when subgraphs are created
+    import sample.dataset.subgraph_generator as sg
+    graph = load_arrays(path)
+    return sg.BuildingGraph(graph['x'], graph['y'], graph['points'],
+                            adjacency=(graph['pointer'], graph['neighbors'], graph['distance']))
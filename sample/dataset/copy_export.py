@@ -0,0 +1,108 @@
+"""
+ |---------------------------------------------------------------------------------------------------------------------|
+ | Export tables from DB with COPY (binary format) directly into NumPy arrays
+ |---------------------------------------------------------------------------------------------------------------------|
+"""
+
+import numpy as np
+
+import sample.db_interaction as db
+
+# Types of columns in the binary COPY format (big-endian) that can be exported
+wire_types = {'float8': '>f8', 'float4': '>f4', 'int8': '>i8', 'int4': '>i4', 'int2': '>i2', 'bool': '?'}
+
+copy_signature = b'PGCOPY\n\xff\r\n\x00'
+
+
+class BinaryCopyReader:
+    """
+    File-like object that parses the binary COPY stream chunk by chunk.
+    All columns have a fixed width and are not NULL, so every row has the same size and a chunk of rows can be
+    interpreted as a structured NumPy array without creating Python objects for the rows.
+    """
+    def __init__(self, columns, consume):
+        """
+        :param columns: list of (name, wire type)
+        :param consume: function that is called with every parsed chunk of rows (structured array)
+        """
+        fields = [('field_count', '>i2')]
+        for name, wire_type in columns:
+            fields.append((f'{name}_length', '>i4'))
+            fields.append((name, wire_types[wire_type]))
+        self.dtype = np.dtype(fields)
+        self.columns = columns
+        self.consume = consume
+        self.buffer = bytearray()
+        self.header_done = False
+
+    def write(self, data):
+        self.buffer += data
+        if not self.header_done:
+            # Signature, flags and length of header extension
+            if len(self.buffer) < 19:
+                return
+            if bytes(self.buffer[:11]) != copy_signature:
+                raise ValueError('Stream is not in binary COPY format')
+            extension_length = int.from_bytes(self.buffer[15:19], 'big')
+            if len(self.buffer) < 19 + extension_length:
+                return
+            del self.buffer[:19 + extension_length]
+            self.header_done = True
+        # A (possible) trailer has only 2 bytes, so it is never taken as a complete row
+        num_rows = len(self.buffer) // self.dtype.itemsize
+        if num_rows == 0:
+            return
+        rows = np.frombuffer(bytes(self.buffer[:num_rows * self.dtype.itemsize]), dtype=self.dtype)
+        del self.buffer[:num_rows * self.dtype.itemsize]
+        if np.any(rows['field_count'] != len(self.columns)):
+            raise ValueError('Unexpected number of columns in COPY stream')
+        for name, wire_type in self.columns:
+            if np.any(rows[f'{name}_length'] != np.dtype(wire_types[wire_type]).itemsize):
+                raise ValueError(f'Column {name} contains NULL values or has a different type than {wire_type}')
+        self.consume(rows)
+
+    def close(self):
+        if bytes(self.buffer) != b'\xff\xff':
+            raise ValueError('COPY stream ended unexpectedly')
+
+
+def copy_to_columns(query, columns, num_rows, index=None, connection=None, chunk_size=1 << 20):
+    """
+    Stream the result of a query with COPY into preallocated NumPy arrays with the target data types.
+    Peak memory is the size of the output arrays plus one chunk.
+    :param query: SELECT statement. All columns must be NOT NULL and have the given (fixed-width) types. Nullable
+    columns are wrapped in COALESCE (ex. `COALESCE(column, 'NaN')` for float columns).
+    :param columns: list of (name, wire type, target), ex. ('distance', 'float8', np.float32). The target is either a
+    dtype (a new array is allocated) or a preallocated array of length `num_rows` (ex. a column of the feature matrix).
+    :param num_rows: number of rows in the result
+    :param index: name of a column with the position of every row in the output arrays (ex. a sequential ID).
+    If not set, the rows are stored in the order in which they are returned.
+    :param connection: connection of a session (see `db.session`)
+    :param chunk_size: number of bytes read from the DB at once
+    :return: dict with one array per column
+    """
+    output = {name: target if isinstance(target, np.ndarray) else np.empty(num_rows, dtype=target)
+              for name, _, target in columns}
+    position = 0
+
+    def consume(rows):
+        nonlocal position
+        if index is None:
+            target = slice(position, position + len(rows))
+        else:
+            target = rows[index]
+        for name, _, _ in columns:
+            output[name][target] = rows[name]
+        position += len(rows)
+
+    reader = BinaryCopyReader([(name, wire_type) for name, wire_type, _ in columns], consume)
+    statement = f'COPY ({query}) TO STDOUT (FORMAT binary)'
+    if connection is None:
+        with db.session() as connection:
+            connection.connection.cursor().copy_expert(statement, reader, size=chunk_size)
+    else:
+        connection.connection.cursor().copy_expert(statement, reader, size=chunk_size)
+    reader.close()
+    if position != num_rows:
+        raise ValueError(f'Expected {num_rows} rows, but received {position}')
+    return output
@@ -5,7 +5,10 @@
 """
 
 import time
+import hashlib
 import datetime as dt
+import functools
+import concurrent.futures
 
 import sample.db_interaction as db
 import sample.dataset.functions.extract_buildings as ex
@@ -16,10 +19,13 @@ import sample.dataset.functions.features_fun.block_level as bc
 import sample.dataset.functions.features_fun.land_use as lu
 import sample.dataset.functions.features_fun.degurba as dg
 import sample.dataset.functions.drop_temp_tables as dr
+import sample.dataset.functions.telemetry as tm
 import sample.dataset.sql_queries.sql_create_dataset as sqlds
+import sample.dataset.telemetry as tl
 
 
 def create_functions():
+    tm.telemetry()
     ex.extract_buildings()
     cs.create_subgraphs()
     fe.features()
@@ -38,19 +44,259 @@ def create_tables(type):
     """
     Tables were results from all regions are aggregated
     """
+    db.execute_statement(sqlds.create_building_store)
+    db.execute_statement(sqlds.create_land_use_reference)
     if type == 'n_hop':
         db.execute_statement(sqlds.create_tables_n_hop)
     elif type == 'circ':
         db.execute_statement(sqlds.create_tables_circ)
 
 
-def create_dataset(type, subsample_fraction, num_layers, buildings_in_graph, x_min, x_max, y_min, y_max):
+# Engines that can replace stages of the pipeline. 'sql' runs the stage in the DB.
+default_engines = {'building_level': 'sql', 'delaunay': 'sql', 'n_hop': 'sql', 'hops': 'sql', 'blocks': 'sql',
+                   'shared_walls': 'sql', 'land_use': 'sql', 'rasters': 'sql'}
+
+
+def apply_engines(stages, type, engines=None, num_processes=4, modes=None, num_layers=None):
+    """
+    Replace stages of the pipeline by computations outside of the DB
+    :param stages: list of (stage name, statement)
+    :param type: localized subgraph generation method
+    :param engines: engine per stage, ex. {'building_level': 'python'}
+    :param num_processes: number of worker processes of the Python engines
+    :param modes: methods used to create the subgraphs (see `sqlds.default_modes`)
+    :param num_layers: number of hops of the n-hop subgraphs
+    :return: list of (stage name, statement or function that is called with the connection of the session)
+    """
+    engines = {**default_engines, **(engines or {})}
+    for name, engine in engines.items():
+        if engine not in ['sql', 'python']:
+            raise ValueError(f'Unknown engine for {name}: {engine}')
+    if engines['building_level'] == 'python':
+        # Import on first use, the engine depends on Shapely
+        import sample.dataset.engines.building_level as blp
+        stages = [(name, functools.partial(blp.building_level, num_processes=num_processes,
+                                           interacting=engines['shared_walls'] == 'sql'))
+                  if name == 'building_level' else (name, statement)
+                  for name, statement in stages]
+    if engines['land_use'] == 'python':
+        import sample.dataset.engines.land_use as lue
+        stages = [(name, functools.partial(lue.land_use, num_processes=num_processes,
+                                           clc_in_db=engines['rasters'] == 'sql'))
+                  if name == 'land_use' else (name, statement)
+                  for name, statement in stages]
+    if engines['delaunay'] == 'python':
+        import sample.dataset.engines.delaunay as dl
+        names = [name for name, _ in stages]
+        if type == 'n_hop':
+            # The subgraphs are created on the triangulation of all buildings
+            stages.insert(names.index('create_subgraphs'), ('delaunay', dl.delaunay_n_hop))
+        else:
+            # The edges are created for the nodes of every subgraph
+            global_triangulation = {**sqlds.default_modes, **(modes or {})}['circ_triangulation'] == 'global'
+            stages.insert(names.index('create_subgraphs') + 1,
+                          ('delaunay', functools.partial(dl.delaunay_circ, global_triangulation=global_triangulation,
+                                                         num_processes=num_processes)))
+    if engines['n_hop'] == 'python':
+        if type != 'n_hop':
+            raise ValueError(f'The n_hop engine requires n_hop subgraphs, not {type}')
+        import sample.dataset.engines.n_hop as nh
+        names = [name for name, _ in stages]
+        stages.insert(names.index('create_subgraphs') + 1, ('n_hop', functools.partial(nh.subgraphs, n=num_layers)))
+    if engines['blocks'] == 'python':
+        import sample.dataset.engines.blocks as bk
+        names = [name for name, _ in stages]
+        stages.insert(names.index('block_level'), ('blocks', bk.blocks))
+    if engines['shared_walls'] == 'python':
+        import sample.dataset.engines.shared_walls as sw
+        names = [name for name, _ in stages]
+        stages.insert(names.index('block_level'),
+                      ('shared_walls', functools.partial(sw.shared_walls, num_processes=num_processes)))
+    if engines['rasters'] == 'python':
+        import sample.dataset.rasters as rs
+        names = [name for name, _ in stages]
+        stages.insert(names.index('land_use'), ('rasters', rs.lookup_tables))
+    if engines['hops'] == 'python' and type != 'circ':
+        # The hops of n-hop subgraphs are part of their expansion
+        raise ValueError(f'The hops engine requires circ subgraphs, not {type}')
+    return stages
+
+
+def in_db(engines=None):
+    """
+    Stages that are computed in the DB (as part of other stages) unless they are computed outside
+    :return: dict with one flag per engine
+    """
+    return {name: engine == 'sql' for name, engine in {**default_engines, **(engines or {})}.items()}
+
+
+def run_key(params):
+    """
+    Identifier of a run for checkpoints (digest of its parameters, valid as prefix of table names)
+    """
+    return 'run_' + hashlib.md5(params.encode()).hexdigest()[:16]
+
+
+def run_stages(stages, session_settings=None, telemetry=None, run=None, checkpoint=None):
+    """
+    Execute the stages of the pipeline one after another within one DB session
+    :param stages: list of (stage name, statement or function that is called with the connection of the session)
+    :param session_settings: settings for the DB session, ex. {'work_mem': '1GB'}
+    :param telemetry: collector for the runtime and progress of the stages (see `sample.dataset.telemetry`)
+    :param run: identifier of the run in the telemetry (ex. tile ID)
+    :param checkpoint: key of the run (see `run_key`) to store the output of every stage. Stages that were completed
+    in a previous (interrupted) run with the same key are skipped, the run resumes at the first missing stage.
+    """
+    telemetry = telemetry or tl.Telemetry(num_stages=len(stages))
+    with db.session(session_settings) as connection, telemetry.attach(connection):
+        completed = set()
+        if checkpoint is not None:
+            db.execute_statement(sqlds.create_checkpoint_tables, connection)
+            completed = set(db.sql_to_df(sqlds.completed_stages(checkpoint), connection)['stage'])
+        # Resume after the last stage for which all previous stages were completed as well. The last stage stores the
+        # results (in tables that are recreated for every run), so it is always executed.
+        names = [name for name, _ in stages]
+        resume = next((i for i, name in enumerate(names[:-1]) if name not in completed), len(stages) - 1)
+        if resume > 0:
+            print(f'Resume {run if run is not None else "run"} after stage {names[resume - 1]}')
+            for name in names[:resume]:
+                tables = sqlds.checkpoint_tables.get(name, [])
+                if not tables:
+                    continue
+                stored = db.sql_to_df(sqlds.existing_tables([f'{checkpoint}_{table}' for table in tables],
+                                                            'checkpoint'), connection)['name']
+                tables = [table for table in tables if f'checkpoint.{checkpoint}_{table}' in set(stored)]
+                db.execute_statement(sqlds.restore_checkpoint(checkpoint, tables), connection)
+        for name, statement in stages[resume:]:
+            with telemetry.stage(name, run):
+                if callable(statement):
+                    statement(connection)
+                else:
+                    db.execute_statement(statement, connection)
+            if checkpoint is not None and name != names[-1]:
+                tables = sqlds.checkpoint_tables.get(name, [])
+                tables = list(db.sql_to_df(sqlds.existing_tables(tables), connection)['name']) if tables else []
+                db.execute_statement(sqlds.save_checkpoint(checkpoint, name, tables), connection)
+        # The results are stored, checkpoints are not needed anymore
+        if checkpoint is not None:
+            db.execute_statement(sqlds.drop_checkpoint(checkpoint), connection)
+
+
+def create_dataset(type, subsample_fraction, num_layers, buildings_in_graph, x_min, x_max, y_min, y_max,
+                   session_settings=None, engines=None, num_processes=4, telemetry_path=None, checkpoint=False,
+                   modes=None):
+    """
+    :param engines: engine per stage, ex. {'building_level': 'python'} (see `apply_engines`)
+    :param num_processes: number of worker processes of the Python engines
+    :param telemetry_path: path of the JSON report with runtimes and progress of the stages
+    :param checkpoint: store the output of every stage, such that an interrupted run with the same parameters resumes
+    after the last completed stage
+    :param modes: methods used to create the subgraphs, ex. {'circ_radius': 'knn'} (see `sqlds.default_modes`)
+    """
     # Create functions
     create_functions()
     # Create tables
     create_tables(type)
     # Perform computations
-    db.execute_statement(sqlds.perform_computations(subsample_fraction, num_layers, buildings_in_graph, type,
-                                                    x_min, x_max, y_min, y_max))
+    stages = sqlds.computation_stages(subsample_fraction, num_layers, buildings_in_graph, type,
+                                      x_min, x_max, y_min, y_max, in_db(engines), modes)
+    telemetry = tl.Telemetry(telemetry_path, num_stages=len(stages))
+    params = f'{type},{subsample_fraction},{num_layers},{buildings_in_graph},{x_min},{x_max},{y_min},{y_max},' \
+             f'{sqlds.modes_key(modes)}'
+    run_stages(apply_engines(stages, type, engines, num_processes, modes, num_layers), session_settings, telemetry,
+               checkpoint=run_key(params) if checkpoint else None)
+    telemetry.save()
     drop_functions()
 
+
+def split_extent(x_min, x_max, y_min, y_max, tiles_x, tiles_y):
+    """
+    Split the rectangular extract into a regular grid of tiles
+    :param x_min, x_max, y_min, y_max: coordinates of the extract (EPSG:4326)
+    :param tiles_x: number of tiles in x-direction
+    :param tiles_y: number of tiles in y-direction
+    :return: list of tiles (x_min, x_max, y_min, y_max)
+    """
+    # The extract is projected to EPSG:3035 for the computations, so buildings at its border can have centroids
+    # slightly outside the original coordinates. Extend outer tiles, such that every building belongs to one tile.
+    border = 1.0
+    xs = [x_min + (x_max - x_min) * i / tiles_x for i in range(tiles_x + 1)]
+    ys = [y_min + (y_max - y_min) * j / tiles_y for j in range(tiles_y + 1)]
+    xs[0], xs[-1] = xs[0] - border, xs[-1] + border
+    ys[0], ys[-1] = ys[0] - border, ys[-1] + border
+    return [(xs[i], xs[i + 1], ys[j], ys[j + 1]) for j in range(tiles_y) for i in range(tiles_x)]
+
+
+def create_dataset_tiled(type, subsample_fraction, num_layers, buildings_in_graph, x_min, x_max, y_min, y_max,
+                         tiles_x, tiles_y, halo, num_workers, session_settings=None, incremental=False,
+                         engines=None, num_processes=4, telemetry_path=None, checkpoint=False, modes=None):
+    """
+    Create the dataset tile by tile. Every tile is computed on its own DB connection (in parallel).
+    The buildings of a tile are extracted together with a halo around the tile, such that subgraphs and features of
+    buildings at the tile border are the same as in a single run over the whole extract.
+    :param tiles_x: number of tiles in x-direction
+    :param tiles_y: number of tiles in y-direction
+    :param halo: width of the halo around a tile (in meters)
+    :param num_workers: number of tiles that are computed at the same time
+    :param session_settings: settings for the DB session of every worker, ex. {'work_mem': '1GB'}
+    :param incremental: keep the results of every tile. In the next run with the same parameters, only tiles whose
+    OSM buildings changed (including the halo) are recomputed.
+    :param engines: engine per stage, ex. {'building_level': 'python'} (see `apply_engines`)
+    :param num_processes: number of worker processes of the Python engines (per tile)
+    :param telemetry_path: path of the JSON report with runtimes and progress of the stages of all tiles
+    :param checkpoint: store the output of every stage of every tile. An interrupted run with the same parameters
+    keeps the completed tiles and resumes the other tiles after their last completed stage.
+    :param modes: methods used to create the subgraphs, ex. {'circ_radius': 'knn'} (see `sqlds.default_modes`)
+    """
+    params = f'{type},{subsample_fraction},{num_layers},{buildings_in_graph},{x_min},{x_max},{y_min},{y_max},' \
+             f'{tiles_x},{tiles_y},{halo},{sqlds.modes_key(modes)}'
+    tiles = split_extent(x_min, x_max, y_min, y_max, tiles_x, tiles_y)
+    # One pooled connection per worker (and one per partition of the land use engine)
+    db.configure_pool(num_workers if in_db(engines)['land_use'] else num_workers * (num_processes + 1))
+    # Create functions
+    create_functions()
+    # Create tables
+    create_tables(type)
+    # Results of tiles from the previous run can only be reused if they were computed with the same parameters
+    stored_digests = {}
+    if (incremental or checkpoint) and db.sql_to_bool(sqlds.tile_tables_exist(type)):
+        state = db.sql_to_df(sqlds.tile_state(type))
+        if (state['params'] == params).all():
+            stored_digests = dict(zip(state['tile_id'], state['digest']))
+    if not stored_digests:
+        db.execute_statement(sqlds.create_tile_tables(type))
+    # Stable building IDs for all tiles
+    db.execute_statement(f'SELECT public.update_building_store({x_min}, {x_max}, {y_min}, {y_max})')
+    start = time.time()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=num_workers) as executor:
+        # Digest of the input data of every tile
+        digests = list(executor.map(lambda tile: db.sql_to_string(sqlds.tile_digest(x_min, x_max, y_min, y_max,
+                                                                                     *tile, halo)),
+                                    tiles))
+        tile_ids = [tile_id for tile_id in range(len(tiles)) if stored_digests.get(tile_id) != digests[tile_id]]
+        print(f'{len(tile_ids)}/{len(tiles)} tiles have to be computed')
+        # Perform computations for every tile
+        tile_stages = {tile_id: apply_engines(sqlds.computation_stages_tile(subsample_fraction, num_layers,
+                                                                            buildings_in_graph, type, x_min, x_max,
+                                                                            y_min, y_max, tile_id, *tiles[tile_id],
+                                                                            halo, params, digests[tile_id],
+                                                                            in_db(engines), modes),
+                                              type, engines, num_processes, modes, num_layers)
+                       for tile_id in tile_ids}
+        telemetry = tl.Telemetry(telemetry_path, len(tile_ids), len(next(iter(tile_stages.values()), [])))
+        futures = [executor.submit(run_stages, stages, session_settings, telemetry, tile_id,
+                                   run_key(f'{params},{tile_id},{digests[tile_id]}') if checkpoint else None)
+                   for tile_id, stages in tile_stages.items()]
+        for i, future in enumerate(concurrent.futures.as_completed(futures)):
+            future.result()
+            print(f'Tile {i + 1}/{len(tile_ids)} done ({dt.timedelta(seconds=round(time.time() - start))}), '
+                  f'ETA: {telemetry.eta()}')
+        telemetry.save()
+    # Merge results of all tiles
+    if type == 'n_hop':
+        db.execute_statement(sqlds.merge_tiles_n_hop)
+    elif type == 'circ':
+        db.execute_statement(sqlds.merge_tiles_circ)
+    if not incremental:
+        db.execute_statement(sqlds.drop_tile_tables(type))
+    drop_functions()
@@ -1,8 +1,11 @@
 import sample.dataset.create_dataset as cd
-import sample.dataset.gnn_dataset as gnn
 
 
-def main() -> None:
+def main(export_only=False) -> None:
+    """
+    Create the dataset tables in the DB and export them as PyG dataset
+    :param export_only: only export tables that were created before
+    """
     # Localized subgraphs generation method
     type = 'circ'
     # Fraction of labeled buildings that are used as center nodes for subgraphs
@@ -13,8 +16,42 @@ def main() -> None:
     buildings_in_graph = 20
     # Rectangular spatial extract in Europe
     x_min, x_max, y_min, y_max = 11.4951, 11.6949, 48.1166, 48.2763  # Extract in Northern Munich
-    cd.create_dataset(type, subsample_fraction, hops, buildings_in_graph, x_min, x_max, y_min, y_max)
-    gnn.GNNDataset(f'./data/{type}/', type)
+    # Split the extract into tiles_x * tiles_y tiles that are computed in parallel (1, 1: no tiling)
+    tiles_x, tiles_y = 1, 1
+    # Width of the halo around each tile in meters (must cover the subgraphs of buildings at the tile border)
+    halo = 2000
+    # Number of tiles computed at the same time (one DB connection each)
+    num_workers = 4
+    # Keep the results of all tiles, such that the next run only recomputes tiles whose OSM buildings changed
+    incremental = False
+    # Settings of each DB session
+    session_settings = {'work_mem': '256MB', 'max_parallel_workers_per_gather': 2}
+    # Where stages are computed: 'sql' (in the DB) or 'python' (Shapely/NumPy in worker processes)
+    engines = {'building_level': 'sql', 'delaunay': 'sql', 'n_hop': 'sql', 'hops': 'sql', 'blocks': 'sql',
+               'shared_walls': 'sql', 'land_use': 'sql', 'rasters': 'sql'}
+    # Number of worker processes of the Python engines
+    num_processes = 4
+    # Report with runtime and progress of every stage (also used for the ETA of the next run)
+    telemetry_path = f'./data/{type}/telemetry.json'
+    # Store the output of every stage, such that an interrupted run resumes after the last completed stage
+    checkpoint = False
+    # Methods to create the subgraphs (circ_radius: 'loop' or 'knn', circ_triangulation: 'per_center' or 'global',
+    # center_sampling: 'random', 'hash', 'hash_label', 'hash_cell' or 'hash_label_cell')
+    modes = {'circ_radius': 'loop', 'circ_triangulation': 'per_center', 'center_sampling': 'random'}
+    # Storage of the exported circ dataset: 'expanded' (one row per building and subgraph) or 'shared' (one row per
+    # building, subgraphs are materialized per batch)
+    storage = 'expanded'
+    if not export_only:
+        if tiles_x * tiles_y > 1 or incremental:
+            cd.create_dataset_tiled(type, subsample_fraction, hops, buildings_in_graph, x_min, x_max, y_min, y_max,
+                                    tiles_x, tiles_y, halo, num_workers, session_settings, incremental, engines,
+                                    num_processes, telemetry_path, checkpoint, modes)
+        else:
+            cd.create_dataset(type, subsample_fraction, hops, buildings_in_graph, x_min, x_max, y_min, y_max,
+                              session_settings, engines, num_processes, telemetry_path, checkpoint, modes)
+    # PyTorch is only imported when the dataset is exported
+    import sample.dataset.gnn_dataset as gnn
+    gnn.GNNDataset(f'./data/{type}/', type, storage=storage)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,90 @@
+"""
+ |---------------------------------------------------------------------------------------------------------------------|
+ | Blocks (clusters of buildings within 0.35 m of each other) computed outside of the DB: pairs of close buildings
+ | from an STRtree, connected components with union-find in NumPy. Only clusters that contain buildings of the dataset
+ | are computed.
+ |---------------------------------------------------------------------------------------------------------------------|
+"""
+
+import numpy as np
+import pandas as pd
+import shapely
+
+import sample.db_interaction as db
+
+# Distance of buildings in the same block (as in `ST_ClusterWithin` in `public.block_level`)
+block_distance = 0.35
+
+
+def close_pairs(geoms, seeds, distance=block_distance):
+    """
+    All pairs of buildings within the distance that can be reached from the seeds (via other pairs).
+    The STRtree is only queried for buildings that were reached, so the rest of the region is not clustered.
+    :param geoms: all buildings of the region
+    :param seeds: indices of the buildings of the dataset
+    :return: pair indices (a, b), mask of the reached buildings
+    """
+    tree = shapely.STRtree(geoms)
+    reached = np.zeros(len(geoms), dtype=bool)
+    frontier = np.unique(seeds)
+    reached[frontier] = True
+    pairs = []
+    while len(frontier):
+        a, b = tree.query(geoms[frontier], predicate='dwithin', distance=distance)
+        a = frontier[a]
+        pairs.append((a, b))
+        frontier = np.unique(b[~reached[b]])
+        reached[frontier] = True
+    a, b = (np.concatenate(values) for values in zip(*pairs)) if pairs else (np.empty(0, dtype=np.int64),) * 2
+    return a, b, reached
+
+
+def union_find(num_nodes, a, b):
+    """
+    Connected components: every node is hooked to the smallest label of its neighbors, followed by path compression,
+    until no label changes
+    :return: label of every node (smallest node index of its component)
+    """
+    labels = np.arange(num_nodes)
+    while True:
+        previous = labels.copy()
+        np.minimum.at(labels, labels[a], labels[b])
+        np.minimum.at(labels, labels[b], labels[a])
+        # Path compression
+        while True:
+            compressed = labels[labels]
+            if np.array_equal(compressed, labels):
+                break
+            labels = compressed
+        if np.array_equal(labels, previous):
+            return labels
+
+
+def assign_blocks(ids, geoms, dataset_ids):
+    """
+    :param ids: IDs of all buildings of the region
+    :param geoms: geometries of all buildings of the region
+    :param dataset_ids: IDs of the buildings of the dataset
+    :return: IDs of the buildings in blocks of the dataset, block ID of these buildings (smallest building ID)
+    """
+    order = np.argsort(ids)
+    ids, geoms = ids[order], geoms[order]
+    seeds = np.searchsorted(ids, dataset_ids)
+    a, b, reached = close_pairs(geoms, seeds)
+    labels = union_find(len(ids), a, b)
+    return ids[reached], ids[labels[reached]]
+
+
+def blocks(connection):
+    """
+    Replacement for the clustering in `public.block_level`. Reads the buildings of the current session and writes the
+    TEMP table `building_blocks` (id, block_id).
+    :param connection: connection of the session with the TEMP tables of the pipeline
+    """
+    buildings = db.sql_to_df('SELECT id, ST_AsBinary(geom) AS wkb FROM buildings', connection)
+    dataset = db.sql_to_df('SELECT id FROM buildings_with_features', connection)
+    # WKB as Python bytes (fixed-width NumPy strings would strip trailing zero bytes)
+    geoms = shapely.from_wkb(np.array([bytes(wkb) for wkb in buildings['wkb']], dtype=object))
+    ids, block_ids = assign_blocks(buildings['id'].to_numpy(), geoms, dataset['id'].to_numpy())
+    db.df_to_temp_table(pd.DataFrame({'id': ids, 'block_id': block_ids}), 'building_blocks', connection,
+                        {'id': 'INTEGER', 'block_id': 'INTEGER'})
@@ -0,0 +1,165 @@
+"""
+ |---------------------------------------------------------------------------------------------------------------------|
+ | Compute building-level features outside of the DB (vectorized with Shapely/NumPy)
+ |---------------------------------------------------------------------------------------------------------------------|
+"""
+
+import concurrent.futures
+
+import numpy as np
+import shapely
+
+import sample.db_interaction as db
+
+feature_columns = ['footprint_area', 'perimeter', 'phi', 'longest_axis_length', 'elongation', 'convexity',
+                   'orientation', 'corners']
+interacting_columns = ['shared_wall_length', 'count_touches']
+
+# All buildings of the region (set in every worker process, see `init_worker`)
+all_ids = None
+all_geoms = None
+all_tree = None
+
+
+def init_worker(ids, wkb):
+    """
+    Load all buildings of the region into a worker process. They are needed for the shared walls.
+    """
+    global all_ids, all_geoms, all_tree
+    all_ids = ids
+    all_geoms = shapely.from_wkb(wkb)
+    all_tree = shapely.STRtree(all_geoms)
+
+
+def corners(geoms):
+    """
+    Number of corners of the simplified exterior rings (angle between neighbouring segments differs by at least 10
+    degrees from 180 degrees), like `ST_Angle` in `public.building_level`
+    :param geoms: array of polygons
+    :return: array with the number of corners
+    """
+    rings = shapely.get_exterior_ring(shapely.simplify(geoms, 0.25, preserve_topology=False))
+    coords, index = shapely.get_coordinates(rings, return_index=True)
+    # Remove the last point of every ring (same as the first one)
+    keep = np.ones(len(index), dtype=bool)
+    keep[np.flatnonzero(np.diff(index))] = False
+    keep[-1:] = False
+    coords, index = coords[keep], index[keep]
+    # Cyclic predecessor and successor of every point within its ring
+    position = np.arange(len(index))
+    first = np.searchsorted(index, index, side='left')
+    last = np.searchsorted(index, index, side='right') - 1
+    prev_point = coords[np.where(position == first, last, position - 1)]
+    next_point = coords[np.where(position == last, first, position + 1)]
+    to_prev = prev_point - coords
+    to_next = next_point - coords
+    # Points that coincide with a neighbour have no angle
+    valid = np.any(to_prev != 0, axis=1) & np.any(to_next != 0, axis=1)
+    # Clockwise angle from the azimuth of the next point to the azimuth of the previous point
+    angle = np.degrees(np.arctan2(to_prev[:, 0], to_prev[:, 1]) - np.arctan2(to_next[:, 0], to_next[:, 1])) % 360
+    is_corner = valid & ((angle <= 170) | (angle >= 190))
+    return np.bincount(index[is_corner], minlength=len(geoms))
+
+
+def shape_features(geoms):
+    """
+    Shape indicators of the buildings (same definitions as in `public.building_level`)
+    :param geoms: array of polygons
+    :return: dict with one array per feature
+    """
+    convex_hulls = shapely.convex_hull(geoms)
+    footprint_area = shapely.area(geoms)
+    # Sides of the minimum rotated rectangle from its first three corners
+    rectangle = shapely.get_coordinates(shapely.get_exterior_ring(shapely.oriented_envelope(geoms))).reshape(-1, 5, 2)
+    side_1 = rectangle[:, 1] - rectangle[:, 0]
+    side_2 = rectangle[:, 3] - rectangle[:, 0]
+    length_1 = np.hypot(side_1[:, 0], side_1[:, 1])
+    length_2 = np.hypot(side_2[:, 0], side_2[:, 1])
+    longer_side = np.where((length_2 <= length_1)[:, None], side_1, side_2)
+    # The orientation modulo 90 degrees does not depend on the order of the corners
+    azimuth = np.degrees(np.arctan2(longer_side[:, 0], longer_side[:, 1])) % 360
+    with np.errstate(divide='ignore', invalid='ignore'):
+        features = {
+            'footprint_area': footprint_area,
+            'perimeter': shapely.length(geoms),
+            'phi': footprint_area / (shapely.minimum_bounding_radius(geoms) ** 2 * np.pi),
+            'longest_axis_length': shapely.minimum_bounding_radius(convex_hulls) * 2,
+            'elongation': np.minimum(length_1, length_2) / np.maximum(length_1, length_2),
+            'convexity': footprint_area / shapely.area(convex_hulls),
+            'orientation': np.abs((azimuth + 45) % 90 - 45),
+            'corners': corners(geoms).astype(np.float64)
+        }
+    return features
+
+
+def interacting_features(ids, geoms):
+    """
+    Shared wall length and number of touching buildings: intersections of the buffered exterior ring of every building
+    with all other buildings of the region (see `public.block_level`)
+    :param ids: IDs of the buildings
+    :param geoms: array of polygons
+    :return: dict with one array per feature
+    """
+    rings = shapely.boundary(shapely.buffer(geoms, 0.35))
+    ring_index, other_index = all_tree.query(rings, predicate='intersects')
+    other = all_ids[other_index] != ids[ring_index]
+    ring_index, other_index = ring_index[other], other_index[other]
+    lengths = shapely.length(shapely.intersection(rings[ring_index], all_geoms[other_index]))
+    return {
+        'shared_wall_length': np.bincount(ring_index, weights=lengths, minlength=len(geoms)),
+        'count_touches': np.bincount(ring_index, minlength=len(geoms)).astype(np.float64)
+    }
+
+
+def compute_chunk(ids, wkb, interacting=True):
+    geoms = shapely.from_wkb(wkb)
+    if not interacting:
+        return shape_features(geoms)
+    return {**shape_features(geoms), **interacting_features(ids, geoms)}
+
+
+def compute_features(ids, wkb, all_building_ids, all_building_wkb, num_processes=4, chunk_size=10000,
+                     interacting=True):
+    """
+    Compute the building-level features in parallel processes
+    :param ids: IDs of the buildings for which features are computed
+    :param wkb: geometries of these buildings (WKB)
+    :param all_building_ids: IDs of all buildings in the region
+    :param all_building_wkb: geometries of all buildings in the region (WKB)
+    :param num_processes: number of worker processes
+    :param chunk_size: number of buildings per task
+    :param interacting: compute the shared walls and touching buildings?
+    :return: dict with one array per feature (same order as `ids`)
+    """
+    chunks = [slice(start, start + chunk_size) for start in range(0, len(ids), chunk_size)]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=num_processes, initializer=init_worker,
+                                                initargs=(all_building_ids, all_building_wkb)) as executor:
+        results = list(executor.map(compute_chunk, [ids[chunk] for chunk in chunks], [wkb[chunk] for chunk in chunks],
+                                    [interacting] * len(chunks)))
+    columns = feature_columns + interacting_columns if interacting else feature_columns
+    return {column: np.concatenate([result[column] for result in results]) if results else np.empty(0)
+            for column in columns}
+
+
+def building_level(connection, num_processes=4, interacting=True):
+    """
+    Replacement for `public.building_level` (and the shared walls of `public.block_level`). Reads the buildings of the
+    current session and writes the TEMP tables `building_level_features` and
+    `building_level_features_interacting_blocks`.
+    :param connection: connection of the session with the TEMP tables of the pipeline
+    :param num_processes: number of worker processes
+    :param interacting: compute the shared walls and touching buildings? If false, only `building_level_features` is
+    written (the shared walls are computed by another engine, see `sample.dataset.engines.shared_walls`).
+    """
+    dataset = db.sql_to_df('SELECT id, ST_AsBinary(geom) AS wkb FROM buildings_with_features', connection)
+    buildings = db.sql_to_df('SELECT id, ST_AsBinary(geom) AS wkb FROM buildings', connection)
+    # WKB as Python bytes (fixed-width NumPy strings would strip trailing zero bytes)
+    dataset_wkb = np.array([bytes(wkb) for wkb in dataset['wkb']], dtype=object)
+    buildings_wkb = np.array([bytes(wkb) for wkb in buildings['wkb']], dtype=object)
+    features = compute_features(dataset['id'].to_numpy(), dataset_wkb, buildings['id'].to_numpy(), buildings_wkb,
+                                num_processes, interacting=interacting)
+    table = dataset[['id']].assign(**features)
+    db.df_to_temp_table(table[['id'] + feature_columns], 'building_level_features', connection)
+    if interacting:
+        db.df_to_temp_table(table[['id'] + interacting_columns], 'building_level_features_interacting_blocks',
+                            connection)
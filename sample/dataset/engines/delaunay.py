@@ -0,0 +1,138 @@
+"""
+ |---------------------------------------------------------------------------------------------------------------------|
+ | Delaunay edges between building centroids, computed outside of the DB (SciPy). Returns building IDs directly,
+ | instead of matching the segments of `ST_DelaunayTriangles` with the centroids.
+ |---------------------------------------------------------------------------------------------------------------------|
+"""
+
+import concurrent.futures
+
+import numpy as np
+import pandas as pd
+import scipy.spatial
+
+import sample.db_interaction as db
+import sample.dataset.copy_export as ce
+
+# Types of the edge tables in `public.create_subgraphs`
+edge_types = {'start_id': 'INTEGER', 'end_id': 'INTEGER', 'distance': 'DOUBLE PRECISION', 'center_id': 'INTEGER'}
+
+
+def delaunay_edges(ids, points):
+    """
+    Edges of the Delaunay triangulation of the points. Buildings with the same centroid are all connected to the
+    neighbors of this centroid (like the join on the centroids in `public.create_subgraphs`).
+    :param ids: building IDs
+    :param points: centroids, array of shape (n, 2)
+    :return: start IDs, end IDs, distances
+    """
+    unique_points, inverse = np.unique(points, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    if len(unique_points) < 2:
+        return np.empty(0, dtype=ids.dtype), np.empty(0, dtype=ids.dtype), np.empty(0)
+    try:
+        if len(unique_points) < 3:
+            raise scipy.spatial.QhullError('Less than 3 points')
+        simplices = scipy.spatial.Delaunay(unique_points).simplices
+        pairs = np.concatenate([simplices[:, [0, 1]], simplices[:, [1, 2]], simplices[:, [2, 0]]])
+        pairs = np.unique(np.sort(pairs, axis=1), axis=0)
+    except scipy.spatial.QhullError:
+        # Two or collinear points: the triangulation consists of the segments between neighbouring points on the line.
+        # The unique points are sorted lexicographically, which is their order along the line.
+        pairs = np.column_stack([np.arange(len(unique_points) - 1), np.arange(1, len(unique_points))])
+    u, v = pairs[:, 0], pairs[:, 1]
+    distance = np.hypot(*(unique_points[u] - unique_points[v]).T)
+    # Expand the edges between unique centroids to all buildings with these centroids
+    order = np.argsort(inverse, kind='stable')
+    count = np.bincount(inverse, minlength=len(unique_points))
+    group_start = np.concatenate([[0], np.cumsum(count)[:-1]])
+    num_pairs = count[u] * count[v]
+    edge = np.repeat(np.arange(len(pairs)), num_pairs)
+    local = np.arange(len(edge)) - np.repeat(np.cumsum(num_pairs) - num_pairs, num_pairs)
+    start = ids[order[group_start[u[edge]] + local // count[v[edge]]]]
+    end = ids[order[group_start[v[edge]] + local % count[v[edge]]]]
+    return start, end, distance[edge]
+
+
+def subgraph_edges(center_ids, ids, points):
+    """
+    Delaunay edges of every subgraph
+    :param center_ids: center of the subgraph of every node (sorted)
+    :param ids: building IDs of the nodes
+    :param points: centroids of the nodes
+    :return: dataframe with the edges
+    """
+    boundaries = np.flatnonzero(np.diff(center_ids)) + 1
+    edges = []
+    for center, node_ids, node_points in zip(np.split(center_ids, boundaries), np.split(ids, boundaries),
+                                             np.split(points, boundaries)):
+        start, end, distance = delaunay_edges(node_ids, node_points)
+        edges.append(pd.DataFrame({'start_id': start, 'end_id': end, 'distance': distance,
+                                   'center_id': np.full(len(start), center[0])}))
+    return pd.concat(edges, ignore_index=True) if edges else pd.DataFrame(columns=list(edge_types))
+
+
+def read_centroids(query, connection):
+    """
+    :param query: SELECT statement with the columns center_id (INTEGER), id (INTEGER) and the centroid (x, y)
+    """
+    num_rows = int(db.sql_to_float(f'SELECT COUNT(1) FROM ({query}) a', connection))
+    columns = [('center_id', 'int4', np.int64), ('id', 'int4', np.int64), ('x', 'float8', np.float64),
+               ('y', 'float8', np.float64)]
+    return ce.copy_to_columns(query, columns, num_rows, connection=connection)
+
+
+def delaunay_n_hop(connection):
+    """
+    Replacement for the triangulation of all buildings in `public.create_subgraphs` (n-hop method).
+    Writes the TEMP table `delaunay`.
+    :param connection: connection of the session with the TEMP tables of the pipeline
+    """
+    centroids = read_centroids('''
+        SELECT 0 AS center_id, id::INTEGER, ST_X(ST_Centroid(geom)) AS x, ST_Y(ST_Centroid(geom)) AS y
+        FROM buildings
+    ''', connection)
+    start, end, distance = delaunay_edges(centroids['id'], np.column_stack([centroids['x'], centroids['y']]))
+    edges = pd.DataFrame({'start_id': start, 'end_id': end, 'distance': distance})
+    db.df_to_temp_table(edges, 'delaunay', connection, edge_types)
+
+
+def delaunay_circ(connection, global_triangulation=False, num_processes=4, chunk_size=1000):
+    """
+    Replacement for the triangulation of the subgraphs in `public.create_subgraphs` (circ method).
+    Writes the TEMP table `edges`.
+    :param connection: connection of the session with the TEMP tables of the pipeline
+    :param global_triangulation: triangulate all buildings once, every subgraph gets the edges between its buildings
+    :param num_processes: number of worker processes (triangulation per subgraph)
+    :param chunk_size: number of subgraphs per task
+    """
+    nodes = read_centroids('''
+        SELECT a.center_id, a.id, ST_X(ST_Centroid(b.geom)) AS x, ST_Y(ST_Centroid(b.geom)) AS y
+        FROM (
+            SELECT id, UNNEST(center_ids) AS center_id
+            FROM nodes
+        ) a
+        JOIN buildings b
+        USING (id)
+        ORDER BY a.center_id
+    ''', connection)
+    points = np.column_stack([nodes['x'], nodes['y']])
+    if global_triangulation:
+        ids, first = np.unique(nodes['id'], return_index=True)
+        start, end, distance = delaunay_edges(ids, points[first])
+        # Induced subgraphs: edges whose start and end belong to the same subgraph
+        membership = pd.DataFrame({'id': nodes['id'], 'center_id': nodes['center_id']})
+        edges = pd.DataFrame({'start_id': start, 'end_id': end, 'distance': distance})
+        edges = edges.merge(membership.rename(columns={'id': 'start_id'}), on='start_id')
+        edges = edges.merge(membership.rename(columns={'id': 'end_id'}), on=['end_id', 'center_id'])
+    else:
+        center_ids = nodes['center_id']
+        boundaries = np.flatnonzero(np.diff(center_ids)) + 1
+        # Chunks of whole subgraphs
+        starts = np.concatenate([[0], boundaries])[::chunk_size]
+        chunks = [slice(a, b) for a, b in zip(starts, list(starts[1:]) + [len(center_ids)])] if len(center_ids) else []
+        with concurrent.futures.ProcessPoolExecutor(max_workers=num_processes) as executor:
+            results = list(executor.map(subgraph_edges, [center_ids[chunk] for chunk in chunks],
+                                        [nodes['id'][chunk] for chunk in chunks], [points[chunk] for chunk in chunks]))
+        edges = pd.concat(results, ignore_index=True) if results else pd.DataFrame(columns=list(edge_types))
+    db.df_to_temp_table(edges[list(edge_types)], 'edges', connection, edge_types)
@@ -0,0 +1,59 @@
+"""
+ |---------------------------------------------------------------------------------------------------------------------|
+ | Land use classes of the buildings, computed in parallel DB sessions. TEMP tables are not visible to other sessions
+ | and not scanned by parallel workers, so the buildings are split into partitions (strips in x-direction) that are
+ | copied to a session each. Every session runs `public.land_use` on the shared reference tables
+ | (`public.ua_subdivided`, `public.clc_subdivided`).
+ |---------------------------------------------------------------------------------------------------------------------|
+"""
+
+import concurrent.futures
+
+import numpy as np
+import pandas as pd
+
+import sample.db_interaction as db
+
+columns = ['id', 'ua_coverage', 'land_cover_ua_clc']
+types = {'id': 'INTEGER', 'ua_coverage': 'INTEGER', 'land_cover_ua_clc': 'TEXT'}
+
+
+def land_use_partition(buildings, clc_lookup=None):
+    """
+    :param buildings: dataframe with IDs and geometries (hex EWKB) of the buildings of the partition
+    :param clc_lookup: dataframe with the CLC classes of the buildings of the partition that were read from the raster
+    (see `sample.dataset.rasters`), None if CLC is computed in the DB
+    :return: dataframe with the land use of the buildings
+    """
+    with db.session() as connection:
+        db.df_to_temp_table(buildings, 'buildings_with_features', connection, {'id': 'INTEGER', 'geom': 'GEOMETRY'})
+        if clc_lookup is not None:
+            db.df_to_temp_table(clc_lookup, 'clc_lookup', connection, {'id': 'INTEGER', 'clc': 'TEXT'})
+        db.execute_statement(f'SELECT public.land_use({clc_lookup is None});', connection)
+        return db.sql_to_df(f'SELECT {", ".join(columns)} FROM land_cover_category', connection)
+
+
+def land_use(connection, num_processes=4, clc_in_db=True):
+    """
+    Replacement for `public.land_use` in the session of the pipeline. Writes the TEMP table `land_cover_category`.
+    :param connection: connection of the session with the TEMP tables of the pipeline
+    :param num_processes: number of parallel DB sessions
+    :param clc_in_db: join all buildings without UA class with the CLC polygons? If false, the TEMP table
+    `clc_lookup` of the session is passed on to the partitions.
+    """
+    buildings = db.sql_to_df('''
+        SELECT id, ENCODE(ST_AsEWKB(geom), 'hex') AS geom
+        FROM buildings_with_features
+        ORDER BY ST_X(ST_Centroid(geom))
+    ''', connection)
+    partitions = [partition for partition in np.array_split(np.arange(len(buildings)), num_processes)
+                  if len(partition)]
+    lookups = [None] * len(partitions)
+    if not clc_in_db:
+        clc_lookup = db.sql_to_df('SELECT id, clc FROM clc_lookup', connection)
+        lookups = [clc_lookup[clc_lookup['id'].isin(buildings['id'].iloc[partition])] for partition in partitions]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=num_processes) as executor:
+        results = list(executor.map(land_use_partition, [buildings.iloc[partition] for partition in partitions],
+                                    lookups))
+    table = pd.concat(results) if results else pd.DataFrame({column: [] for column in columns})
+    db.df_to_temp_table(table[columns], 'land_cover_category', connection, types)
@@ -0,0 +1,112 @@
+"""
+ |---------------------------------------------------------------------------------------------------------------------|
+ | N-hop subgraphs computed outside of the DB: multi-source BFS (labelled by center) on the Delaunay edges in CSR format
+ |---------------------------------------------------------------------------------------------------------------------|
+"""
+
+import numpy as np
+import pandas as pd
+
+import sample.db_interaction as db
+import sample.dataset.copy_export as ce
+
+
+def csr_adjacency(start, end, distance, num_nodes):
+    """
+    Symmetric adjacency of the Delaunay edges. The entries of a node are its neighbors and the distances to them.
+    :param start, end: node indices of the edges
+    :param distance: lengths of the edges
+    :param num_nodes: number of nodes
+    :return: pointer (num_nodes + 1), neighbors, distances
+    """
+    source = np.concatenate([start, end])
+    target = np.concatenate([end, start])
+    weight = np.concatenate([distance, distance])
+    order = np.argsort(source, kind='stable')
+    pointer = np.concatenate([[0], np.cumsum(np.bincount(source, minlength=num_nodes))])
+    return pointer, target[order], weight[order]
+
+
+def expand(pointer, neighbors, weights, frontier_nodes, frontier_centers):
+    """
+    All entries of the adjacency of the frontier
+    :return: (neighbor, frontier node, distance, center) for every entry
+    """
+    degree = pointer[frontier_nodes + 1] - pointer[frontier_nodes]
+    row = np.repeat(np.arange(len(frontier_nodes)), degree)
+    position = pointer[frontier_nodes][row] + np.arange(len(row)) - np.repeat(np.cumsum(degree) - degree, degree)
+    return neighbors[position], frontier_nodes[row], weights[position], frontier_centers[row]
+
+
+def n_hop_subgraphs(centers, start, end, distance, n):
+    """
+    Same subgraphs as the n-hop loop in `public.create_subgraphs`: in hop h, all Delaunay edges of the nodes found in
+    hop h - 1 are added (directed from the neighbor to the node) and the neighbors that are not yet part of the subgraph
+    become the nodes of hop h.
+    :param centers: building IDs of the centers
+    :param start, end, distance: Delaunay edges (building IDs)
+    :param n: number of hops
+    :return: nodes (id, center_mask, hop, center_id) and edges (start_id, end_id, distance, hop, center_id) as dataframes
+    """
+    ids, index = np.unique(np.concatenate([centers, start, end]), return_inverse=True)
+    num_nodes = len(ids)
+    center_nodes = index[:len(centers)]
+    start_nodes = index[len(centers):len(centers) + len(start)]
+    end_nodes = index[len(centers) + len(start):]
+    pointer, neighbors, weights = csr_adjacency(start_nodes, end_nodes, distance, num_nodes)
+    # Nodes of all subgraphs as keys (center * num_nodes + node)
+    frontier_nodes, frontier_centers = center_nodes, center_nodes
+    seen = np.unique(frontier_centers.astype(np.int64) * num_nodes + frontier_nodes)
+    nodes = [(frontier_nodes, frontier_centers, 0)]
+    edges = []
+    for hop in range(1, n + 1):
+        neighbor, node, weight, center = expand(pointer, neighbors, weights, frontier_nodes, frontier_centers)
+        edges.append(pd.DataFrame({'start_id': ids[neighbor], 'end_id': ids[node], 'distance': weight,
+                                   'hop': hop, 'center_id': ids[center]}).drop_duplicates())
+        keys = np.unique(center.astype(np.int64) * num_nodes + neighbor)
+        unseen = keys[~np.isin(keys, seen, assume_unique=True)]
+        if len(unseen) == 0:
+            break
+        seen = np.union1d(seen, unseen)
+        frontier_nodes, frontier_centers = unseen % num_nodes, unseen // num_nodes
+        nodes.append((frontier_nodes, frontier_centers, hop))
+    nodes = pd.DataFrame({'id': np.concatenate([ids[node] for node, _, _ in nodes]),
+                          'center_mask': np.concatenate([np.full(len(node), hop == 0) for node, _, hop in nodes]),
+                          'hop': np.concatenate([np.full(len(node), hop) for node, _, hop in nodes]),
+                          'center_id': np.concatenate([ids[center] for _, center, _ in nodes])})
+    edges = pd.concat(edges, ignore_index=True) if edges else \
+        pd.DataFrame(columns=['start_id', 'end_id', 'distance', 'hop', 'center_id'])
+    return nodes, edges
+
+
+def aggregate(nodes, edges):
+    """
+    One row per building (nodes) and per directed edge (edges), like at the end of the n-hop branch of
+    `public.create_subgraphs`
+    """
+    nodes = nodes.groupby('id', sort=False).agg(center_mask=('center_mask', 'any'), hops=('hop', list),
+                                                center_ids=('center_id', list)).reset_index()
+    edges = edges.groupby(['start_id', 'end_id'], sort=False).agg(distance=('distance', 'min'), hops=('hop', list),
+                                                                 center_ids=('center_id', list)).reset_index()
+    return nodes, edges
+
+
+def subgraphs(connection, n):
+    """
+    Replacement for the n-hop loop in `public.create_subgraphs`. Reads the TEMP tables `delaunay` and
+    `buildings_subset` and writes the TEMP tables `nodes` and `edges`.
+    :param connection: connection of the session with the TEMP tables of the pipeline
+    :param n: number of hops
+    """
+    num_edges = int(db.sql_to_float('SELECT COUNT(1) FROM delaunay', connection))
+    delaunay = ce.copy_to_columns('SELECT start_id, end_id, distance FROM delaunay',
+                                  [('start_id', 'int4', np.int64), ('end_id', 'int4', np.int64),
+                                   ('distance', 'float8', np.float64)], num_edges, connection=connection)
+    num_centers = int(db.sql_to_float('SELECT COUNT(1) FROM buildings_subset', connection))
+    centers = ce.copy_to_columns('SELECT id::INTEGER FROM buildings_subset', [('id', 'int4', np.int64)],
+                                 num_centers, connection=connection)['id']
+    nodes, edges = aggregate(*n_hop_subgraphs(centers, delaunay['start_id'], delaunay['end_id'],
+                                              delaunay['distance'], n))
+    db.df_to_temp_table(nodes, 'nodes', connection, {'id': 'INTEGER', 'hops': 'INTEGER[]', 'center_ids': 'INTEGER[]'})
+    db.df_to_temp_table(edges, 'edges', connection, {'start_id': 'INTEGER', 'end_id': 'INTEGER',
+                                                     'hops': 'INTEGER[]', 'center_ids': 'INTEGER[]'})
@@ -0,0 +1,220 @@
+"""
+ |---------------------------------------------------------------------------------------------------------------------|
+ | Shared wall length and number of touching buildings outside of the DB: the boundary segments of every building are
+ | stored as CSR arrays. For every chunk of buildings, the segments of its neighbours within the block distance are
+ | indexed (STRtree) and matched (parallel and overlapping) with the segments of the chunk, so only nearby segment pairs
+ | are compared. The cost grows with the number of neighbours of a building, not with the size of its block.
+ |---------------------------------------------------------------------------------------------------------------------|
+"""
+
+import concurrent.futures
+import multiprocessing
+
+import numpy as np
+import shapely
+
+import sample.db_interaction as db
+import sample.dataset.engines.building_level as blp
+
+# Maximum distance between the walls of touching buildings (in meters, as the buffer in `public.block_level`)
+wall_distance = 0.35
+# Maximum angle between matched segments (in degrees)
+max_angle = 10
+
+# Segments of all buildings of the region (set in every worker process, see `init_worker`)
+all_ids = None
+all_tree = None
+all_segments = None
+
+
+def segments(geoms):
+    """
+    Boundary segments (exterior and interior rings) of the buildings. The rings are normalized (exterior rings
+    clockwise, interior rings counterclockwise), so the interior of a building is always on the right of its segments.
+    :param geoms: array of polygons
+    :return: points (array of shape (number of points, 2)), end (segment k runs from `points[end[k] - 1]` to
+    `points[end[k]]`), pointer (the segments of building i are `pointer[i]:pointer[i + 1]`)
+    """
+    rings, ring_index = shapely.get_rings(shapely.normalize(geoms), return_index=True)
+    points, index = shapely.get_coordinates(rings, return_index=True)
+    # A segment ends at every point that is not the first point of its ring
+    end = np.flatnonzero(np.diff(index) == 0) + 1
+    building = ring_index[index[end]]
+    pointer = np.concatenate([[0], np.cumsum(np.bincount(building, minlength=len(geoms)))])
+    return points, end, pointer
+
+
+def region_segments(geoms, block_size=100000):
+    """
+    Segments of many buildings (see `segments`), extracted in blocks of buildings to bound the temporary memory
+    """
+    points, ends, pointers = [], [], []
+    num_points, num_segments = 0, 0
+    for start in range(0, len(geoms), block_size):
+        block_points, block_end, block_pointer = segments(geoms[start:start + block_size])
+        points.append(block_points)
+        ends.append(block_end + num_points)
+        pointers.append(block_pointer[:-1] + num_segments)
+        num_points += len(block_points)
+        num_segments += block_pointer[-1]
+    points = np.concatenate(points) if points else np.empty((0, 2))
+    end = np.concatenate(ends) if ends else np.empty(0, dtype=np.int64)
+    return points, end, np.concatenate(pointers + [[num_segments]]).astype(np.int64)
+
+
+def init_worker(ids, wkb):
+    """
+    Load all buildings of the region into a worker process
+    """
+    global all_ids, all_tree, all_segments
+    all_ids = ids
+    geoms = shapely.from_wkb(wkb)
+    all_tree = shapely.STRtree(geoms)
+    all_segments = region_segments(geoms)
+
+
+def ranges(pointer, index):
+    """
+    Positions of the entries of several rows of a CSR structure
+    :param pointer: start of every row (length: number of rows + 1)
+    :param index: rows
+    :return: positions of all entries of the rows (in the order of the rows)
+    """
+    start = pointer[index]
+    count = pointer[index + 1] - start
+    return np.repeat(start - np.cumsum(count) + count, count) + np.arange(count.sum())
+
+
+def cover(p_0, p_1, q_0, q_1, distance=wall_distance, angle=max_angle):
+    """
+    Part of the segments p that is covered by the segments q, if they are parallel (up to the angle), at most the
+    distance apart and face each other (opposite directions, see `segments`). The far side of a thin neighbour runs in
+    the same direction as the wall and is not matched.
+    :param p_0, p_1: start and end points of the segments p, arrays of shape (n, 2)
+    :param q_0, q_1: start and end points of the segments q
+    :return: start and end of the covered part (distance from `p_0`), mask of the matching pairs
+    """
+    direction = p_1 - p_0
+    length = np.hypot(direction[:, 0], direction[:, 1])
+    other = q_1 - q_0
+    other_length = np.hypot(other[:, 0], other[:, 1])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        unit = direction / length[:, None]
+        offset_0, offset_1 = q_0 - p_0, q_1 - p_0
+        # Perpendicular distance of the endpoints of q to the line of p, position of the endpoints along p
+        normal_0 = unit[:, 0] * offset_0[:, 1] - unit[:, 1] * offset_0[:, 0]
+        normal_1 = unit[:, 0] * offset_1[:, 1] - unit[:, 1] * offset_1[:, 0]
+        along_0 = np.sum(unit * offset_0, axis=1)
+        along_1 = np.sum(unit * offset_1, axis=1)
+        parallel = np.abs(normal_1 - normal_0) <= np.sin(np.radians(angle)) * other_length
+        facing = np.sum(unit * other, axis=1) < 0
+        close = (np.abs(normal_0) <= distance) & (np.abs(normal_1) <= distance)
+        start = np.maximum(0, np.minimum(along_0, along_1))
+        end = np.minimum(length, np.maximum(along_0, along_1))
+    return start, end, parallel & facing & close & (length > 0) & (other_length > 0) & (end > start)
+
+
+def union_length(start, end, *keys):
+    """
+    Length of the union of intervals, per group of intervals
+    :param start, end: intervals
+    :param keys: arrays that define the groups (ex. segment and neighbour)
+    :return: part of the union length that every interval adds (the sum over a group is the union length of the group)
+    """
+    order = np.lexsort((start,) + tuple(reversed(keys)))
+    start, end = start[order], end[order]
+    first = np.zeros(len(order), dtype=bool)
+    first[:1] = True
+    for key in keys:
+        first[1:] |= key[order][1:] != key[order][:-1]
+    # Running maximum of the ends within every group (groups are shifted apart, so the maximum does not carry over)
+    shift = (np.cumsum(first) - 1) * (end.max() + 1 if len(end) else 0)
+    reach = np.maximum.accumulate(end + shift) - shift
+    previous = np.zeros(len(order))
+    previous[1:] = reach[:-1]
+    previous[first] = 0
+    added = np.empty(len(order))
+    added[order] = np.maximum(0, end - np.maximum(start, previous))
+    return added
+
+
+def compute_chunk(ids, wkb):
+    """
+    :param ids: IDs of the buildings
+    :param wkb: geometries of the buildings (WKB)
+    :return: dict with one array per feature
+    """
+    geoms = shapely.from_wkb(wkb)
+    a, b = all_tree.query(geoms, predicate='dwithin', distance=wall_distance)
+    other = all_ids[b] != ids[a]
+    a, b = a[other], b[other]
+    points_a, end_a, pointer_a = segments(geoms)
+    start_a, end_a = points_a[end_a - 1], points_a[end_a]
+    building_a = np.repeat(np.arange(len(geoms)), np.diff(pointer_a))
+    # Index over the segments of the neighbours of the chunk
+    points_b, end_b, pointer_b = all_segments
+    neighbour_segments = ranges(pointer_b, np.unique(b))
+    start_b, end_b = points_b[end_b[neighbour_segments] - 1], points_b[end_b[neighbour_segments]]
+    tree = shapely.STRtree(shapely.linestrings(np.stack([start_b, end_b], axis=1)))
+    # Candidates by bounding boxes (extended by the wall distance), `cover` checks the distance of the matched segments
+    segment_a, segment_b = tree.query(shapely.box(np.minimum(start_a[:, 0], end_a[:, 0]) - wall_distance,
+                                                  np.minimum(start_a[:, 1], end_a[:, 1]) - wall_distance,
+                                                  np.maximum(start_a[:, 0], end_a[:, 0]) + wall_distance,
+                                                  np.maximum(start_a[:, 1], end_a[:, 1]) + wall_distance))
+    neighbour = np.searchsorted(pointer_b, neighbour_segments[segment_b], side='right') - 1
+    other = all_ids[neighbour] != ids[building_a[segment_a]]
+    segment_a, segment_b, neighbour = segment_a[other], segment_b[other], neighbour[other]
+    start, end, match = cover(start_a[segment_a], end_a[segment_a], start_b[segment_b], end_b[segment_b])
+    # Parts of a segment that are covered by several segments of the same neighbour are counted once (as the
+    # intersection with the neighbour in `public.block_level`)
+    lengths = union_length(start[match], end[match], segment_a[match], neighbour[match])
+    return {
+        'shared_wall_length': np.bincount(building_a[segment_a[match]], weights=lengths,
+                                          minlength=len(geoms)).astype(np.float64),
+        'count_touches': np.bincount(a, minlength=len(geoms)).astype(np.float64)
+    }
+
+
+def compute_features(ids, wkb, all_building_ids, all_building_wkb, num_processes=4, chunk_size=10000):
+    """
+    Compute the shared walls in parallel processes
+    :param ids: IDs of the buildings for which features are computed
+    :param wkb: geometries of these buildings (WKB)
+    :param all_building_ids: IDs of all buildings in the region
+    :param all_building_wkb: geometries of all buildings in the region (WKB)
+    :param num_processes: number of worker processes
+    :param chunk_size: number of buildings per task
+    :return: dict with one array per feature (same order as `ids`)
+    """
+    chunks = [slice(start, start + chunk_size) for start in range(0, len(ids), chunk_size)]
+    if 'fork' in multiprocessing.get_all_start_methods():
+        # The index and segments of the region are created once and shared with the forked workers (copy-on-write)
+        init_worker(all_building_ids, all_building_wkb)
+        pool = {'mp_context': multiprocessing.get_context('fork')}
+    else:
+        pool = {'initializer': init_worker, 'initargs': (all_building_ids, all_building_wkb)}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=num_processes, **pool) as executor:
+        results = list(executor.map(compute_chunk, [ids[chunk] for chunk in chunks], [wkb[chunk] for chunk in chunks]))
+    global all_ids, all_tree, all_segments
+    all_ids, all_tree, all_segments = None, None, None
+    return {column: np.concatenate([result[column] for result in results]) if results else np.empty(0)
+            for column in blp.interacting_columns}
+
+
+def shared_walls(connection, num_processes=4):
+    """
+    Replacement for the shared walls of `public.block_level`. Reads the buildings of the current session and writes the
+    TEMP table `building_level_features_interacting_blocks`.
+    :param connection: connection of the session with the TEMP tables of the pipeline
+    :param num_processes: number of worker processes
+    """
+    dataset = db.sql_to_df('SELECT id, ST_AsBinary(geom) AS wkb FROM buildings_with_features', connection)
+    buildings = db.sql_to_df('SELECT id, ST_AsBinary(geom) AS wkb FROM buildings', connection)
+    # WKB as Python bytes (fixed-width NumPy strings would strip trailing zero bytes)
+    dataset_wkb = np.array([bytes(wkb) for wkb in dataset['wkb']], dtype=object)
+    buildings_wkb = np.array([bytes(wkb) for wkb in buildings['wkb']], dtype=object)
+    features = compute_features(dataset['id'].to_numpy(), dataset_wkb, buildings['id'].to_numpy(), buildings_wkb,
+                                num_processes)
+    table = dataset[['id']].assign(**features)
+    db.df_to_temp_table(table[['id'] + blp.interacting_columns], 'building_level_features_interacting_blocks',
+                        connection)
@@ -8,9 +8,20 @@ def create_subgraphs():
     -subgraphs are created based on circular buffers
     """
     query = f'''
-CREATE OR REPLACE FUNCTION public.create_subgraphs(n INTEGER, buildings_in_graph INTEGER, n_hop BOOLEAN)
+CREATE OR REPLACE FUNCTION public.create_subgraphs(n INTEGER, buildings_in_graph INTEGER, n_hop BOOLEAN,
+                                                   knn_radius BOOLEAN DEFAULT false,
+                                                   global_triangulation BOOLEAN DEFAULT false,
+                                                   triangulation_in_db BOOLEAN DEFAULT true,
+                                                   expansion_in_db BOOLEAN DEFAULT true)
     RETURNS void AS $$
         DECLARE counter INTEGER;
+                start_time TIMESTAMPTZ := clock_timestamp();
+                -- Row counts of the inserts, for the telemetry of the loops (no scans of the growing tables)
+                inserted BIGINT;
+                num_nodes BIGINT := 0;
+                num_edges BIGINT := 0;
+                num_centers BIGINT;
+                centers_left BIGINT;
         BEGIN
             IF n_hop = true THEN
                 /*
@@ -18,60 +29,75 @@ CREATE OR REPLACE FUNCTION public.create_subgraphs(n INTEGER, buildings_in_graph
                 */
                 
                 /*
-                 Table that stores the edges resulting from the triangulation method
+                 If `triangulation_in_db` is false, the table `delaunay` was already created outside of the DB.
                  */
-                DROP TABLE IF EXISTS delaunay;
-                CREATE TEMP TABLE delaunay
-                (
-                    start_id                   INTEGER,
-                    end_id                     INTEGER,
-                    distance                   DOUBLE PRECISION
-                );
+                IF triangulation_in_db THEN
+                    /*
+                     Table that stores the edges resulting from the triangulation method
+                     */
+                    DROP TABLE IF EXISTS delaunay;
+                    CREATE TEMP TABLE delaunay
+                    (
+                        start_id                   INTEGER,
+                        end_id                     INTEGER,
+                        distance                   DOUBLE PRECISION
+                    );
                 
-                DROP TABLE IF EXISTS raw_triangulation;
-                CREATE TEMP TABLE raw_triangulation AS (
-                    SELECT (ST_Dump(ST_DelaunayTriangles(geom, 0.0, 1))).geom as geom
-                    FROM (
-                        SELECT ST_Union(ST_Centroid(geom)) as geom
-                        FROM buildings
-                    ) oa
-                );
+                    DROP TABLE IF EXISTS raw_triangulation;
+                    CREATE TEMP TABLE raw_triangulation AS (
+                        SELECT (ST_Dump(ST_DelaunayTriangles(geom, 0.0, 1))).geom as geom
+                        FROM (
+                            SELECT ST_Union(ST_Centroid(geom)) as geom
+                            FROM buildings
+                        ) oa
+                    );
                 
-                CREATE INDEX ON raw_triangulation USING gist(geom);
+                    CREATE INDEX ON raw_triangulation USING gist(geom);
                 
-                DROP TABLE IF EXISTS buildings_centroids;
-                CREATE TEMP TABLE buildings_centroids AS
-                (
-                    SELECT  id,
-                            ST_Centroid(geom) AS geom
-                    FROM buildings
-                );
+                    DROP TABLE IF EXISTS buildings_centroids;
+                    CREATE TEMP TABLE buildings_centroids AS
+                    (
+                        SELECT  id,
+                                ST_Centroid(geom) AS geom
+                        FROM buildings
+                    );
 
-                CREATE INDEX ON buildings_centroids USING gist(geom);
+                    CREATE INDEX ON buildings_centroids USING gist(geom);
                 
+                    /*
+                     The delaunay triangulation method only gives the geometry of the edges.
+                     But we need to know which buildings are connected to which buildings.
+                     */
+                    INSERT INTO delaunay (start_id, end_id, distance)
+                    SELECT b.id AS start_id,
+                           c.id AS end_id,
+                           MIN(ST_Length(a.geom)) AS distance
+                    FROM raw_triangulation a
+                    JOIN (
+                        SELECT  id,
+                                geom
+                        FROM buildings_centroids
+                    ) b
+                    ON b.geom = ST_StartPoint(a.geom)
+                    JOIN (
+                        SELECT  id,
+                                geom
+                        FROM buildings_centroids
+                    ) c
+                    ON c.geom = ST_EndPoint(a.geom)
+                    GROUP BY start_id, end_id;
+                END IF;
+
                 /*
-                 The delaunay triangulation method only gives the geometry of the edges.
-                 But we need to know which buildings are connected to which buildings.
+                 If `expansion_in_db` is false, the tables `nodes` and `edges` are created outside of the DB afterwards
+                 (BFS on the table `delaunay`).
                  */
-                INSERT INTO delaunay (start_id, end_id, distance)
-                SELECT b.id AS start_id,
-                       c.id AS end_id,
-                       MIN(ST_Length(a.geom)) AS distance
-                FROM raw_triangulation a
-                JOIN (
-                    SELECT  id,
-                            geom
-                    FROM buildings_centroids
-                ) b
-                ON b.geom = ST_StartPoint(a.geom)
-                JOIN (
-                    SELECT  id,
-                            geom
-                    FROM buildings_centroids
-                ) c
-                ON c.geom = ST_EndPoint(a.geom)
-                GROUP BY start_id, end_id;
-                
+                IF NOT expansion_in_db THEN
+                    PERFORM public.telemetry('create_subgraphs', start_time,
+                                             jsonb_build_object('delaunay', (SELECT COUNT(1) FROM delaunay)));
+                    RETURN;
+                END IF;
+
                 /*
                 Create subgraphs around sampled nodes
                 */
@@ -102,6 +128,7 @@ CREATE OR REPLACE FUNCTION public.create_subgraphs(n INTEGER, buildings_in_graph
                 
                 INSERT INTO nodes (id, center_mask, hop, center_id)
                 SELECT id, true, 0, center_id FROM cur_nodes;
+                GET DIAGNOSTICS num_nodes = ROW_COUNT;
                 
                 counter := 0;
                 LOOP 
@@ -145,6 +172,8 @@ CREATE OR REPLACE FUNCTION public.create_subgraphs(n INTEGER, buildings_in_graph
                     FROM delaunay a
                     JOIN cur_nodes b
                     ON a.end_id = b.id;
+                    GET DIAGNOSTICS inserted = ROW_COUNT;
+                    num_edges := num_edges + inserted;
                     
                     DROP TABLE IF EXISTS unseen_nodes;
                     CREATE TEMP TABLE unseen_nodes AS
@@ -157,12 +186,22 @@ CREATE OR REPLACE FUNCTION public.create_subgraphs(n INTEGER, buildings_in_graph
                         WHERE b.id IS NULL
                     );
                     
-                    IF (SELECT COUNT(1) FROM unseen_nodes) = 0 THEN
-                        EXIT;
-                    END IF;
-                    
                     INSERT INTO nodes (id, center_mask, hop, center_id)
                     SELECT id, false, counter, center_id FROM unseen_nodes;
+                    GET DIAGNOSTICS inserted = ROW_COUNT;
+
+                    IF inserted = 0 THEN
+                        EXIT;
+                    END IF;
+                    num_nodes := num_nodes + inserted;
+
+                    PERFORM public.telemetry('create_subgraphs', start_time,
+                                             jsonb_build_object('loop', 'hops',
+                                                                'iteration', counter,
+                                                                'iterations', n,
+                                                                'new_nodes', inserted,
+                                                                'nodes', num_nodes,
+                                                                'edges', num_edges));
                     
                     DROP TABLE IF EXISTS cur_nodes;
                     CREATE TEMP TABLE cur_nodes AS
@@ -227,107 +266,183 @@ CREATE OR REPLACE FUNCTION public.create_subgraphs(n INTEGER, buildings_in_graph
                 );
     
     
-                /*
-                 This table stores the IDs of the buildings that still need a larger buffer, thus further iterative steps.
-                 As soon as this table is empty, the iteration ends.
-                 It also ends in case the buffer size exceeds 5 km.
-                 */
-                DROP TABLE IF EXISTS buildings_left;
-                CREATE TEMP TABLE buildings_left AS
-                (
-                    SELECT id AS center_id
-                    FROM buildings_subset
-                );
+                IF knn_radius THEN
+                    /*
+                     The buffer loop stops for a center at the first distance (multiple of 10 m) at which the buffer
+                     contains `buildings_in_graph` buildings (including the center). This distance follows directly
+                     from the distance to the k-th nearest building (KNN search with the spatial index).
+                     After 20 km, the loop adds the graph at 20010 m regardless of its number of buildings.
+                     */
+                    DROP TABLE IF EXISTS center_radius;
+                    CREATE TEMP TABLE center_radius AS
+                    (
+                        SELECT  a.id AS center_id,
+                                a.geom,
+                                CASE
+                                    WHEN k.distance IS NULL THEN 20010
+                                    ELSE LEAST(GREATEST(10, CEIL(k.distance / 10) * 10), 20010)
+                                END AS radius
+                        FROM (
+                            SELECT  b.id,
+                                    b.geom
+                            FROM buildings_subset a
+                            JOIN buildings b
+                            USING (id)
+                        ) a
+                        LEFT JOIN LATERAL (
+                            SELECT ST_Distance(a.geom, b.geom) AS distance
+                            FROM buildings b
+                            ORDER BY b.geom <-> a.geom
+                            OFFSET buildings_in_graph - 1
+                            LIMIT 1
+                        ) k
+                        ON true
+                    );
+
+                    /*
+                     All subgraphs in one pass
+                     */
+                    INSERT INTO nodes(id, center_mask, center_id)
+                    SELECT  b.id,
+                            a.center_id = b.id AS center_mask,
+                            a.center_id
+                    FROM center_radius a
+                    JOIN buildings b
+                    ON ST_DWithin(b.geom, a.geom, a.radius);
+                    GET DIAGNOSTICS num_nodes = ROW_COUNT;
+
+                    PERFORM public.telemetry('create_subgraphs', start_time,
+                                             jsonb_build_object('loop', 'buffer',
+                                                                'centers', (SELECT COUNT(1) FROM center_radius),
+                                                                'max_distance', (SELECT MAX(radius) FROM center_radius),
+                                                                'centers_left', 0,
+                                                                'nodes', num_nodes));
+                ELSE
+                    /*
+                     This table stores the IDs of the buildings that still need a larger buffer, thus further iterative steps.
+                     As soon as this table is empty, the iteration ends.
+                     It also ends in case the buffer size exceeds 5 km.
+                     */
+                    DROP TABLE IF EXISTS buildings_left;
+                    CREATE TEMP TABLE buildings_left AS
+                    (
+                        SELECT id AS center_id
+                        FROM buildings_subset
+                    );
+                    num_centers := (SELECT COUNT(1) FROM buildings_subset);
+                    centers_left := num_centers;
     
-                DECLARE
-                    distance INTEGER;
-                BEGIN
-                    distance := 10;
-                    LOOP
-                        /*
-                         Breaking conditions
-                         */
-                        IF COUNT(1) = 0 FROM buildings_left THEN
-                            EXIT;
-                        END IF;
+                    DECLARE
+                        distance INTEGER;
+                    BEGIN
+                        distance := 10;
+                        LOOP
+                            /*
+                             Breaking conditions
+                             */
+                            IF centers_left = 0 THEN
+                                EXIT;
+                            END IF;
     
-                        /*
-                         Build buffer around all buildings for which we wish to compute graphs
-                         */
-                        DROP TABLE IF EXISTS buffer;
-                        CREATE TEMP TABLE buffer AS
-                        (
-                            SELECT a.id,
-                                   b.geom,
-                                   ST_Buffer(b.geom, distance) AS buffer
-                            FROM (
-                                SELECT *
-                                FROM buildings_subset
-                                WHERE id IN (
+                            /*
+                             Build buffer around all buildings for which we wish to compute graphs
+                             */
+                            DROP TABLE IF EXISTS buffer;
+                            CREATE TEMP TABLE buffer AS
+                            (
+                                SELECT a.id,
+                                       b.geom,
+                                       ST_Buffer(b.geom, distance) AS buffer
+                                FROM (
                                     SELECT *
-                                    FROM buildings_left
-                                )
-                            ) a
-                            JOIN (
-                                SELECT *
-                                FROM buildings
-                            ) b
-                            USING(id)  
-                        );
+                                    FROM buildings_subset
+                                    WHERE id IN (
+                                        SELECT *
+                                        FROM buildings_left
+                                    )
+                                ) a
+                                JOIN (
+                                    SELECT *
+                                    FROM buildings
+                                ) b
+                                USING(id)  
+                            );
     
-                        CREATE INDEX ON buffer USING gist(buffer);
+                            CREATE INDEX ON buffer USING gist(buffer);
     
-                        /*
-                         Get all buildings that are in the buffers
-                         */
-                        DROP TABLE IF EXISTS graph_nodes_current;
-                        CREATE TEMP TABLE graph_nodes_current AS
-                        (
-                            SELECT  b.id,
-                                    a.id = b.id AS center_mask,
-                                    a.id AS center_id
-                            FROM (
-                                SELECT *
-                                FROM buffer
-                            ) a
-                            JOIN (
-                                SELECT *
-                                FROM buildings
-                            ) b
-                            ON ST_Intersects(b.geom, a.buffer)
-                        );
+                            /*
+                             Get all buildings that are in the buffers
+                             */
+                            DROP TABLE IF EXISTS graph_nodes_current;
+                            CREATE TEMP TABLE graph_nodes_current AS
+                            (
+                                SELECT  b.id,
+                                        a.id = b.id AS center_mask,
+                                        a.id AS center_id
+                                FROM (
+                                    SELECT *
+                                    FROM buffer
+                                ) a
+                                JOIN (
+                                    SELECT *
+                                    FROM buildings
+                                ) b
+                                ON ST_Intersects(b.geom, a.buffer)
+                            );
     
-                        /*
-                         Get the number of buildings in each graph
-                         */
-                        DROP TABLE IF EXISTS graph_nodes_with_count;
-                        CREATE TEMP TABLE graph_nodes_with_count AS
-                        (
-                            SELECT center_id, count
-                            FROM (
-                                SELECT center_id, COUNT(*) AS count
-                                FROM graph_nodes_current
-                                GROUP BY center_id
-                            ) a
-                        );
+                            /*
+                             Get the number of buildings in each graph
+                             */
+                            DROP TABLE IF EXISTS graph_nodes_with_count;
+                            CREATE TEMP TABLE graph_nodes_with_count AS
+                            (
+                                SELECT center_id, count
+                                FROM (
+                                    SELECT center_id, COUNT(*) AS count
+                                    FROM graph_nodes_current
+                                    GROUP BY center_id
+                                ) a
+                            );
     
-                        /*
-                         Get all buildings where the current buffer does not contain a certain minimum number of
-                         buildings (ex. 40).
-                         We make the buffer larger for these buildings.
-                         */
-                        DROP TABLE IF EXISTS buildings_left;
-                        CREATE TEMP TABLE buildings_left AS
-                        (
-                            SELECT center_id
-                            FROM graph_nodes_with_count
-                            WHERE count < buildings_in_graph
-                        );
+                            /*
+                             Get all buildings where the current buffer does not contain a certain minimum number of
+                             buildings (ex. 40).
+                             We make the buffer larger for these buildings.
+                             */
+                            DROP TABLE IF EXISTS buildings_left;
+                            CREATE TEMP TABLE buildings_left AS
+                            (
+                                SELECT center_id
+                                FROM graph_nodes_with_count
+                                WHERE count < buildings_in_graph
+                            );
+                            centers_left := (SELECT COUNT(1) FROM buildings_left);
                         
-                        IF distance > 20000 THEN
+                            PERFORM public.telemetry('create_subgraphs', start_time,
+                                                     jsonb_build_object('loop', 'buffer',
+                                                                        'distance', distance,
+                                                                        'max_distance', 20010,
+                                                                        'centers', num_centers,
+                                                                        'centers_left', centers_left,
+                                                                        'nodes', num_nodes));
+
+                            IF distance > 20000 THEN
+                                /*
+                                 If graphs get too large in terms of radius, just add all current graphs,
+                                 even if their number of buildings is not sufficient.
+                                 */
+                                INSERT INTO nodes(id, center_mask, center_id)
+                                SELECT *
+                                FROM graph_nodes_current
+                                WHERE center_id IN (
+                                    SELECT center_id
+                                    FROM graph_nodes_with_count
+                                );
+                                EXIT;
+                            END IF;
+    
                             /*
-                             If graphs get too large in terms of radius, just add all current graphs,
-                             even if their number of buildings is not sufficient.
+                             These graphs have enough nodes and are added to a table that stores the final result
                              */
                             INSERT INTO nodes(id, center_mask, center_id)
                             SELECT *
@@ -335,93 +450,131 @@ CREATE OR REPLACE FUNCTION public.create_subgraphs(n INTEGER, buildings_in_graph
                             WHERE center_id IN (
                                 SELECT center_id
                                 FROM graph_nodes_with_count
+                                WHERE count >= buildings_in_graph
                             );
-                            EXIT;
-                        END IF;
+                            GET DIAGNOSTICS inserted = ROW_COUNT;
+                            num_nodes := num_nodes + inserted;
     
-                        /*
-                         These graphs have enough nodes and are added to a table that stores the final result
-                         */
-                        INSERT INTO nodes(id, center_mask, center_id)
-                        SELECT *
-                        FROM graph_nodes_current
-                        WHERE center_id IN (
-                            SELECT center_id
-                            FROM graph_nodes_with_count
-                            WHERE count >= buildings_in_graph
-                        );
-    
-                        distance := distance + 10;
-                    END LOOP;
-                END;
+                            distance := distance + 10;
+                        END LOOP;
+                    END;
+                END IF;
     
                 /*
-                 Perform delaunay triangulation for each graph
+                 If `triangulation_in_db` is false, the edges are created outside of the DB afterwards.
                  */
-                DROP TABLE IF EXISTS raw_triangulation;
-                CREATE TEMP TABLE raw_triangulation AS (
-                    SELECT oa.center_id,
-                           (ST_Dump(ST_DelaunayTriangles(geom, 0.0, 1))).geom as geom
-                    FROM (
-                        SELECT a.center_id,
-                               ST_Union(ST_Centroid(b.geom)) as geom
+                IF triangulation_in_db THEN
+                    DROP TABLE IF EXISTS buildings_centroids;
+                    CREATE TEMP TABLE buildings_centroids AS
+                    (
+                        SELECT  a.id,
+                                ST_Centroid(b.geom) AS geom
                         FROM (
-                            SELECT *
+                            SELECT id
                             FROM nodes
+                            GROUP BY id
                         ) a
                         JOIN (
-                            SELECT * FROM buildings
+                            SELECT  id,
+                                    geom
+                            FROM buildings
                         ) b
                         USING (id)
-                        GROUP BY a.center_id
-                    ) oa
-                );
-                
-                CREATE INDEX ON raw_triangulation USING gist(geom);
-        
-                DROP TABLE IF EXISTS buildings_centroids;
-                CREATE TEMP TABLE buildings_centroids AS
-                (
-                    SELECT  a.id,
-                            ST_Centroid(b.geom) AS geom
-                    FROM (
-                        SELECT id
-                        FROM nodes
-                        GROUP BY id
-                    ) a
-                    JOIN (
-                        SELECT  id,
-                                geom
-                        FROM buildings
-                    ) b
-                    USING (id)
-                );
+                    );
 
-                CREATE INDEX ON buildings_centroids USING gist(geom);
+                    CREATE INDEX ON buildings_centroids USING gist(geom);
 
-               /*
-                 The delaunay triangulation method only gives the geometry of the edges.
-                 But we need to know which buildings are connected to which buildings.
-                 */
-                INSERT INTO edges(start_id, end_id, distance, center_id)
-                SELECT b.id AS start_id,
-                       c.id AS end_id,
-                       MIN(ST_Length(a.geom)) AS distance,
-                       a.center_id AS center_id
-                FROM raw_triangulation a
-                JOIN (
-                    SELECT  id,
-                            geom
-                    FROM buildings_centroids
-                ) b
-                ON b.geom = ST_StartPoint(a.geom)
-                JOIN (
-                    SELECT  id,
-                            geom
-                    FROM buildings_centroids
-                ) c
-                ON c.geom = ST_EndPoint(a.geom)
-                GROUP BY start_id, end_id, center_id;
+                    IF global_triangulation THEN
+                        /*
+                         Triangulate all buildings of the subgraphs once. The edges of a subgraph are the edges of this
+                         triangulation between buildings of the subgraph (induced subgraph).
+                         */
+                        DROP TABLE IF EXISTS raw_triangulation;
+                        CREATE TEMP TABLE raw_triangulation AS (
+                            SELECT (ST_Dump(ST_DelaunayTriangles(geom, 0.0, 1))).geom as geom
+                            FROM (
+                                SELECT ST_Union(geom) as geom
+                                FROM buildings_centroids
+                            ) oa
+                        );
+
+                        DROP TABLE IF EXISTS delaunay;
+                        CREATE TEMP TABLE delaunay AS
+                        (
+                            SELECT b.id AS start_id,
+                                   c.id AS end_id,
+                                   MIN(ST_Length(a.geom)) AS distance
+                            FROM raw_triangulation a
+                            JOIN buildings_centroids b
+                            ON b.geom = ST_StartPoint(a.geom)
+                            JOIN buildings_centroids c
+                            ON c.geom = ST_EndPoint(a.geom)
+                            GROUP BY b.id, c.id
+                        );
+
+                        CREATE INDEX ON delaunay (start_id);
+                        CREATE INDEX ON nodes (id, center_id);
+
+                        INSERT INTO edges(start_id, end_id, distance, center_id)
+                        SELECT a.start_id,
+                               a.end_id,
+                               a.distance,
+                               b.center_id
+                        FROM delaunay a
+                        JOIN nodes b
+                        ON b.id = a.start_id
+                        JOIN nodes c
+                        ON c.id = a.end_id AND c.center_id = b.center_id;
+                    ELSE
+                        /*
+                         Perform delaunay triangulation for each graph
+                         */
+                        DROP TABLE IF EXISTS raw_triangulation;
+                        CREATE TEMP TABLE raw_triangulation AS (
+                            SELECT oa.center_id,
+                                   (ST_Dump(ST_DelaunayTriangles(geom, 0.0, 1))).geom as geom
+                            FROM (
+                                SELECT a.center_id,
+                                       ST_Union(ST_Centroid(b.geom)) as geom
+                                FROM (
+                                    SELECT *
+                                    FROM nodes
+                                ) a
+                                JOIN (
+                                    SELECT * FROM buildings
+                                ) b
+                                USING (id)
+                                GROUP BY a.center_id
+                            ) oa
+                        );
+                
+                        CREATE INDEX ON raw_triangulation USING gist(geom);
+
+                       /*
+                         The delaunay triangulation method only gives the geometry of the edges.
+                         But we need to know which buildings are connected to which buildings.
+                         */
+                        INSERT INTO edges(start_id, end_id, distance, center_id)
+                        SELECT b.id AS start_id,
+                               c.id AS end_id,
+                               MIN(ST_Length(a.geom)) AS distance,
+                               a.center_id AS center_id
+                        FROM raw_triangulation a
+                        JOIN (
+                            SELECT  id,
+                                    geom
+                            FROM buildings_centroids
+                        ) b
+                        ON b.geom = ST_StartPoint(a.geom)
+                        JOIN (
+                            SELECT  id,
+                                    geom
+                            FROM buildings_centroids
+                        ) c
+                        ON c.geom = ST_EndPoint(a.geom)
+                        GROUP BY start_id, end_id, center_id;
+                    END IF;
+                END IF;
                 
                 /*
                 Make nodes and edges unique
@@ -443,6 +596,10 @@ CREATE OR REPLACE FUNCTION public.create_subgraphs(n INTEGER, buildings_in_graph
                 );
                 
             END IF;
+
+            PERFORM public.telemetry('create_subgraphs', start_time,
+                                     jsonb_build_object('nodes', (SELECT COUNT(1) FROM nodes),
+                                                        'edges', (SELECT COUNT(1) FROM edges)));
         END;
 $$ LANGUAGE plpgsql;
     '''
@@ -24,6 +24,8 @@ def drop_temp_tables():
                     
                     DROP TABLE IF EXISTS buildings_with_labels;
                     DROP TABLE IF EXISTS buildings_subset;
+                    DROP TABLE IF EXISTS buildings_strata;
+                    DROP TABLE IF EXISTS strata_size;
                     DROP TABLE IF EXISTS nodes;
                     DROP TABLE IF EXISTS nodes_n_hop;
                     DROP TABLE IF EXISTS nodes_circ;
@@ -45,13 +47,11 @@ def drop_temp_tables():
                     
                     DROP TABLE IF EXISTS convex_hulls;
                     DROP TABLE IF EXISTS footprint_area;
-                    DROP TABLE IF EXISTS bounding_box_aux;
-                    DROP TABLE IF EXISTS exterior_ring_rectangle;
-                    DROP TABLE IF EXISTS angles;
-                    DROP TABLE IF EXISTS length_axis;
+                    DROP TABLE IF EXISTS oriented_envelopes;
                     DROP TABLE IF EXISTS corners;
                     DROP TABLE IF EXISTS building_level_features;
                     
+                    DROP TABLE IF EXISTS building_blocks;
                     DROP TABLE IF EXISTS blocks_w_duplicated;
                     DROP TABLE IF EXISTS blocks;
                     DROP TABLE IF EXISTS all_buildings_within_blocks;
@@ -59,17 +59,14 @@ def drop_temp_tables():
                     DROP TABLE IF EXISTS block_level_features_interacting_buildings;
                     DROP TABLE IF EXISTS convex_hulls;
                     DROP TABLE IF EXISTS footprint_area;
-                    DROP TABLE IF EXISTS bounding_box_aux;
-                    DROP TABLE IF EXISTS exterior_ring_rectangle;
-                    DROP TABLE IF EXISTS angles;
-                    DROP TABLE IF EXISTS length_axis;
+                    DROP TABLE IF EXISTS oriented_envelopes;
                     DROP TABLE IF EXISTS corners;
                     DROP TABLE IF EXISTS block_level_features_for_blocks;
                     DROP TABLE IF EXISTS block_level_features;
                     
-                    DROP TABLE IF EXISTS ua_extract;
+                    DROP TABLE IF EXISTS clc_lookup;
+                    DROP TABLE IF EXISTS degurba_lookup;
                     DROP TABLE IF EXISTS urban_atlas_category;
-                    DROP TABLE IF EXISTS clc_extract;
                     DROP TABLE IF EXISTS clc_category;
                     DROP TABLE IF EXISTS land_cover_category;
                     
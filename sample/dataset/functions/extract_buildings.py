@@ -13,98 +13,98 @@ def extract_buildings():
                                                             x_min DOUBLE PRECISION,
                                                             x_max DOUBLE PRECISION,
                                                             y_min DOUBLE PRECISION,
-                                                            y_max DOUBLE PRECISION)
+                                                            y_max DOUBLE PRECISION,
+                                                            tile_x_min DOUBLE PRECISION DEFAULT NULL,
+                                                            tile_x_max DOUBLE PRECISION DEFAULT NULL,
+                                                            tile_y_min DOUBLE PRECISION DEFAULT NULL,
+                                                            tile_y_max DOUBLE PRECISION DEFAULT NULL,
+                                                            halo DOUBLE PRECISION DEFAULT 0,
+                                                            hash_sampling BOOLEAN DEFAULT false,
+                                                            stratify_label BOOLEAN DEFAULT false,
+                                                            cell_size DOUBLE PRECISION DEFAULT NULL,
+                                                            seed INTEGER DEFAULT 0)
             RETURNS void AS $$
+                DECLARE extent GEOMETRY;
+                        num_centers DOUBLE PRECISION;
+                        water_level DOUBLE PRECISION;
+                        start_time TIMESTAMPTZ := clock_timestamp();
                 BEGIN
                     /*
-                    Extract buildings from OSM
-                    */
-                    DROP TABLE IF EXISTS buildings;
-                    CREATE TEMP TABLE buildings AS
-                    (
-                        SELECT  ROW_NUMBER() OVER() AS id,
-                                a.osm_id,
-                                a.building AS building_key,
-                                a.tags->'house' AS house,
-                                ST_Transform(a.way, 3035) AS geom,
-                                f.country_code AS country
-                        FROM (
-                            SELECT *
-                            FROM public.planet_osm_polygon
-                            -- Exclude "buildings" that are no real buildings
-                            WHERE building IS NOT NULL AND NOT building = ANY(ARRAY['no', 'maybe'])
-                         ) a
-                        JOIN (
-                            SELECT ST_Transform(ST_MakeEnvelope ( x_min, y_min, x_max, y_max, 4326
-                                           )::GEOMETRY('POLYGON'), 3035) AS geom
-                        ) d
-                        ON ST_Within(a.way, d.geom)
-                        JOIN (
-                            SELECT code AS country_code,
-                                   geom
-                            FROM public.countries
-                        ) f
-                        ON ST_Intersects(a.way, f.geom)
-                    );
+                     Spatial extent from which buildings are extracted.
+                     In tiled mode, this is the tile expanded by the halo (in meters), clipped to the whole extract.
+                     */
+                    extent := ST_Transform(ST_MakeEnvelope(x_min, y_min, x_max, y_max, 4326)::GEOMETRY('POLYGON'), 3035);
+                    IF tile_x_min IS NOT NULL THEN
+                        extent := ST_Intersection(
+                            extent,
+                            ST_Expand(ST_Transform(ST_MakeEnvelope(tile_x_min, tile_y_min, tile_x_max, tile_y_max,
+                                                                   4326), 3035), halo)
+                        );
+                    END IF;
 
                     /*
-                     In some cases, incoherent buildings form one MultiPolygon in OSM.
-                     To make the representation consistent, we convert all MultiPolygons to Polygons.
+                     Buildings (polygon parts of OSM buildings) with their stable IDs from the building store
+                     (see `public.update_building_store`)
                      */
                     DROP TABLE IF EXISTS buildings_splitted;
                     CREATE TEMP TABLE buildings_splitted AS
                     (
-                        SELECT    ROW_NUMBER() OVER() AS id,
-                                  osm_id,
-                                  building_key,
-                                  house,
-                                  (ST_Dump(geom)).geom AS geom,
-                                  country
-                        FROM buildings
+                        SELECT  id,
+                                osm_id,
+                                building_key,
+                                house,
+                                geom,
+                                country,
+                                geom_hash
+                        FROM public.building_store
+                        WHERE ST_Within(geom, extent)
                     );
 
                     CREATE INDEX ON buildings_splitted USING gist(geom);
+                    ANALYZE buildings_splitted;
                     
                     /*
                      Sometimes, there are building polygons within other buildings. We remove them.
+                     Anti-join: for every building, the spatial index is only probed for buildings whose bounding box
+                     contains its bounding box.
                      */
                     DROP TABLE IF EXISTS buildings_without_inner_buildings;
                     CREATE TEMP TABLE buildings_without_inner_buildings AS (
-                        SELECT  ROW_NUMBER() OVER() AS id,
+                        SELECT  id,
                                 osm_id,
                                 building_key,
                                 house,
                                 geom,
-                                country
-                        FROM buildings_splitted
-                        WHERE id NOT IN (
-                            SELECT a.id
-                            FROM (
-                                SELECT * FROM buildings_splitted
-                            ) a
-                            JOIN (
-                                SELECT * FROM buildings_splitted
-                            ) b
-                            ON a.id <> b.id AND ST_Contains(b.geom, a.geom)
-                            GROUP BY a.id
+                                country,
+                                geom_hash
+                        FROM buildings_splitted a
+                        WHERE NOT EXISTS (
+                            SELECT 1
+                            FROM buildings_splitted b
+                            WHERE b.geom ~ a.geom
+                              AND b.id <> a.id
+                              AND ST_Contains(b.geom, a.geom)
                         )
                     );
         
                     CREATE INDEX ON buildings_without_inner_buildings USING gist(geom);
+                    CREATE INDEX ON buildings_without_inner_buildings USING hash(geom_hash);
 
                     /*
-                     Remove buildings with duplicate geometries (they cause problems in graphs)
+                     Remove buildings with duplicate geometries (they cause problems in graphs).
+                     Duplicates are found with a hash of the geometry, the building with the lowest ID is kept.
                      */
-                    WITH to_keep AS (
-                       SELECT MIN(id) AS id
-                       FROM buildings_without_inner_buildings
-                       GROUP BY geom
-                    )
-                    DELETE FROM buildings_without_inner_buildings
-                    WHERE id NOT IN (
-                        SELECT id
-                        FROM to_keep
+                    DELETE FROM buildings_without_inner_buildings a
+                    WHERE EXISTS (
+                        SELECT 1
+                        FROM buildings_without_inner_buildings b
+                        WHERE b.geom_hash = a.geom_hash
+                          AND b.id < a.id
+                          AND b.geom = a.geom
                     );
+
+                    ALTER TABLE buildings_without_inner_buildings
+                    DROP COLUMN geom_hash;
                     
                     /*
                      Delete polygons with an area of 1 m^2 or below.
@@ -150,21 +150,239 @@ def extract_buildings():
                             building_key = 'house' AND  (house IS NULL OR
                                                             (NOT house = ANY(ARRAY['terraced', 'terrace'])));
                     
-                    PERFORM SETSEED(0.5);
-                    
+                    /*
+                     In tiled mode, only buildings of the tile itself (not of the halo) can become center nodes.
+                     A building belongs to the tile that contains its centroid (tiles are half-open intervals).
+                     */
+                    IF tile_x_min IS NOT NULL THEN
+                        DELETE FROM buildings_with_labels a
+                        USING buildings b
+                        WHERE a.id = b.id
+                          AND NOT (ST_X(ST_Transform(ST_Centroid(b.geom), 4326)) >= tile_x_min
+                               AND ST_X(ST_Transform(ST_Centroid(b.geom), 4326)) < tile_x_max
+                               AND ST_Y(ST_Transform(ST_Centroid(b.geom), 4326)) >= tile_y_min
+                               AND ST_Y(ST_Transform(ST_Centroid(b.geom), 4326)) < tile_y_max);
+                    END IF;
+
+                    /*
+                     Number of center nodes: fraction of all buildings (of the tile)
+                     */
+                    num_centers := (
+                        SELECT COUNT(1)
+                        FROM buildings
+                        WHERE tile_x_min IS NULL
+                           OR (ST_X(ST_Transform(ST_Centroid(geom), 4326)) >= tile_x_min
+                               AND ST_X(ST_Transform(ST_Centroid(geom), 4326)) < tile_x_max
+                               AND ST_Y(ST_Transform(ST_Centroid(geom), 4326)) >= tile_y_min
+                               AND ST_Y(ST_Transform(ST_Centroid(geom), 4326)) < tile_y_max)
+                    )::DOUBLE PRECISION * subsample_fraction;
+
                     /*
                      Subsample of buildings where we create graphs around.
                      */
-                    DROP TABLE IF EXISTS buildings_subset;
-                    CREATE TEMP TABLE buildings_subset AS
+                    IF hash_sampling THEN
+                        /*
+                         Bernoulli sampling without sorting: a building is a center if the hash of its (stable) ID and
+                         the seed, mapped to [0, 1), is below the sampling probability of its stratum.
+                         Strata are the labels (`stratify_label`) and/or square cells of `cell_size` meters. Every
+                         stratum gets the same expected number of centers (water level), strata that are smaller are
+                         taken completely and their shortfall is shared by the other strata. The expected total is
+                         `num_centers` (or all buildings, if there are fewer).
+                         */
+                        DROP TABLE IF EXISTS buildings_strata;
+                        CREATE TEMP TABLE buildings_strata AS
+                        (
+                            SELECT  a.id,
+                                    CASE WHEN stratify_label THEN a.numerical_label ELSE 0 END AS label,
+                                    CASE
+                                        WHEN cell_size IS NULL THEN 0
+                                        ELSE FLOOR(ST_X(ST_Centroid(b.geom)) / cell_size)
+                                    END AS cell_x,
+                                    CASE
+                                        WHEN cell_size IS NULL THEN 0
+                                        ELSE FLOOR(ST_Y(ST_Centroid(b.geom)) / cell_size)
+                                    END AS cell_y,
+                                    ('x' || SUBSTR(MD5(a.id::TEXT || ':' || seed::TEXT), 1, 8))::BIT(32)::BIGINT
+                                        / 4294967296.0 AS u
+                            FROM buildings_with_labels a
+                            JOIN buildings b
+                            USING (id)
+                        );
+
+                        DROP TABLE IF EXISTS strata_size;
+                        CREATE TEMP TABLE strata_size AS
+                        (
+                            SELECT label, cell_x, cell_y, COUNT(1) AS size
+                            FROM buildings_strata
+                            GROUP BY label, cell_x, cell_y
+                        );
+
+                        /*
+                         Water level: with the strata sorted by size, the first stratum that is not smaller than the
+                         equal share of the centers that the strata before it (taken completely) leave.
+                         NULL if all buildings are centers.
+                         */
+                        water_level := (
+                            SELECT level
+                            FROM (
+                                SELECT  label,
+                                        cell_x,
+                                        cell_y,
+                                        size,
+                                        (num_centers - (SUM(size) OVER w - size))
+                                            / (COUNT(1) OVER () - ROW_NUMBER() OVER w + 1) AS level
+                                FROM strata_size
+                                WINDOW w AS (ORDER BY size, label, cell_x, cell_y ROWS UNBOUNDED PRECEDING)
+                            ) a
+                            WHERE size >= level
+                            ORDER BY size, label, cell_x, cell_y
+                            LIMIT 1
+                        );
+
+                        DROP TABLE IF EXISTS buildings_subset;
+                        CREATE TEMP TABLE buildings_subset AS
+                        (
+                            SELECT a.id
+                            FROM buildings_strata a
+                            JOIN strata_size b
+                            USING (label, cell_x, cell_y)
+                            -- LEAST ignores NULL: all buildings of the stratum
+                            WHERE a.u < LEAST(b.size, water_level) / b.size
+                        );
+                    ELSE
+                        PERFORM SETSEED(0.5);
+
+                        DROP TABLE IF EXISTS buildings_subset;
+                        CREATE TEMP TABLE buildings_subset AS
+                        (
+                            SELECT id
+                            FROM buildings_with_labels
+                            ORDER BY RANDOM() LIMIT num_centers
+                        );
+                    END IF;
+
+                    PERFORM public.telemetry('extract_buildings', start_time,
+                                             jsonb_build_object('buildings', (SELECT COUNT(1) FROM buildings),
+                                                                'centers', (SELECT COUNT(1) FROM buildings_subset)));
+                END;
+        $$ LANGUAGE plpgsql;
+
+        /*
+         |---------------------------------------------------------------------------------------------------------------------|
+         | Update the building store with the buildings from OSM in the extract
+         |---------------------------------------------------------------------------------------------------------------------|
+        */
+
+        CREATE OR REPLACE FUNCTION public.update_building_store(x_min DOUBLE PRECISION,
+                                                                x_max DOUBLE PRECISION,
+                                                                y_min DOUBLE PRECISION,
+                                                                y_max DOUBLE PRECISION)
+            RETURNS void AS $$
+                DECLARE extent GEOMETRY;
+                        start_time TIMESTAMPTZ := clock_timestamp();
+                BEGIN
+                    extent := ST_Transform(ST_MakeEnvelope(x_min, y_min, x_max, y_max, 4326)::GEOMETRY('POLYGON'), 3035);
+
+                    /*
+                     In some cases, incoherent buildings form one MultiPolygon in OSM.
+                     To make the representation consistent, we convert all MultiPolygons to Polygons.
+                     A building part is identified by the OSM ID and its position within the MultiPolygon.
+                     */
+                    DROP TABLE IF EXISTS osm_buildings;
+                    CREATE TEMP TABLE osm_buildings AS
                     (
-                        SELECT id
-                        FROM buildings_with_labels
-                        ORDER BY RANDOM() LIMIT (
-                            SELECT COUNT(1)
-                            FROM buildings
-                        )::DOUBLE PRECISION * subsample_fraction
+                        SELECT  a.osm_id,
+                                ROW_NUMBER() OVER (PARTITION BY a.osm_id
+                                                   ORDER BY a.dump_path, MD5(ST_AsBinary(a.geom))) AS part,
+                                a.building_key,
+                                a.house,
+                                a.geom,
+                                MD5(ST_AsBinary(a.geom)) AS geom_hash,
+                                f.country_code AS country
+                        FROM (
+                            SELECT  b.osm_id,
+                                    b.building AS building_key,
+                                    b.tags->'house' AS house,
+                                    b.way,
+                                    d.path AS dump_path,
+                                    d.geom
+                            FROM public.planet_osm_polygon b
+                            CROSS JOIN LATERAL ST_Dump(ST_Transform(b.way, 3035)) d
+                            -- Exclude "buildings" that are no real buildings
+                            WHERE b.building IS NOT NULL AND NOT b.building = ANY(ARRAY['no', 'maybe'])
+                              AND ST_Within(b.way, extent)
+                        ) a
+                        -- Buildings at national borders are assigned to one country
+                        JOIN LATERAL (
+                            SELECT code AS country_code
+                            FROM public.countries
+                            WHERE ST_Intersects(a.way, geom)
+                            ORDER BY code
+                            LIMIT 1
+                        ) f
+                        ON true
                     );
+
+                    CREATE UNIQUE INDEX ON osm_buildings (osm_id, part);
+
+                    /*
+                     Only one run may assign IDs at the same time
+                     */
+                    LOCK TABLE public.building_store IN SHARE ROW EXCLUSIVE MODE;
+
+                    /*
+                     Buildings that were deleted in OSM
+                     */
+                    DELETE FROM public.building_store a
+                    WHERE ST_Within(a.geom, extent)
+                      AND NOT EXISTS (
+                        SELECT 1
+                        FROM osm_buildings b
+                        WHERE b.osm_id = a.osm_id
+                          AND b.part = a.part
+                      );
+
+                    /*
+                     Buildings that were changed in OSM keep their ID
+                     */
+                    UPDATE public.building_store a
+                    SET building_key = b.building_key,
+                        house = b.house,
+                        geom = b.geom,
+                        geom_hash = b.geom_hash,
+                        country = b.country
+                    FROM osm_buildings b
+                    WHERE b.osm_id = a.osm_id
+                      AND b.part = a.part
+                      AND (a.building_key, a.house, a.geom_hash, a.country)
+                          IS DISTINCT FROM (b.building_key, b.house, b.geom_hash, b.country);
+
+                    /*
+                     New buildings get consecutive IDs in the order of their OSM ID, such that the same OSM data
+                     always leads to the same IDs
+                     */
+                    INSERT INTO public.building_store (id, osm_id, part, building_key, house, geom, geom_hash, country)
+                    SELECT  (SELECT COALESCE(MAX(id), 0) FROM public.building_store)
+                                + ROW_NUMBER() OVER (ORDER BY b.osm_id, b.part) AS id,
+                            b.osm_id,
+                            b.part,
+                            b.building_key,
+                            b.house,
+                            b.geom,
+                            b.geom_hash,
+                            b.country
+                    FROM osm_buildings b
+                    WHERE NOT EXISTS (
+                        SELECT 1
+                        FROM public.building_store a
+                        WHERE a.osm_id = b.osm_id
+                          AND a.part = b.part
+                    );
+
+                    PERFORM public.telemetry('update_building_store', start_time,
+                                             jsonb_build_object('buildings', (SELECT COUNT(1) FROM osm_buildings)));
+
+                    DROP TABLE IF EXISTS osm_buildings;
                 END;
         $$ LANGUAGE plpgsql;
     '''
@@ -11,7 +11,21 @@ def features():
 
 CREATE OR REPLACE FUNCTION public.features(n_hop BOOLEAN)
     RETURNS void AS $$
-        DECLARE counter INTEGER;
+        BEGIN
+            PERFORM public.features_prepare(n_hop);
+            PERFORM public.building_level();
+            PERFORM public.block_level();
+            PERFORM public.land_use();
+            PERFORM public.degurba();
+            PERFORM public.features_assemble(n_hop);
+        END;
+$$ LANGUAGE plpgsql;
+
+/*
+ Buildings for which features are computed (all nodes of the subgraphs)
+ */
+CREATE OR REPLACE FUNCTION public.features_prepare(n_hop BOOLEAN)
+    RETURNS void AS $$
         BEGIN
             IF n_hop = true THEN
                 DROP TABLE IF EXISTS buildings_with_features;
@@ -53,12 +67,21 @@ CREATE OR REPLACE FUNCTION public.features(n_hop BOOLEAN)
             END IF;
 
             CREATE INDEX ON buildings_with_features USING gist(geom);
-            
-            PERFORM public.building_level();
-            PERFORM public.block_level();
-            PERFORM public.land_use();
-            PERFORM public.degurba();
-            
+        END;
+$$ LANGUAGE plpgsql;
+
+/*
+ Join all features of the buildings and attach labels
+ */
+CREATE OR REPLACE FUNCTION public.features_assemble(n_hop BOOLEAN, hops_in_db BOOLEAN DEFAULT true)
+    RETURNS void AS $$
+        DECLARE counter INTEGER;
+                start_time TIMESTAMPTZ := clock_timestamp();
+                -- Row counts of the inserts, for the telemetry of the loop (no scans of the growing tables)
+                inserted BIGINT;
+                num_nodes BIGINT;
+                num_rows BIGINT;
+        BEGIN
             IF n_hop = true THEN
                 DROP TABLE IF EXISTS aux_tab;
                 CREATE TEMP TABLE aux_tab AS
@@ -200,84 +223,108 @@ CREATE OR REPLACE FUNCTION public.features(n_hop BOOLEAN)
                 );
                 
                 /*
-                Mark hops of nodes (from center node of subgraph)
+                Mark hops of nodes (from center node of subgraph).
+                If `hops_in_db` is false, the hops are computed when the dataset is exported (see `GNNDataset`).
                 */
-                DROP TABLE IF EXISTS nodes_hops;
-                CREATE TEMP TABLE nodes_hops
-                (
-                    id                  INTEGER,
-                    hop                 INTEGER
-                );
+                IF hops_in_db THEN
+                    DROP TABLE IF EXISTS nodes_hops;
+                    CREATE TEMP TABLE nodes_hops
+                    (
+                        id                  INTEGER,
+                        hop                 INTEGER
+                    );
                 
-                DROP TABLE IF EXISTS cur_nodes;
-                CREATE TEMP TABLE cur_nodes AS
-                (
-                    SELECT new_id AS id
-                    FROM node_features_tmp
-                    WHERE center_mask = true
-                );
+                    DROP TABLE IF EXISTS cur_nodes;
+                    CREATE TEMP TABLE cur_nodes AS
+                    (
+                        SELECT new_id AS id
+                        FROM node_features_tmp
+                        WHERE center_mask = true
+                    );
                 
-                INSERT INTO nodes_hops (id, hop)
-                SELECT id, 0 FROM cur_nodes;
+                    INSERT INTO nodes_hops (id, hop)
+                    SELECT id, 0 FROM cur_nodes;
+                    GET DIAGNOSTICS num_nodes = ROW_COUNT;
+                    num_rows := (SELECT COUNT(1) FROM node_features_tmp);
                 
-                counter := 0;
-                LOOP 
+                    counter := 0;
+                    LOOP 
                     
-                    counter := counter + 1;   
+                        counter := counter + 1;   
                     
-                    DROP TABLE IF EXISTS new_cur_nodes;
-                    CREATE TEMP TABLE new_cur_nodes AS
-                    (
-                        SELECT end_id AS id
-                        FROM edges
-                        WHERE start_id IN (SELECT id FROM cur_nodes)
-                        UNION
-                        SELECT start_id AS id
-                        FROM edges
-                        WHERE end_id IN (SELECT id FROM cur_nodes)
-                    );
+                        DROP TABLE IF EXISTS new_cur_nodes;
+                        CREATE TEMP TABLE new_cur_nodes AS
+                        (
+                            SELECT end_id AS id
+                            FROM edges
+                            WHERE start_id IN (SELECT id FROM cur_nodes)
+                            UNION
+                            SELECT start_id AS id
+                            FROM edges
+                            WHERE end_id IN (SELECT id FROM cur_nodes)
+                        );
                     
-                    DROP TABLE IF EXISTS unseen_nodes;
-                    CREATE TEMP TABLE unseen_nodes AS
-                    (
-                        SELECT id
-                        FROM new_cur_nodes
-                        WHERE id NOT IN (
+                        DROP TABLE IF EXISTS unseen_nodes;
+                        CREATE TEMP TABLE unseen_nodes AS
+                        (
                             SELECT id
-                            FROM nodes_hops
-                        )
-                    );
+                            FROM new_cur_nodes
+                            WHERE id NOT IN (
+                                SELECT id
+                                FROM nodes_hops
+                            )
+                        );
                     
-                    IF (SELECT COUNT(1) FROM unseen_nodes) = 0 THEN
-                        EXIT;
-                    END IF;
+                        INSERT INTO nodes_hops(id, hop)
+                        SELECT id, counter FROM new_cur_nodes
+                        WHERE id IN (SELECT id FROM unseen_nodes);
+                        GET DIAGNOSTICS inserted = ROW_COUNT;
+
+                        IF inserted = 0 THEN
+                            EXIT;
+                        END IF;
+                        num_nodes := num_nodes + inserted;
 
-                    INSERT INTO nodes_hops(id, hop)
-                    SELECT id, counter FROM new_cur_nodes
-                    WHERE id IN (SELECT id FROM unseen_nodes);
+                        PERFORM public.telemetry('features_assemble', start_time,
+                                                 jsonb_build_object('loop', 'hops',
+                                                                    'iteration', counter,
+                                                                    'new_nodes', inserted,
+                                                                    'nodes', num_nodes,
+                                                                    'rows', num_rows));
                     
-                    DROP TABLE IF EXISTS cur_nodes;
-                    CREATE TEMP TABLE cur_nodes AS
-                    (
-                        SELECT id FROM new_cur_nodes
-                    );             
-                END LOOP;
+                        DROP TABLE IF EXISTS cur_nodes;
+                        CREATE TEMP TABLE cur_nodes AS
+                        (
+                            SELECT id FROM new_cur_nodes
+                        );             
+                    END LOOP;
                 
-                DROP TABLE IF EXISTS node_features;
-                CREATE TEMP TABLE node_features AS
-                (
-                    SELECT  footprint_area, perimeter, phi, longest_axis_length, elongation, convexity, orientation, corners, shared_wall_length, count_touches,
-                            block_length, av_block_footprint_area, std_block_footprint_area, block_total_footprint_area, block_perimeter, block_longest_axis_length, block_elongation, block_convexity, block_orientation, block_corners,
-                            ua_coverage, land_cover_ua_clc, degurba, country, osm_id, center_mask, center_id,
-                            hop, geom, lon, lat, a.id, new_id
-                    FROM node_features_tmp a
-                    JOIN (
-                        SELECT  id,
-                                hop
-                        FROM nodes_hops
-                    ) b
-                    ON a.new_id = b.id
-                );
+                    DROP TABLE IF EXISTS node_features;
+                    CREATE TEMP TABLE node_features AS
+                    (
+                        SELECT  footprint_area, perimeter, phi, longest_axis_length, elongation, convexity, orientation, corners, shared_wall_length, count_touches,
+                                block_length, av_block_footprint_area, std_block_footprint_area, block_total_footprint_area, block_perimeter, block_longest_axis_length, block_elongation, block_convexity, block_orientation, block_corners,
+                                ua_coverage, land_cover_ua_clc, degurba, country, osm_id, center_mask, center_id,
+                                hop, geom, lon, lat, a.id, new_id
+                        FROM node_features_tmp a
+                        JOIN (
+                            SELECT  id,
+                                    hop
+                            FROM nodes_hops
+                        ) b
+                        ON a.new_id = b.id
+                    );
+                ELSE
+                    DROP TABLE IF EXISTS node_features;
+                    CREATE TEMP TABLE node_features AS
+                    (
+                        SELECT  footprint_area, perimeter, phi, longest_axis_length, elongation, convexity, orientation, corners, shared_wall_length, count_touches,
+                                block_length, av_block_footprint_area, std_block_footprint_area, block_total_footprint_area, block_perimeter, block_longest_axis_length, block_elongation, block_convexity, block_orientation, block_corners,
+                                ua_coverage, land_cover_ua_clc, degurba, country, osm_id, center_mask, center_id,
+                                NULL::INTEGER AS hop, geom, lon, lat, id, new_id
+                        FROM node_features_tmp
+                    );
+                END IF;
                 
                 
             END IF;
@@ -298,6 +345,10 @@ CREATE OR REPLACE FUNCTION public.features(n_hop BOOLEAN)
                 LEFT JOIN buildings_with_labels b
                 USING (id)
             );
+
+            PERFORM public.telemetry('features_assemble', start_time,
+                                     jsonb_build_object('rows', (SELECT COUNT(1) FROM node_features_with_labels),
+                                                        'edges', (SELECT COUNT(1) FROM edges)));
         END;
 $$ LANGUAGE plpgsql;
     '''
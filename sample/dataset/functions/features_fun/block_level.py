@@ -9,112 +9,146 @@ def block_level():
          |---------------------------------------------------------------------------------------------------------------------|
         */
 
-        CREATE OR REPLACE FUNCTION public.block_level()
+        CREATE OR REPLACE FUNCTION public.block_level(interacting_in_db BOOLEAN DEFAULT true,
+                                                      blocks_in_db BOOLEAN DEFAULT true)
             RETURNS void AS $$
+                DECLARE start_time TIMESTAMPTZ := clock_timestamp();
                 BEGIN
                     /*
                      Create all blocks that belong to the buildings of interest.
                      We have to consider all buildings in the region here.
+                     If `blocks_in_db` is false, the buildings were already assigned to blocks outside of the DB
+                     (TEMP table `building_blocks`).
                      */
-                    DROP TABLE IF EXISTS blocks_w_duplicated;
-                    CREATE TEMP TABLE blocks_w_duplicated AS
-                    (
-                        SELECT  ROW_NUMBER() OVER() AS entry_id,
-                                block_clusters_w_buffer.id AS block_id,
-                                block_clusters_w_buffer.geom AS geom
-                        FROM (
-                            SELECT ROW_NUMBER() OVER () AS id,
-                                   ST_MakeValid(ST_Buffer(geom, 0.17), 'method=structure') AS geom
+                    IF blocks_in_db THEN
+                        DROP TABLE IF EXISTS blocks_w_duplicated;
+                        CREATE TEMP TABLE blocks_w_duplicated AS
+                        (
+                            SELECT  ROW_NUMBER() OVER() AS entry_id,
+                                    block_clusters_w_buffer.id AS block_id,
+                                    block_clusters_w_buffer.geom AS geom
                             FROM (
-                                SELECT UNNEST(ST_ClusterWithin(geom, 0.35)) AS geom
+                                SELECT ROW_NUMBER() OVER () AS id,
+                                       ST_MakeValid(ST_Buffer(geom, 0.17), 'method=structure') AS geom
                                 FROM (
-                                    SELECT geom
-                                    FROM buildings
-                                ) buildings
-                            ) block_clusters
-                        ) block_clusters_w_buffer
-                        JOIN (
-                            SELECT *
-                            FROM buildings_with_features
-                        ) dataset
-                        ON ST_Within(dataset.geom, block_clusters_w_buffer.geom)
-                    );
+                                    SELECT UNNEST(ST_ClusterWithin(geom, 0.35)) AS geom
+                                    FROM (
+                                        SELECT geom
+                                        FROM buildings
+                                    ) buildings
+                                ) block_clusters
+                            ) block_clusters_w_buffer
+                            JOIN (
+                                SELECT *
+                                FROM buildings_with_features
+                            ) dataset
+                            ON ST_Within(dataset.geom, block_clusters_w_buffer.geom)
+                        );
 
-                    DROP TABLE IF EXISTS blocks;
-                    CREATE TEMP TABLE blocks AS
-                    (
-                        SELECT block_id AS id,
-                               geom
-                        FROM blocks_w_duplicated
-                        WHERE entry_id IN (
-                            SELECT MIN(entry_id)
+                        DROP TABLE IF EXISTS blocks;
+                        CREATE TEMP TABLE blocks AS
+                        (
+                            SELECT block_id AS id,
+                                   geom
                             FROM blocks_w_duplicated
-                            GROUP BY block_id)
-                    );
+                            WHERE entry_id IN (
+                                SELECT MIN(entry_id)
+                                FROM blocks_w_duplicated
+                                GROUP BY block_id)
+                        );
 
-                    CREATE INDEX ON blocks USING gist(geom);
+                        CREATE INDEX ON blocks USING gist(geom);
 
-                    /*
-                     Get all buildings within these blocks
-                     */
-                    DROP TABLE IF EXISTS all_buildings_within_blocks;
-                    CREATE TEMP TABLE all_buildings_within_blocks AS
-                    (
-                        SELECT a.id,
-                               a.geom,
-                               ST_Area(a.geom) AS footprint_area,
-                               b.id AS block_id
-                        FROM (
-                            SELECT *
-                            FROM buildings
-                        ) a
-                        JOIN (
-                            SELECT *
-                            FROM blocks
-                            LIMIT (SELECT COUNT(1) FROM blocks)
-                        ) b
-                        ON ST_Within(a.geom, b.geom)
-                    );
+                        /*
+                         Get all buildings within these blocks
+                         */
+                        DROP TABLE IF EXISTS all_buildings_within_blocks;
+                        CREATE TEMP TABLE all_buildings_within_blocks AS
+                        (
+                            SELECT a.id,
+                                   a.geom,
+                                   ST_Area(a.geom) AS footprint_area,
+                                   b.id AS block_id
+                            FROM (
+                                SELECT *
+                                FROM buildings
+                            ) a
+                            JOIN (
+                                SELECT *
+                                FROM blocks
+                                LIMIT (SELECT COUNT(1) FROM blocks)
+                            ) b
+                            ON ST_Within(a.geom, b.geom)
+                        );
+                    ELSE
+                        DROP TABLE IF EXISTS blocks;
+                        CREATE TEMP TABLE blocks AS
+                        (
+                            SELECT a.block_id AS id,
+                                   ST_MakeValid(ST_Buffer(ST_Collect(b.geom), 0.17), 'method=structure') AS geom
+                            FROM building_blocks a
+                            JOIN buildings b
+                            ON a.id = b.id
+                            GROUP BY a.block_id
+                        );
+
+                        CREATE INDEX ON blocks USING gist(geom);
+
+                        DROP TABLE IF EXISTS all_buildings_within_blocks;
+                        CREATE TEMP TABLE all_buildings_within_blocks AS
+                        (
+                            SELECT b.id,
+                                   b.geom,
+                                   ST_Area(b.geom) AS footprint_area,
+                                   a.block_id
+                            FROM building_blocks a
+                            JOIN buildings b
+                            ON a.id = b.id
+                        );
+                    END IF;
 
                     CREATE INDEX ON all_buildings_within_blocks USING gist(geom);
 
                     /*
                      Compute shared wall length and number of touching buildings for all buildings in the graphs
+                     If `interacting_in_db` is false, the table was already computed outside of the DB.
                      */
-                    DROP TABLE IF EXISTS building_level_features_interacting_blocks;
-                    CREATE TEMP TABLE building_level_features_interacting_blocks AS
-                    (
-                        SELECT  id,
-                                CASE
-                                    WHEN shared_wall_length IS NULL THEN 0.0
-                                    ELSE shared_wall_length
-                                END AS shared_wall_length,
-                               CASE
-                                    WHEN count_touches IS NULL THEN 0.0
-                                    ELSE count_touches
-                                END AS count_touches
-                        FROM (
-                            SELECT id
-                            FROM buildings_with_features
-                        ) a
-                        LEFT JOIN (
-                            SELECT  a.id,
-                                    SUM(ST_Length(ST_Intersection(exterior_ring, b.geom))) AS shared_wall_length,
-                                    COUNT(*) AS count_touches
+                    IF interacting_in_db THEN
+                        DROP TABLE IF EXISTS building_level_features_interacting_blocks;
+                        CREATE TEMP TABLE building_level_features_interacting_blocks AS
+                        (
+                            SELECT  id,
+                                    CASE
+                                        WHEN shared_wall_length IS NULL THEN 0.0
+                                        ELSE shared_wall_length
+                                    END AS shared_wall_length,
+                                   CASE
+                                        WHEN count_touches IS NULL THEN 0.0
+                                        ELSE count_touches
+                                    END AS count_touches
                             FROM (
-                                SELECT *, ST_Boundary(ST_Buffer(geom, 0.35)) AS exterior_ring
-                                FROM all_buildings_within_blocks
+                                SELECT id
+                                FROM buildings_with_features
                             ) a
                             LEFT JOIN (
-                                SELECT id, geom
-                                FROM all_buildings_within_blocks
+                                SELECT  a.id,
+                                        SUM(ST_Length(ST_Intersection(exterior_ring, b.geom))) AS shared_wall_length,
+                                        COUNT(*) AS count_touches
+                                FROM (
+                                    SELECT *, ST_Boundary(ST_Buffer(geom, 0.35)) AS exterior_ring
+                                    FROM all_buildings_within_blocks
+                                ) a
+                                LEFT JOIN (
+                                    SELECT id, geom
+                                    FROM all_buildings_within_blocks
+                                ) b
+                                ON ST_Intersects(exterior_ring, b.geom)
+                                WHERE a.id <> b.id
+                                GROUP BY a.id
                             ) b
-                            ON ST_Intersects(exterior_ring, b.geom)
-                            WHERE a.id <> b.id
-                            GROUP BY a.id
-                        ) b
-                        USING (id)
-                    );
+                            USING (id)
+                        );
+                    END IF;
 
                     DROP TABLE IF EXISTS block_level_features_interacting_buildings;
                     CREATE TEMP TABLE block_level_features_interacting_buildings AS
@@ -169,63 +203,31 @@ def block_level():
                         FROM blocks
                     );
 
-                    DROP TABLE IF EXISTS bounding_box_aux;
-                    CREATE TEMP TABLE bounding_box_aux AS (
-                        WITH segments AS
-                        (
-                            SELECT DISTINCT id, ST_Azimuth(sp, ep)::NUMERIC % (0.5 * pi())::NUMERIC AS angle, geom
-                            FROM (
-                                SELECT id,
-                                   ST_PointN(geom, generate_series(1, ST_NPoints(geom)-1)) AS sp,
-                                   ST_PointN(geom, generate_series(2, ST_NPoints(geom)  )) AS ep, geom
-                                FROM (
-                                    SELECT id, ST_ExteriorRing(convex_hull) AS geom
-                                    FROM convex_hulls
-                                ) AS ls
-                            ) AS seg
-                        ),
-                        envelopes AS
-                        (
-                            SELECT id, angle, st_envelope(st_rotate(geom, angle)) AS envelope
-                            FROM segments
-                        ),
-                        selectedboundingbox AS
-                        (
-                            SELECT DISTINCT ON (id) id, angle, envelope, st_area(envelope) AS min_area
-                            FROM envelopes
-                            ORDER BY id, st_area(envelope) ASC
-                        )
-                        SELECT id,
-                               ST_Rotate(envelope, -angle) AS boundingbox
-                        FROM selectedboundingbox
-                    );
-
-                    DROP TABLE IF EXISTS exterior_ring_rectangle;
-                    CREATE TEMP TABLE exterior_ring_rectangle AS
-                    (
-                        SELECT id,
-                               ST_ExteriorRing(boundingbox) AS exterior_ring_rectangle
-                        FROM bounding_box_aux
-                    );
-
-                    DROP TABLE IF EXISTS angles;
-                    CREATE TEMP TABLE angles AS
-                    (
-                        SELECT  id,
-                                ST_PointN(exterior_ring_rectangle,1) AS angle_1,
-                                ST_PointN(exterior_ring_rectangle,2) AS angle_2,
-                                ST_PointN(exterior_ring_rectangle,3) AS angle_3,
-                                ST_PointN(exterior_ring_rectangle,4) AS angle_4
-                        FROM exterior_ring_rectangle
-                    );
-
-                    DROP TABLE IF EXISTS length_axis;
-                    CREATE TEMP TABLE length_axis AS
+                    /*
+                     Minimum-area rectangle of every convex hull in one pass (rotating calipers in GEOS), instead of
+                     one rotated envelope per hull segment. Degenerate hulls (points, lines) have no rectangle.
+                     */
+                    DROP TABLE IF EXISTS oriented_envelopes;
+                    CREATE TEMP TABLE oriented_envelopes AS
                     (
                         SELECT  id,
+                                angle_1,
+                                angle_2,
+                                angle_4,
                                 ST_Distance(angle_1, angle_4) AS length_axis_1_to_4,
                                 ST_Distance(angle_1, angle_2) AS length_axis_1_to_2
-                        FROM angles
+                        FROM (
+                            SELECT  id,
+                                    ST_PointN(exterior_ring_rectangle, 1) AS angle_1,
+                                    ST_PointN(exterior_ring_rectangle, 2) AS angle_2,
+                                    ST_PointN(exterior_ring_rectangle, 4) AS angle_4
+                            FROM (
+                                SELECT id,
+                                       ST_ExteriorRing(ST_OrientedEnvelope(convex_hull)) AS exterior_ring_rectangle
+                                FROM convex_hulls
+                            ) rectangles
+                            WHERE exterior_ring_rectangle IS NOT NULL
+                        ) corners_rectangle
                     );
 
                     DROP TABLE IF EXISTS corners;
@@ -300,7 +302,7 @@ def block_level():
                                 END AS elongation,
                                 footprint_area / ST_Area(convex_hull) AS convexity,
                                 CASE
-                                    WHEN ST_Distance(angle_1, angle_4) <= ST_Distance(angle_1, angle_2) THEN ABS(MOD(((DEGREES(ST_Azimuth(angle_1, angle_2))) + 45)::NUMERIC, 90) - 45)
+                                    WHEN length_axis_1_to_4 <= length_axis_1_to_2 THEN ABS(MOD(((DEGREES(ST_Azimuth(angle_1, angle_2))) + 45)::NUMERIC, 90) - 45)
                                     ELSE ABS(MOD(((DEGREES(ST_Azimuth(angle_1, angle_4))) + 45)::NUMERIC, 90) - 45)
                                 END AS orientation,
                                 corners AS corners
@@ -316,12 +318,8 @@ def block_level():
                         ) ar
                         USING (id)
                         JOIN (
-                            SELECT * FROM angles
-                        ) ang
-                        USING (id)
-                        JOIN (
-                            SELECT * FROM length_axis
-                        ) lenax
+                            SELECT * FROM oriented_envelopes
+                        ) env
                         USING (id)
                         JOIN (
                             SELECT * FROM corners
@@ -347,7 +345,11 @@ def block_level():
                             SELECT * FROM block_level_features_for_blocks
                         ) b
                         ON a.block_id = b.id
-                    );        
+                    );
+
+                    PERFORM public.telemetry('block_level', start_time,
+                                             jsonb_build_object('blocks', (SELECT COUNT(1) FROM blocks),
+                                                                'rows', (SELECT COUNT(1) FROM block_level_features)));
                 END;
         $$ LANGUAGE plpgsql;
     '''
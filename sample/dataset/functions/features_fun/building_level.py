@@ -11,6 +11,7 @@ def building_level():
 
         CREATE OR REPLACE FUNCTION public.building_level()
             RETURNS void AS $$
+                DECLARE start_time TIMESTAMPTZ := clock_timestamp();
                 BEGIN
                     /*
                      In the following, the shape indicators (like area, perimeter...) are computed
@@ -32,63 +33,31 @@ def building_level():
                         FROM buildings_with_features
                     );
 
-                    DROP TABLE IF EXISTS bounding_box_aux;
-                    CREATE TEMP TABLE bounding_box_aux AS (
-                        WITH segments AS
-                        (
-                            SELECT DISTINCT id, ST_Azimuth(sp, ep)::NUMERIC % (0.5 * pi())::NUMERIC AS angle, geom
-                            FROM (
-                                SELECT id,
-                                   ST_PointN(geom, generate_series(1, ST_NPoints(geom)-1)) AS sp,
-                                   ST_PointN(geom, generate_series(2, ST_NPoints(geom)  )) AS ep, geom
-                                FROM (
-                                    SELECT id, ST_ExteriorRing(convex_hull) AS geom
-                                    FROM convex_hulls
-                                ) AS ls
-                            ) AS seg
-                        ),
-                        envelopes AS
-                        (
-                            SELECT id, angle, st_envelope(st_rotate(geom, angle)) AS envelope
-                            FROM segments
-                        ),
-                        selectedboundingbox AS
-                        (
-                            SELECT DISTINCT ON (id) id, angle, envelope, st_area(envelope) AS min_area
-                            FROM envelopes
-                            ORDER BY id, st_area(envelope) ASC
-                        )
-                        SELECT id,
-                               ST_Rotate(envelope, -angle) AS boundingbox
-                        FROM selectedboundingbox
-                    );
-
-                    DROP TABLE IF EXISTS exterior_ring_rectangle;
-                    CREATE TEMP TABLE exterior_ring_rectangle AS
-                    (
-                        SELECT id,
-                               ST_ExteriorRing(boundingbox) AS exterior_ring_rectangle
-                        FROM bounding_box_aux
-                    );
-
-                    DROP TABLE IF EXISTS angles;
-                    CREATE TEMP TABLE angles AS
-                    (
-                        SELECT  id,
-                                ST_PointN(exterior_ring_rectangle,1) AS angle_1,
-                                ST_PointN(exterior_ring_rectangle,2) AS angle_2,
-                                ST_PointN(exterior_ring_rectangle,3) AS angle_3,
-                                ST_PointN(exterior_ring_rectangle,4) AS angle_4
-                        FROM exterior_ring_rectangle
-                    );
-
-                    DROP TABLE IF EXISTS length_axis;
-                    CREATE TEMP TABLE length_axis AS
+                    /*
+                     Minimum-area rectangle of every convex hull in one pass (rotating calipers in GEOS), instead of
+                     one rotated envelope per hull segment. Degenerate hulls (points, lines) have no rectangle.
+                     */
+                    DROP TABLE IF EXISTS oriented_envelopes;
+                    CREATE TEMP TABLE oriented_envelopes AS
                     (
                         SELECT  id,
+                                angle_1,
+                                angle_2,
+                                angle_4,
                                 ST_Distance(angle_1, angle_4) AS length_axis_1_to_4,
                                 ST_Distance(angle_1, angle_2) AS length_axis_1_to_2
-                        FROM angles
+                        FROM (
+                            SELECT  id,
+                                    ST_PointN(exterior_ring_rectangle, 1) AS angle_1,
+                                    ST_PointN(exterior_ring_rectangle, 2) AS angle_2,
+                                    ST_PointN(exterior_ring_rectangle, 4) AS angle_4
+                            FROM (
+                                SELECT id,
+                                       ST_ExteriorRing(ST_OrientedEnvelope(convex_hull)) AS exterior_ring_rectangle
+                                FROM convex_hulls
+                            ) rectangles
+                            WHERE exterior_ring_rectangle IS NOT NULL
+                        ) corners_rectangle
                     );
 
                     DROP TABLE IF EXISTS corners;
@@ -163,7 +132,7 @@ def building_level():
                                 END AS elongation,
                                 footprint_area / ST_Area(convex_hull) AS convexity,
                                 CASE
-                                    WHEN ST_Distance(angle_1, angle_4) <= ST_Distance(angle_1, angle_2) THEN ABS(MOD(((DEGREES(ST_Azimuth(angle_1, angle_2))) + 45)::NUMERIC, 90) - 45)
+                                    WHEN length_axis_1_to_4 <= length_axis_1_to_2 THEN ABS(MOD(((DEGREES(ST_Azimuth(angle_1, angle_2))) + 45)::NUMERIC, 90) - 45)
                                     ELSE ABS(MOD(((DEGREES(ST_Azimuth(angle_1, angle_4))) + 45)::NUMERIC, 90) - 45)
                                 END AS orientation,
                                 corners AS corners
@@ -179,18 +148,17 @@ def building_level():
                         ) ar
                         USING (id)
                         JOIN (
-                            SELECT * FROM angles
-                        ) ang
-                        USING (id)
-                        JOIN (
-                            SELECT * FROM length_axis
-                        ) lenax
+                            SELECT * FROM oriented_envelopes
+                        ) env
                         USING (id)
                         JOIN (
                             SELECT * FROM corners
                         ) corn
                         USING (id)
-                    );                   
+                    );
+
+                    PERFORM public.telemetry('building_level', start_time,
+                                             jsonb_build_object('rows', (SELECT COUNT(1) FROM building_level_features)));
                 END;
         $$ LANGUAGE plpgsql;
     '''
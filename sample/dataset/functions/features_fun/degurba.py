@@ -9,26 +9,45 @@ def degurba():
          |---------------------------------------------------------------------------------------------------------------------|
         */
 
-        CREATE OR REPLACE FUNCTION public.degurba()
+        CREATE OR REPLACE FUNCTION public.degurba(degurba_in_db BOOLEAN DEFAULT true)
             RETURNS void AS $$
+                DECLARE start_time TIMESTAMPTZ := clock_timestamp();
                 BEGIN
+                    /*
+                     If `degurba_in_db` is false, the labels of buildings that are not at a region border were already
+                     read from the raster (TEMP table `degurba_lookup`, see `sample.dataset.rasters`). Only the other
+                     buildings are joined with the DEGURBA polygons.
+                     */
+                    IF degurba_in_db THEN
+                        DROP TABLE IF EXISTS degurba_lookup;
+                        CREATE TEMP TABLE degurba_lookup (id INTEGER, degurba TEXT);
+                    END IF;
+
                     DROP TABLE IF EXISTS degurba_category;
                     CREATE TEMP TABLE degurba_category AS
                     (
                         SELECT  ROW_NUMBER() OVER() AS id_new,
-                                a.id,
-                                b.degurba_label::TEXT AS degurba
+                                id,
+                                degurba
                         FROM (
-                            SELECT *
-                            FROM buildings_with_features
-                        ) a
-                        LEFT JOIN (
-                            SELECT  geom,
-                                    degurba_label,
-                                    lau_id
-                            FROM public.degurba
-                        ) b
-                        ON ST_Intersects(a.geom, b.geom)
+                            SELECT  a.id,
+                                    b.degurba_label::TEXT AS degurba
+                            FROM (
+                                SELECT *
+                                FROM buildings_with_features
+                                WHERE id NOT IN (SELECT id FROM degurba_lookup)
+                            ) a
+                            LEFT JOIN (
+                                SELECT  geom,
+                                        degurba_label,
+                                        lau_id
+                                FROM public.degurba
+                            ) b
+                            ON ST_Intersects(a.geom, b.geom)
+                            UNION ALL
+                            SELECT id, degurba
+                            FROM degurba_lookup
+                        ) oa
                     );
                     
                     /*
@@ -72,6 +91,9 @@ def degurba():
                     
                     ALTER TABLE degurba_category 
                     DROP COLUMN id_new;
+
+                    PERFORM public.telemetry('degurba', start_time,
+                                             jsonb_build_object('rows', (SELECT COUNT(1) FROM degurba_category)));
                 END;
         $$ LANGUAGE plpgsql;
     '''
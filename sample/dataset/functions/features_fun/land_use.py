@@ -9,50 +9,42 @@ def land_use():
          |---------------------------------------------------------------------------------------------------------------------|
         */
 
-        CREATE OR REPLACE FUNCTION public.land_use()
+        CREATE OR REPLACE FUNCTION public.land_use(clc_in_db BOOLEAN DEFAULT true)
             RETURNS void AS $$
+                DECLARE start_time TIMESTAMPTZ := clock_timestamp();
                 BEGIN
-                     /*
-                     Compute land use class from urban atlas
+                    /*
+                     Compute land use class from urban atlas.
+                     The UA polygons are subdivided (`public.ua_subdivided`), the intersection areas of the pieces of
+                     a polygon are summed up. Buildings within a piece are covered by it, their intersection is not
+                     computed.
                      */
-                    DROP TABLE IF EXISTS ua_extract;
-                    CREATE TEMP TABLE ua_extract AS (
-                        SELECT *
-                        FROM (
-                            SELECT a.code_2018,
-                                   a.geom
-                            FROM public.urban_atlas a
-                            -- Unimportant transport units that lead to bad performance -> exclude them
-                            WHERE NOT code_2018 = ANY(ARRAY['12210', '12220'])
-                        ) oa
-                        WHERE ST_GeometryType(geom) = 'ST_Polygon'
-                    );
-                    
-                    CREATE INDEX ON ua_extract USING gist(geom);
-                    
                     DROP TABLE IF EXISTS urban_atlas_category;
                     CREATE TEMP TABLE urban_atlas_category AS
                     (
                         WITH spatial_join AS (
-                            SELECT *
+                            SELECT id,
+                                   poly_id,
+                                   ua,
+                                   SUM(intersection_area) AS intersection_area
                             FROM (
                                 SELECT a.id,
-                                       c.*,
-                                       ST_Area(ST_Intersection(a.geom, b.geom)) as intersection_area
+                                       b.poly_id,
+                                       b.ua,
+                                       CASE
+                                           WHEN ST_Within(a.geom, b.geom) THEN ST_Area(a.geom)
+                                           ELSE ST_Area(ST_Intersection(a.geom, b.geom))
+                                       END AS intersection_area
                                 FROM (
                                     SELECT * FROM buildings_with_features LIMIT (SELECT COUNT(1) FROM buildings_with_features)
                                 ) a
                                 JOIN (
                                     SELECT *
-                                    FROM ua_extract
+                                    FROM public.ua_subdivided
                                 ) b
                                 ON ST_Intersects(a.geom, b.geom)
-                                JOIN (
-                                    SELECT *
-                                    FROM public.ua_matches
-                                ) c
-                                ON b.code_2018::INTEGER = c.ua_code
-                            ) oa
+                            ) pieces
+                            GROUP BY id, poly_id, ua
                         ),
                         largest_intersection AS (
                             SELECT id, MAX(intersection_area) AS max_intersection_area
@@ -87,23 +79,17 @@ def land_use():
                         ) ob
                         USING (id)
                     );
-                    
-                    DROP TABLE IF EXISTS clc_extract;
-                    CREATE TEMP TABLE clc_extract AS (
-                        SELECT *
-                        FROM (
-                            SELECT a.clc_code,
-                                   a.geom
-                            FROM public.clc a
-                        ) oa
-                        WHERE ST_GeometryType(geom) = 'ST_Polygon'
-                    );
-                    
-                    CREATE INDEX ON clc_extract USING gist(geom);
-                    
+
                     /*
-                     Compute land use class from CLC
+                     Compute land use class from CLC (subdivided polygons in `public.clc_subdivided`).
+                     If `clc_in_db` is false, the classes of buildings that are not at a polygon border were already
+                     read from the raster (TEMP table `clc_lookup`, see `sample.dataset.rasters`).
                      */
+                    IF clc_in_db THEN
+                        DROP TABLE IF EXISTS clc_lookup;
+                        CREATE TEMP TABLE clc_lookup (id INTEGER, clc TEXT);
+                    END IF;
+
                     DROP TABLE IF EXISTS clc_category;
                     CREATE TEMP TABLE clc_category AS (
                         WITH missing_buildings AS (
@@ -111,27 +97,35 @@ def land_use():
                             FROM buildings_with_features
                             WHERE id IN (SELECT id FROM urban_atlas_category WHERE ua_coverage = 0)
                         ),
-                        spatial_join AS (
+                        missing_buildings_vector AS (
                             SELECT *
+                            FROM missing_buildings
+                            WHERE id NOT IN (SELECT id FROM clc_lookup)
+                        ),
+                        spatial_join AS (
+                            SELECT id,
+                                   poly_id,
+                                   clc,
+                                   SUM(intersection_area) AS intersection_area
                             FROM (
                                 SELECT a.id,
-                                       c.*,
-                                       ST_Area(ST_Intersection(a.geom, b.geom)) as intersection_area
+                                       b.poly_id,
+                                       b.clc,
+                                       CASE
+                                           WHEN ST_Within(a.geom, b.geom) THEN ST_Area(a.geom)
+                                           ELSE ST_Area(ST_Intersection(a.geom, b.geom))
+                                       END AS intersection_area
                                 FROM (
                                     SELECT *
-                                    FROM missing_buildings
+                                    FROM missing_buildings_vector
                                 ) a
                                 JOIN (
                                     SELECT *
-                                    FROM clc_extract
+                                    FROM public.clc_subdivided
                                 ) b
                                 ON ST_Intersects(a.geom, b.geom)
-                                JOIN (
-                                    SELECT *
-                                    FROM public.clc_matches
-                                ) c
-                                ON b.clc_code = c.clc_code
-                            ) oa
+                            ) pieces
+                            GROUP BY id, poly_id, clc
                         ),
                         largest_intersection AS (
                             SELECT id, MAX(intersection_area) AS max_intersection_area
@@ -154,13 +148,18 @@ def land_use():
                                 b.clc AS land_cover_clc
                         FROM (
                             SELECT *
-                            FROM missing_buildings
+                            FROM missing_buildings_vector
                         ) a
                         LEFT JOIN (
                             SELECT *
                             FROM matched
                         ) b
                         USING (id)
+                        UNION ALL
+                        SELECT  id,
+                                clc AS land_cover_clc
+                        FROM clc_lookup
+                        WHERE id IN (SELECT id FROM missing_buildings)
                     );
 
                     /*
@@ -192,6 +191,9 @@ def land_use():
                     UPDATE land_cover_category
                     SET land_cover_ua_clc = 'discontinuous_very_low_urban_fabric'
                     WHERE land_cover_ua_clc IS NULL;
+
+                    PERFORM public.telemetry('land_use', start_time,
+                                             jsonb_build_object('rows', (SELECT COUNT(1) FROM land_cover_category)));
                 END;
         $$ LANGUAGE plpgsql;
     '''
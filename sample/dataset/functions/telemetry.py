@@ -0,0 +1,19 @@
+import sample.db_interaction as db
+
+
+def telemetry():
+    """
+    Report progress of the pipeline to the client (collected by `sample.dataset.telemetry.Telemetry`)
+    """
+    query = f'''
+        CREATE OR REPLACE FUNCTION public.telemetry(stage TEXT, start_time TIMESTAMPTZ, details JSONB DEFAULT '{{}}')
+            RETURNS void AS $$
+                BEGIN
+                    RAISE NOTICE 'telemetry %', jsonb_build_object(
+                        'stage', stage,
+                        'elapsed', EXTRACT(EPOCH FROM clock_timestamp() - start_time)
+                    ) || details;
+                END;
+        $$ LANGUAGE plpgsql;
+    '''
+    db.execute_statement(query)
@@ -4,7 +4,9 @@
  |---------------------------------------------------------------------------------------------------------------------|
 """
 
+import os
 import torch
+import numpy as np
 import pandas as pd
 import torch_geometric
 import time
@@ -12,6 +14,9 @@ import datetime as dt
 
 import sample.db_interaction as db
 import sample.dataset.preprocessing as pp
+import sample.dataset.copy_export as ce
+import sample.dataset.shared_nodes as sn
+import sample.dataset.spatial_index as si
 import sample.util.feature_names as fn
 import sample.dataset.sql_queries.sql_dataset as sqlds
 
@@ -19,32 +24,168 @@ pd.options.mode.copy_on_write = True
 
 
 class GNNDataset(torch_geometric.data.InMemoryDataset):
-    def __init__(self, root, type):
+    def __init__(self, root, type, export='copy', storage='expanded'):
+        """
+        :param root: folder of the dataset
+        :param type: type of subgraph: `circ` or `n_hop`
+        :param export: how tables are retrieved from DB: `copy` (streamed with COPY into preallocated tensors) or
+        `pandas` (with pd.read_sql_query)
+        :param storage: how circ subgraphs are stored: `expanded` (one row per building and subgraph) or `shared`
+        (one row per building, subgraphs as lists of nodes, see `sample.dataset.shared_nodes`)
+        """
+        if storage not in ['expanded', 'shared']:
+            raise ValueError(f'Unknown storage {storage}')
+        if storage == 'shared' and type != 'circ':
+            raise ValueError('Shared-node storage is only available for circ subgraphs')
         self.include_edges = True
         self.type = type
+        self.export = export
+        self.storage = storage
         super().__init__(root)
         self.load(self.processed_paths[0])
 
     @property
     def processed_file_names(self):
-        return ['data.pt']
+        return ['data.pt'] if self.storage == 'expanded' else ['data_shared.pt']
+
+    @property
+    def spatial_index_path(self):
+        return os.path.join(self.processed_dir, self.processed_file_names[0].replace('data', 'spatial_index')
+                            .replace('.pt', '.npz'))
+
+    @property
+    def spatial_index(self):
+        """
+        Grid index over the positions of the nodes for bounding box and radius queries (see
+        `sample.dataset.spatial_index`). Built and saved next to the dataset if it does not exist yet.
+        """
+        if getattr(self, '_spatial_index', None) is None:
+            if os.path.exists(self.spatial_index_path):
+                self._spatial_index = si.GridIndex.load(self.spatial_index_path)
+            else:
+                self._spatial_index = si.GridIndex.build(self._data.lon.numpy(), self._data.lat.numpy())
+                self._spatial_index.save(self.spatial_index_path)
+        return self._spatial_index
 
     def process(self):
         # Retrieve tables from DB
         print('Retrieving tables from DB...')
         if self.type == 'n_hop':
             db.execute_statement(sqlds.node_features_sequential_id_n_hop)
+            db.execute_statement(sqlds.edges_sequential_id_n_hop)
         elif self.type == 'circ':
             db.execute_statement(sqlds.node_features_sequential_id_circ)
+            db.execute_statement(sqlds.edges_sequential_id_circ)
+        if self.export == 'copy':
+            data = self.process_copy()
+        else:
+            data = self.process_pandas()
+        if self.storage == 'shared':
+            data = sn.compress(data)
+        db.execute_statement(sqlds.drop_tables)
+        data_list = [data]
+        self.save(data_list, self.processed_paths[0])
+        si.GridIndex.build(data.lon.numpy(), data.lat.numpy()).save(self.spatial_index_path)
+
+    def process_copy(self):
+        """
+        Stream the node and edge tables with COPY directly into preallocated arrays with the target data types.
+        Peak memory is close to the size of the final `Data` object.
+        :return: PyG data object
+        """
+        num_nodes = int(db.sql_to_float('SELECT COUNT(1) FROM public.node_features_sequential_id'))
+        num_edges = int(db.sql_to_float('SELECT COUNT(1) FROM public.edges_sequential_id'))
+        numerical_columns = fn.feature_groups_names['Building-level features'] \
+                            + fn.feature_groups_names['Block-level features'] \
+                            + fn.feature_groups_names['UA coverage']
+        categorical_columns = [('land_cover_ua_clc', 'Land cover indicators'),
+                               ('degurba', 'Urbanization indicators'),
+                               ('country', 'Country indicators')]
+        num_features = len(numerical_columns) + sum(len(fn.feature_groups_names[group])
+                                                    for _, group in categorical_columns)
+        print('Creating tensors...')
+        x = torch.zeros((num_nodes, num_features), dtype=torch.float)
+        x_np = x.numpy()
+        # Numerical features are written into the columns of the feature matrix (missing values as NaN, as in pandas)
+        select = [f"COALESCE({column}::DOUBLE PRECISION, 'NaN') AS {column}" for column in numerical_columns]
+        columns = [(column, 'float8', x_np[:, i]) for i, column in enumerate(numerical_columns)]
+        # Categorical features are retrieved as the index of their category
+        for column, group in categorical_columns:
+            categories = ', '.join(f"'{category}'" for category in fn.feature_groups_names[group])
+            select.append(f'COALESCE(ARRAY_POSITION(ARRAY[{categories}], {column}::TEXT) - 1, -1)::SMALLINT '
+                          f'AS {column}')
+            columns.append((column, 'int2', np.int16))
+        select += ['center_mask', 'osm_id::BIGINT AS osm_id', 'lon', 'lat', 'numerical_label::BIGINT AS numerical_label',
+                   'new_id']
+        columns += [('center_mask', 'bool', bool), ('osm_id', 'int8', np.int64), ('lon', 'float8', np.float32),
+                    ('lat', 'float8', np.float32), ('numerical_label', 'int8', np.int64), ('new_id', 'int8', np.int64)]
+        if self.type == 'circ':
+            # Hops that were not computed in the DB (NULL) are computed below
+            select += ['id_orig::BIGINT AS id_orig', 'COALESCE(hop, -1)::BIGINT AS hop',
+                       'center_id::BIGINT AS center_id']
+            columns += [('id_orig', 'int8', np.int64), ('hop', 'int8', np.int64), ('center_id', 'int8', np.int64)]
+        nodes = ce.copy_to_columns(f'SELECT {", ".join(select)} FROM public.node_features_sequential_id',
+                                   columns, num_nodes, index='new_id')
+        offset = len(numerical_columns)
+        for column, group in categorical_columns:
+            pp.one_hot_encoding_array(x_np, nodes.pop(column).astype(np.int64), offset, group)
+            offset += len(fn.feature_groups_names[group])
+        edge_index = torch.empty((2, num_edges), dtype=torch.long)
+        distance = torch.empty((num_edges, 1), dtype=torch.float)
+        ce.copy_to_columns('SELECT start_id::BIGINT AS start_id, end_id::BIGINT AS end_id, '
+                           'distance::DOUBLE PRECISION AS distance FROM public.edges_sequential_id',
+                           [('start_id', 'int8', edge_index.numpy()[0]), ('end_id', 'int8', edge_index.numpy()[1]),
+                            ('distance', 'float8', distance.numpy()[:, 0])], num_edges)
+        if self.type == 'circ' and np.any(nodes['hop'] < 0):
+            print('Computing hops...')
+            nodes['hop'] = pp.hops_from_centers(edge_index.numpy()[0], edge_index.numpy()[1], nodes['center_mask'])
+            # Nodes that are not connected to their center are not part of the dataset (like in the DB)
+            keep = nodes['hop'] >= 0
+            edge_mask, start, end = pp.drop_nodes(keep, edge_index.numpy()[0], edge_index.numpy()[1])
+            x = x[torch.from_numpy(keep)]
+            x_np = x.numpy()
+            nodes = {column: values[keep] for column, values in nodes.items()}
+            edge_index = torch.from_numpy(np.stack([start, end]))
+            distance = distance[torch.from_numpy(edge_mask)]
+            num_nodes = len(x)
+        pp.scale_node_features_array(x_np, self.type)
+        distance_std = torch.from_numpy(pp.scale_edge_weights_array(distance.numpy()))
+        y = torch.from_numpy(nodes['numerical_label'])
+        print('Creating PyG dataset...')
+        data = torch_geometric.data.Data(x=x, edge_index=edge_index,
+                                         center_mask=torch.from_numpy(nodes['center_mask']), distance=distance,
+                                         distance_std=distance_std, y=y, label_mask=y != 9,
+                                         id=torch.arange(num_nodes, dtype=torch.long),
+                                         osm_id=torch.from_numpy(nodes['osm_id']),
+                                         lon=torch.from_numpy(nodes['lon']), lat=torch.from_numpy(nodes['lat']))
+        if self.type == 'circ':
+            data.id_orig = torch.from_numpy(nodes['id_orig'])
+            data.hop = torch.from_numpy(nodes['hop'])
+            data.center_id = torch.from_numpy(nodes['center_id'])
+        return data
+
+    def process_pandas(self):
+        """
+        Retrieve the node and edge tables with Pandas
+        :return: PyG data object
+        """
         node_features_with_labels = db.sql_to_df(f'SELECT * FROM public.node_features_sequential_id')
         # Add column for label mask
         node_features_with_labels['label_mask'] = node_features_with_labels['numerical_label'] != 9
-        if self.type == 'n_hop':
-            db.execute_statement(sqlds.edges_sequential_id_n_hop)
-        elif self.type == 'circ':
-            db.execute_statement(sqlds.edges_sequential_id_circ)
         edges = db.sql_to_df(f'SELECT * FROM public.edges_sequential_id')
-        db.execute_statement(sqlds.drop_tables)
+        if self.type == 'circ' and node_features_with_labels['hop'].isna().any():
+            print('Computing hops...')
+            node_features_with_labels = node_features_with_labels.sort_values('new_id').reset_index(drop=True)
+            start, end = edges['start_id'].values, edges['end_id'].values
+            node_features_with_labels['hop'] = pp.hops_from_centers(start, end,
+                                                                    node_features_with_labels['center_mask'].values)
+            # Nodes that are not connected to their center are not part of the dataset (like in the DB)
+            keep = (node_features_with_labels['hop'] >= 0).values
+            edge_mask, start, end = pp.drop_nodes(keep, start, end)
+            node_features_with_labels = node_features_with_labels[keep].reset_index(drop=True)
+            node_features_with_labels['new_id'] = np.arange(len(node_features_with_labels))
+            edges = edges[edge_mask].reset_index(drop=True)
+            edges['start_id'], edges['end_id'] = start, end
         print('Creating tensors...')
         # Create tensor for node features
         x = pp.preprocess_nodes(node_features_with_labels, False, self.type)
@@ -94,5 +235,4 @@ class GNNDataset(torch_geometric.data.InMemoryDataset):
                                              center_mask=center_mask, distance=distance,
                                              distance_std=distance_std, y=y, label_mask=label_mask, id=id, id_orig=id_orig,
                                              osm_id=osm_id, hop=hop, center_id=center_id, lon=lon, lat=lat)
-        data_list = [data]
-        self.save(data_list, self.processed_paths[0])
\ No newline at end of file
+        return data
\ No newline at end of file
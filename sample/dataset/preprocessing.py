@@ -116,4 +116,105 @@ def preprocess_edges(dataset):
     :param dataset: dataframe with the dataset
     :return: new dataframe with scaled edge features
     """
-    return scale_edge_weights(dataset)
\ No newline at end of file
+    return scale_edge_weights(dataset)
+
+
+def scale_node_features_array(x, type, rows_per_block=100000):
+    """
+    Scaling for the node features, for features that are already stored in a (preallocated) feature matrix.
+    Same as `scale_node_features`, but scales the columns in place. The statistics are computed in blocks of rows, so a
+    memory-mapped matrix is read row by row instead of once per column.
+    :param x: feature matrix (NumPy array) with the features to normalize in its first columns
+    :param type: `circ` or `n_hop` (subgraph datasets, see `GNNDataset`) or `graph` (global building graph, every
+    building once, see `sample.dataset.building_graph`). The parameters are written to
+    `sample/scaling_parameters/{type}.json`. Deployment (`scale_node_features`) reads
+    `_frac_0p004_nodes_20.json`, so the parameters of `graph` only document the scaling of the stored graph.
+    :param rows_per_block: number of rows that are read at once
+    """
+    num_features = len(fn.feature_groups_names['Building-level features']
+                       + fn.feature_groups_names['Block-level features'])
+    blocks = [slice(start, start + rows_per_block) for start in range(0, len(x), rows_per_block)]
+    # Missing values (NaN) are ignored and kept, as in sklearn's StandardScaler
+    count = np.zeros(num_features)
+    total = np.zeros(num_features)
+    for block in blocks:
+        values = x[block, :num_features].astype(np.float64)
+        count += np.sum(~np.isnan(values), axis=0)
+        total += np.nansum(values, axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+    squares = np.zeros(num_features)
+    for block in blocks:
+        squares += np.nansum((x[block, :num_features].astype(np.float64) - mean) ** 2, axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        var = squares / count
+    # Same handling of constant features as in sklearn's StandardScaler
+    std = np.where(var > 0, np.sqrt(np.where(var > 0, var, 1.0)), 1.0)
+    for block in blocks:
+        x[block, :num_features] = (x[block, :num_features] - mean) / std
+    # Write standardization parameters to JSON for later use during deployment
+    data = {'mean': mean.tolist(), 'std': std.tolist(), 'var': var.tolist()}
+    with open(f'./sample/scaling_parameters/{type}.json', 'w') as json_file:
+        json.dump(data, json_file)
+
+
+def one_hot_encoding_array(x, codes, offset, group_name):
+    """
+    Write the one-hot encoding of a categorical feature into a (preallocated, zero-initialized) feature matrix
+    :param x: feature matrix (NumPy array)
+    :param codes: index of the category of every node (position in the list of the feature group)
+    :param offset: first column of the feature group in the feature matrix
+    :param group_name: group name of the categorical feature, ex. 'Country indicators'
+    """
+    if np.any(codes < 0):
+        raise ValueError(f'Unknown category in feature group {group_name}')
+    x[np.arange(len(codes)), offset + codes] = 1.0
+
+
+def scale_edge_weights_array(distance):
+    """
+    Standardized edge weights
+    :param distance: edge weights (NumPy array)
+    :return: standardized edge weights
+    """
+    std = float(np.std(distance, dtype=np.float64))
+    return (distance - float(np.mean(distance, dtype=np.float64))) / (std if std > 0 else 1.0)
+
+
+def hops_from_centers(start, end, center_mask):
+    """
+    Hop of every node (number of edges to the center of its subgraph), like the hop loop in `public.features_assemble`.
+    Breadth-first search from all centers at once over the (undirected) edges. The subgraphs are disjoint, so every
+    node is reached from the center of its own subgraph.
+    :param start, end: node indices of the edges (NumPy arrays)
+    :param center_mask: mask of the centers (NumPy array)
+    :return: hop of every node, -1 if the node is not connected to its center
+    """
+    num_nodes = len(center_mask)
+    source = np.concatenate([start, end])
+    target = np.concatenate([end, start])[np.argsort(source, kind='stable')]
+    pointer = np.concatenate([[0], np.cumsum(np.bincount(source, minlength=num_nodes))])
+    hop = np.full(num_nodes, -1, dtype=np.int64)
+    frontier = np.flatnonzero(center_mask)
+    hop[frontier] = 0
+    counter = 0
+    while len(frontier):
+        counter += 1
+        degree = pointer[frontier + 1] - pointer[frontier]
+        position = np.repeat(pointer[frontier] - np.cumsum(degree) + degree, degree) + np.arange(degree.sum())
+        neighbors = np.unique(target[position])
+        frontier = neighbors[hop[neighbors] < 0]
+        hop[frontier] = counter
+    return hop
+
+
+def drop_nodes(keep, start, end):
+    """
+    Remove nodes from the graph and renumber the remaining nodes
+    :param keep: mask of the nodes that are kept (NumPy array)
+    :param start, end: node indices of the edges (NumPy arrays)
+    :return: mask of the edges that are kept, new start and end indices of these edges
+    """
+    index = np.cumsum(keep) - 1
+    edge_mask = keep[start] & keep[end]
+    return edge_mask, index[start[edge_mask]], index[end[edge_mask]]
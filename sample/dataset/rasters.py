@@ -0,0 +1,193 @@
+"""
+ |---------------------------------------------------------------------------------------------------------------------|
+ | DEGURBA and CLC as raster grids (EPSG:3035, one byte per cell, memory-mapped). Rasterized once (`main`), afterwards
+ | the class of a building is read from the cells of its bounding box. Buildings in cells at polygon borders are left to
+ | the exact vector join in `public.degurba` / `public.land_use`.
+ |---------------------------------------------------------------------------------------------------------------------|
+"""
+
+import os
+import json
+
+import numpy as np
+import shapely
+
+import sample.db_interaction as db
+
+default_path = './data/rasters/'
+# Cell values: 0 for cells outside of all polygons, 255 for cells at polygon borders, otherwise index of the category
+# + 1
+no_data = 0
+ambiguous = 255
+
+# Polygons and categories of every layer
+layers = {
+    'degurba': '''
+        SELECT degurba_label::TEXT AS category, ST_AsBinary(geom) AS wkb
+        FROM public.degurba
+    ''',
+    'clc': '''
+        SELECT c.clc AS category, ST_AsBinary(a.geom) AS wkb
+        FROM public.clc a
+        JOIN public.clc_matches c
+        ON a.clc_code = c.clc_code
+        WHERE ST_GeometryType(a.geom) = 'ST_Polygon'
+    '''
+}
+
+
+def rasterize(geoms, codes, x_min, y_min, shape, cell_size, grid, rows_per_block=1000):
+    """
+    Write the polygons into the grid. A cell gets the code of the polygon that contains its center. Cells that are
+    crossed by a polygon boundary (and their neighbours) or covered by polygons with different codes are ambiguous.
+    :param geoms: array of polygons
+    :param codes: code of every polygon (1 to 254)
+    :param x_min, y_min: lower left corner of the grid
+    :param shape: number of rows (y) and columns (x)
+    :param cell_size: size of the cells (in meters)
+    :param grid: array of the given shape (ex. memory-mapped), initialized with `no_data`
+    :param rows_per_block: number of rows of a polygon that are tested at once (bounds the memory)
+    """
+    bounds = shapely.bounds(geoms)
+    col_min = np.clip(np.floor((bounds[:, 0] - x_min) / cell_size).astype(np.int64), 0, shape[1] - 1)
+    col_max = np.clip(np.floor((bounds[:, 2] - x_min) / cell_size).astype(np.int64), 0, shape[1] - 1)
+    row_min = np.clip(np.floor((bounds[:, 1] - y_min) / cell_size).astype(np.int64), 0, shape[0] - 1)
+    row_max = np.clip(np.floor((bounds[:, 3] - y_min) / cell_size).astype(np.int64), 0, shape[0] - 1)
+    shapely.prepare(geoms)
+    for i, geom in enumerate(geoms):
+        cols = np.arange(col_min[i], col_max[i] + 1)
+        for start in range(row_min[i], row_max[i] + 1, rows_per_block):
+            rows = np.arange(start, min(start + rows_per_block, row_max[i] + 1))
+            col, row = np.meshgrid(cols, rows)
+            inside = shapely.contains_xy(geom, x_min + (col + 0.5) * cell_size, y_min + (row + 0.5) * cell_size)
+            col, row = col[inside], row[inside]
+            current = grid[row, col]
+            grid[row, col] = np.where(current == no_data, codes[i],
+                                      np.where(current == codes[i], current, ambiguous))
+        mark_boundary(geom, x_min, y_min, shape, cell_size, grid)
+
+
+def mark_boundary(geom, x_min, y_min, shape, cell_size, grid):
+    """
+    Mark the cells crossed by the boundary of a polygon as ambiguous: points along the boundary at most half a cell
+    apart, with the 8 neighbouring cells. Points are created per polygon, so the memory is bounded by the largest
+    polygon.
+    """
+    coords = shapely.get_coordinates(shapely.segmentize(shapely.boundary(geom), cell_size / 2))
+    col = np.floor((coords[:, 0] - x_min) / cell_size).astype(np.int64)
+    row = np.floor((coords[:, 1] - y_min) / cell_size).astype(np.int64)
+    for row_offset in [-1, 0, 1]:
+        for col_offset in [-1, 0, 1]:
+            r, c = row + row_offset, col + col_offset
+            valid = (r >= 0) & (r < shape[0]) & (c >= 0) & (c < shape[1])
+            grid[r[valid], c[valid]] = ambiguous
+
+
+def create_raster(layer, path=default_path, cell_size=100):
+    """
+    Rasterize a layer into `{layer}.npy` (grid) and `{layer}.json` (extent, cell size and categories)
+    :param layer: `degurba` or `clc`
+    :param path: folder of the rasters
+    :param cell_size: size of the cells (in meters)
+    """
+    os.makedirs(path, exist_ok=True)
+    polygons = db.sql_to_df(layers[layer])
+    categories = sorted(polygons['category'].dropna().unique().tolist())
+    if len(categories) > ambiguous - 1:
+        raise ValueError(f'Too many categories in {layer}: {len(categories)}')
+    polygons = polygons[polygons['category'].notna()]
+    # WKB as Python bytes (fixed-width NumPy strings would strip trailing zero bytes)
+    geoms = shapely.from_wkb(np.array([bytes(wkb) for wkb in polygons['wkb']], dtype=object))
+    codes = np.searchsorted(categories, polygons['category'].to_numpy()).astype(np.uint8) + 1
+    x_min, y_min, x_max, y_max = shapely.total_bounds(geoms)
+    x_min, y_min = np.floor(x_min / cell_size) * cell_size, np.floor(y_min / cell_size) * cell_size
+    shape = (int(np.ceil((y_max - y_min) / cell_size)) + 1, int(np.ceil((x_max - x_min) / cell_size)) + 1)
+    grid = np.lib.format.open_memmap(os.path.join(path, f'{layer}.npy'), mode='w+', dtype=np.uint8, shape=shape)
+    grid[:] = no_data
+    rasterize(geoms, codes, x_min, y_min, shape, cell_size, grid)
+    grid.flush()
+    with open(os.path.join(path, f'{layer}.json'), 'w') as file:
+        json.dump({'x_min': float(x_min), 'y_min': float(y_min), 'cell_size': cell_size, 'categories': categories},
+                  file)
+
+
+def load_raster(layer, path=default_path):
+    """
+    :return: memory-mapped grid, metadata (see `create_raster`)
+    """
+    with open(os.path.join(path, f'{layer}.json')) as file:
+        meta = json.load(file)
+    return np.load(os.path.join(path, f'{layer}.npy'), mmap_mode='r'), meta
+
+
+def lookup(grid, meta, x_min, x_max, y_min, y_max):
+    """
+    Codes of the buildings from all cells covered by their bounding boxes
+    :param grid, meta: raster (see `load_raster`)
+    :param x_min, x_max, y_min, y_max: bounding boxes of the buildings (arrays, EPSG:3035)
+    :return: code of every building (`ambiguous` if the cells have different codes or one of them is ambiguous)
+    """
+    col_min, col_max = [np.floor((x - meta['x_min']) / meta['cell_size']).astype(np.int64) for x in [x_min, x_max]]
+    row_min, row_max = [np.floor((y - meta['y_min']) / meta['cell_size']).astype(np.int64) for y in [y_min, y_max]]
+
+    def cells(row, col):
+        # Outside of the grid, there are no polygons
+        valid = (row >= 0) & (row < grid.shape[0]) & (col >= 0) & (col < grid.shape[1])
+        code = np.full(len(row), no_data, dtype=np.uint8)
+        code[valid] = grid[row[valid], col[valid]]
+        return code
+
+    # Bounding boxes of at most 2 x 2 cells: the corners are all cells
+    corners = [cells(row, col) for row in [row_min, row_max] for col in [col_min, col_max]]
+    codes = corners[0].copy()
+    for code in corners[1:]:
+        codes[code != codes] = ambiguous
+    # Larger bounding boxes: minimum and maximum over the window
+    for i in np.flatnonzero((row_max - row_min > 1) | (col_max - col_min > 1)):
+        if codes[i] == ambiguous:
+            continue
+        window = grid[max(row_min[i], 0):max(row_max[i] + 1, 0), max(col_min[i], 0):max(col_max[i] + 1, 0)]
+        values = [window.min(), window.max()] if window.size else []
+        if window.size < (row_max[i] - row_min[i] + 1) * (col_max[i] - col_min[i] + 1):
+            values.append(no_data)
+        codes[i] = values[0] if min(values) == max(values) else ambiguous
+    return codes
+
+
+def lookup_tables(connection, path=default_path):
+    """
+    Classes of the buildings of the current session from the rasters. Writes the TEMP tables `degurba_lookup` (id,
+    degurba) and `clc_lookup` (id, clc) for all buildings that are not at a polygon border (NULL: outside of all
+    polygons). A cell only has a class if no polygon border crosses it or its neighbours, so these buildings lie within
+    polygons of their class. The other buildings are joined with the polygons in `public.degurba` and `public.land_use`.
+    :param connection: connection of the session with the TEMP tables of the pipeline
+    :param path: folder of the rasters
+    """
+    buildings = db.sql_to_df('''
+        SELECT id, ST_XMin(geom) AS x_min, ST_XMax(geom) AS x_max, ST_YMin(geom) AS y_min, ST_YMax(geom) AS y_max
+        FROM buildings_with_features
+    ''', connection)
+    bounds = [buildings[column].to_numpy() for column in ['x_min', 'x_max', 'y_min', 'y_max']]
+    for layer, column in [('degurba', 'degurba'), ('clc', 'clc')]:
+        grid, meta = load_raster(layer, path)
+        codes = lookup(grid, meta, *bounds)
+        known = codes != ambiguous
+        categories = np.array([None] + meta['categories'], dtype=object)
+        table = buildings.loc[known, ['id']].assign(**{column: categories[codes[known]]})
+        db.df_to_temp_table(table, f'{layer}_lookup', connection, {'id': 'INTEGER', column: 'TEXT'})
+
+
+def main() -> None:
+    """
+    Rasterize DEGURBA and CLC (once, after importing them)
+    """
+    # Folder of the rasters
+    path = default_path
+    # Size of the cells in meters (CLC is a 100 m product)
+    cell_size = 100
+    for layer in layers:
+        create_raster(layer, path, cell_size)
+
+
+if __name__ == '__main__':
+    main()
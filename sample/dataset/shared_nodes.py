@@ -0,0 +1,164 @@
+"""
+ |---------------------------------------------------------------------------------------------------------------------|
+ | Shared-node storage of circ datasets: the features of every building are stored once, the subgraphs are stored as
+ | lists of node indices (CSR). Subgraphs are only materialized (with one row per building and subgraph, like in the
+ | DB tables) for the batches that are used.
+ | The export (`GNNDataset.process`) still creates the expanded tensors first and compresses them afterwards, so it
+ | needs as much memory as an expanded export. The shared layout saves memory on disk and during training.
+ |---------------------------------------------------------------------------------------------------------------------|
+"""
+
+import torch
+import torch_geometric
+
+# Attributes with one value per building
+node_attributes = ['x', 'y', 'label_mask', 'osm_id', 'lon', 'lat']
+
+
+def ranges(pointer, index):
+    """
+    Positions of the entries of several rows of a CSR structure
+    :param pointer: start of every row (length: number of rows + 1)
+    :param index: rows
+    :return: positions of all entries of the rows (in the order of the rows), number of entries per row
+    """
+    start = pointer[index]
+    count = pointer[index + 1] - start
+    offset = torch.repeat_interleave(start - torch.cumsum(count, 0) + count, count)
+    return offset + torch.arange(int(count.sum()), dtype=torch.long), count
+
+
+def compress(data):
+    """
+    Shared-node representation of a circ dataset
+    :param data: PyG data object with one row per building and subgraph (see `GNNDataset`)
+    :return: PyG data object with one node per building. The subgraph i consists of the nodes
+    `subgraph_nodes[subgraph_ptr[i]:subgraph_ptr[i + 1]]` (with their hop in `subgraph_hop`) around the node
+    `subgraph_center[i]` and the edges `edge_index[:, edge_ptr[i]:edge_ptr[i + 1]]`.
+    """
+    id_orig, node = torch.unique(data.id_orig, return_inverse=True)
+    num_rows, num_nodes = len(node), len(id_orig)
+    # Features are the same in every subgraph, take them from the first row of every building
+    first = torch.full((num_nodes,), num_rows, dtype=torch.long)
+    first.scatter_reduce_(0, node, torch.arange(num_rows), reduce='amin')
+    # Rows grouped by subgraph, nodes of a subgraph sorted by index
+    order = torch.argsort(data.center_id * num_nodes + node)
+    centers, counts = torch.unique_consecutive(data.center_id[order], return_counts=True)
+    subgraph = torch.searchsorted(centers, data.center_id)
+    # Edges grouped by subgraph
+    edge_subgraph = subgraph[data.edge_index[0]]
+    edge_order = torch.argsort(edge_subgraph, stable=True)
+    shared = torch_geometric.data.Data(
+        edge_index=node[data.edge_index[:, edge_order]],
+        distance=data.distance[edge_order],
+        distance_std=data.distance_std[edge_order],
+        id_orig=id_orig,
+        subgraph_ptr=torch.cat([torch.zeros(1, dtype=torch.long), torch.cumsum(counts, 0)]),
+        subgraph_nodes=node[order],
+        subgraph_hop=data.hop[order],
+        subgraph_center=torch.searchsorted(id_orig, centers),
+        edge_ptr=torch.cat([torch.zeros(1, dtype=torch.long),
+                            torch.cumsum(torch.bincount(edge_subgraph, minlength=len(centers)), 0)]),
+        num_nodes=num_nodes
+    )
+    for attribute in node_attributes:
+        shared[attribute] = data[attribute][first]
+    return shared
+
+
+def num_subgraphs(data):
+    return len(data.subgraph_ptr) - 1
+
+
+def materialize(data, subgraphs=None):
+    """
+    Subgraphs in the layout of `GNNDataset` (one row per building and subgraph)
+    :param data: PyG data object in shared-node representation (see `compress`)
+    :param subgraphs: indices of the subgraphs (default: all)
+    :return: PyG data object
+    """
+    if subgraphs is None:
+        subgraphs = torch.arange(num_subgraphs(data))
+    num_nodes = data.num_nodes
+    position, count = ranges(data.subgraph_ptr, subgraphs)
+    node = data.subgraph_nodes[position]
+    batch = torch.repeat_interleave(torch.arange(len(subgraphs)), count)
+    center = data.subgraph_center[subgraphs][batch]
+    # Rows are sorted by (subgraph in batch, node), so the row of an edge endpoint can be found by binary search
+    row_key = batch * num_nodes + node
+    edge_position, edge_count = ranges(data.edge_ptr, subgraphs)
+    edge_batch = torch.repeat_interleave(torch.arange(len(subgraphs)), edge_count)
+    edge_index = data.edge_index[:, edge_position]
+    edge_index = torch.stack([torch.searchsorted(row_key, edge_batch * num_nodes + edge_index[0]),
+                              torch.searchsorted(row_key, edge_batch * num_nodes + edge_index[1])])
+    materialized = torch_geometric.data.Data(edge_index=edge_index, center_mask=node == center,
+                                             distance=data.distance[edge_position],
+                                             distance_std=data.distance_std[edge_position],
+                                             id=torch.arange(len(node), dtype=torch.long),
+                                             id_orig=data.id_orig[node], hop=data.subgraph_hop[position],
+                                             center_id=data.id_orig[center])
+    for attribute in node_attributes:
+        materialized[attribute] = data[attribute][node]
+    return materialized
+
+
+def batches(data, subgraphs=None, batch_size=64, shuffle=False):
+    """
+    Materialize the subgraphs batch by batch
+    :param data: PyG data object in shared-node representation (see `compress`)
+    :param subgraphs: indices of the subgraphs (default: all)
+    :param batch_size: number of subgraphs per batch
+    :param shuffle: randomly shuffle the subgraphs?
+    :return: generator of PyG data objects
+    """
+    if subgraphs is None:
+        subgraphs = torch.arange(num_subgraphs(data))
+    if shuffle:
+        subgraphs = subgraphs[torch.randperm(len(subgraphs))]
+    for start in range(0, len(subgraphs), batch_size):
+        yield materialize(data, subgraphs[start:start + batch_size])
+
+
+def centers_first(batch):
+    """
+    Reorder the rows of materialized subgraphs such that the centers are the first rows (in the order of the
+    subgraphs), like the input nodes in the batches of PyG's `NeighborLoader`
+    :param batch: PyG data object (see `materialize`)
+    :return: PyG data object with the number of subgraphs in `batch_size`
+    """
+    order = torch.argsort((~batch.center_mask).to(torch.long), stable=True)
+    position = torch.empty_like(order)
+    position[order] = torch.arange(len(order))
+    batch.edge_index = position[batch.edge_index]
+    for attribute in ['center_mask', 'id_orig', 'hop', 'center_id'] + node_attributes:
+        batch[attribute] = batch[attribute][order]
+    batch.batch_size = int(batch.center_mask.sum())
+    return batch
+
+
+class SubgraphLoader:
+    """
+    Data loader over the subgraphs of a dataset in shared-node representation. Batches have the same layout as the
+    batches of a `NeighborLoader` on the expanded dataset: the centers are the first `batch_size` nodes.
+    """
+    def __init__(self, data, subgraphs, batch_size=64, shuffle=False, transform=None):
+        """
+        :param data: PyG data object in shared-node representation (see `compress`)
+        :param subgraphs: indices of the subgraphs
+        :param batch_size: number of subgraphs per batch
+        :param shuffle: randomly shuffle the subgraphs in every epoch?
+        :param transform: function that is applied to every batch (ex. `T.ToUndirected()`)
+        """
+        self.data = data
+        self.subgraphs = subgraphs
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.transform = transform
+
+    def __len__(self):
+        return (len(self.subgraphs) + self.batch_size - 1) // self.batch_size
+
+    def __iter__(self):
+        for batch in batches(self.data, self.subgraphs, self.batch_size, self.shuffle):
+            batch = centers_first(batch)
+            yield batch if self.transform is None else self.transform(batch)
@@ -0,0 +1,163 @@
+"""
+ |---------------------------------------------------------------------------------------------------------------------|
+ | Grid index over the positions (lon/lat) of the nodes of a dataset: node indices sorted by the Morton code of their
+ | grid cell, with the offsets of every non-empty cell. Bounding box and radius queries are split into ranges of Morton
+ | codes of non-empty cells, so their cost does not grow with the area of the query.
+ |---------------------------------------------------------------------------------------------------------------------|
+"""
+
+import numpy as np
+
+earth_radius = 6371008.8
+
+
+def part_bits(values):
+    """
+    Spread the lower 32 bits of the values, such that there is a zero bit between two bits
+    """
+    values = values.astype(np.uint64) & np.uint64(0xFFFFFFFF)
+    for shift, mask in [(16, 0x0000FFFF0000FFFF), (8, 0x00FF00FF00FF00FF), (4, 0x0F0F0F0F0F0F0F0F),
+                        (2, 0x3333333333333333), (1, 0x5555555555555555)]:
+        values = (values | (values << np.uint64(shift))) & np.uint64(mask)
+    return values
+
+
+def morton_code(cell_x, cell_y):
+    return part_bits(cell_x) | (part_bits(cell_y) << np.uint64(1))
+
+
+class GridIndex:
+    def __init__(self, cell_size, keys, offsets, order, lon, lat):
+        """
+        Use `build` or `load` to create an index
+        :param cell_size: size of the grid cells (in degrees)
+        :param keys: Morton codes of the non-empty cells (sorted)
+        :param offsets: start of the nodes of every cell in `order` (length: number of cells + 1)
+        :param order: node indices sorted by cell
+        :param lon, lat: positions of the nodes
+        """
+        self.cell_size = cell_size
+        self.keys = keys
+        self.offsets = offsets
+        self.order = order
+        self.lon = lon
+        self.lat = lat
+
+    @classmethod
+    def build(cls, lon, lat, cell_size=0.01):
+        """
+        :param lon, lat: positions of the nodes (NumPy arrays)
+        :param cell_size: size of the grid cells (in degrees)
+        """
+        lon, lat = np.asarray(lon, dtype=np.float64), np.asarray(lat, dtype=np.float64)
+        codes = morton_code(*cls.cells(lon, lat, cell_size))
+        order = np.argsort(codes, kind='stable')
+        keys, counts = np.unique(codes[order], return_counts=True)
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+        return cls(cell_size, keys, offsets, order, lon, lat)
+
+    @staticmethod
+    def cells(lon, lat, cell_size):
+        return np.floor((lon + 180) / cell_size).astype(np.int64), np.floor((lat + 90) / cell_size).astype(np.int64)
+
+    def save(self, path):
+        np.savez(path, cell_size=self.cell_size, keys=self.keys, offsets=self.offsets, order=self.order, lon=self.lon,
+                 lat=self.lat)
+
+    @classmethod
+    def load(cls, path):
+        arrays = np.load(path)
+        return cls(float(arrays['cell_size']), arrays['keys'], arrays['offsets'], arrays['order'], arrays['lon'],
+                   arrays['lat'])
+
+    def cell_ranges(self, x_min, x_max, y_min, y_max):
+        """
+        Morton code ranges of the non-empty cells within a range of cells: the quadtree of the Morton codes is
+        descended level by level, quadrants within the range are taken completely, quadrants without non-empty cells
+        are dropped. The cost grows with the number of non-empty cells and the boundary, not with the area.
+        :return: first and last Morton code of every range (arrays)
+        """
+        levels = max(int(max(x_max, y_max, 1)).bit_length(), 1)
+        # Quadrants of the current level: lower left cell and first Morton code
+        cell_x, cell_y, code = np.zeros(1, dtype=np.int64), np.zeros(1, dtype=np.int64), np.zeros(1, dtype=np.uint64)
+        first, last = [], []
+        for level in range(levels, -1, -1):
+            size = 1 << level
+            end_code = code + np.uint64(size * size - 1)
+            overlaps = (cell_x <= x_max) & (cell_x + size - 1 >= x_min) \
+                       & (cell_y <= y_max) & (cell_y + size - 1 >= y_min)
+            non_empty = np.searchsorted(self.keys, code) < np.searchsorted(self.keys, end_code, side='right')
+            inside = (cell_x >= x_min) & (cell_x + size - 1 <= x_max) \
+                     & (cell_y >= y_min) & (cell_y + size - 1 <= y_max)
+            keep = overlaps & non_empty
+            first.append(code[keep & inside])
+            last.append(end_code[keep & inside])
+            split = keep & ~inside
+            if level == 0 or not np.any(split):
+                break
+            half = size >> 1
+            cell_x, cell_y, code = cell_x[split], cell_y[split], code[split]
+            cell_x = np.concatenate([cell_x, cell_x + half, cell_x, cell_x + half])
+            cell_y = np.concatenate([cell_y, cell_y, cell_y + half, cell_y + half])
+            step = np.uint64(half * half)
+            code = np.concatenate([code, code + step, code + np.uint64(2) * step, code + np.uint64(3) * step])
+        return np.concatenate(first), np.concatenate(last)
+
+    @staticmethod
+    def lon_ranges(lon_min, lon_max):
+        """
+        Longitude range as ranges within [-180, 180] (ranges beyond the antimeridian are wrapped)
+        """
+        if lon_max - lon_min >= 360:
+            return [(-180.0, 180.0)]
+        if not -180 <= lon_min <= 180:
+            shift = (lon_min + 180) % 360 - 180 - lon_min
+            lon_min, lon_max = lon_min + shift, lon_max + shift
+        if lon_max <= 180:
+            return [(lon_min, lon_max)]
+        return [(lon_min, 180.0), (-180.0, lon_max - 360)]
+
+    def candidates(self, lon_min, lon_max, lat_min, lat_max):
+        """
+        Nodes of all cells that intersect the bounding box
+        """
+        lat_min, lat_max = max(lat_min, -90.0), min(lat_max, 90.0)
+        firsts, lasts = [], []
+        for range_min, range_max in self.lon_ranges(lon_min, lon_max):
+            (x_min, x_max), (y_min, y_max) = self.cells(np.array([range_min, range_max]), np.array([lat_min, lat_max]),
+                                                        self.cell_size)
+            first, last = self.cell_ranges(x_min, x_max, y_min, y_max)
+            firsts.append(first)
+            lasts.append(last)
+        start = self.offsets[np.searchsorted(self.keys, np.concatenate(firsts))]
+        count = self.offsets[np.searchsorted(self.keys, np.concatenate(lasts), side='right')] - start
+        entries = np.repeat(start - np.cumsum(count) + count, count) + np.arange(count.sum())
+        return self.order[entries]
+
+    def bbox(self, lon_min, lon_max, lat_min, lat_max):
+        """
+        :return: indices of the nodes within the bounding box (sorted)
+        """
+        nodes = self.candidates(lon_min, lon_max, lat_min, lat_max)
+        inside = np.zeros(len(nodes), dtype=bool)
+        for range_min, range_max in self.lon_ranges(lon_min, lon_max):
+            inside |= (self.lon[nodes] >= range_min) & (self.lon[nodes] <= range_max)
+        inside &= (self.lat[nodes] >= lat_min) & (self.lat[nodes] <= lat_max)
+        return np.unique(nodes[inside])
+
+    def radius(self, lon, lat, distance):
+        """
+        :param lon, lat: center of the query
+        :param distance: radius (in meters)
+        :return: indices of the nodes within the radius (sorted)
+        """
+        delta_lat = np.degrees(distance / earth_radius)
+        delta_lon = delta_lat / max(np.cos(np.radians(min(abs(lat) + delta_lat, 90.0))), 1e-12)
+        nodes = self.candidates(lon - min(delta_lon, 180.0), lon + min(delta_lon, 180.0), lat - delta_lat,
+                                lat + delta_lat)
+        # Haversine distance
+        phi_1, phi_2 = np.radians(lat), np.radians(self.lat[nodes])
+        a = np.sin((phi_2 - phi_1) / 2) ** 2 \
+            + np.cos(phi_1) * np.cos(phi_2) * np.sin(np.radians(self.lon[nodes] - lon) / 2) ** 2
+        inside = 2 * earth_radius * np.arcsin(np.sqrt(np.minimum(a, 1.0))) <= distance
+        return np.unique(nodes[inside])
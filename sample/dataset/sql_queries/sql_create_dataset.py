@@ -1,13 +1,78 @@
 drop_functions = f'''
     DROP FUNCTION IF EXISTS public.extract_buildings;
-    DROP FUNCTION IF EXISTS public.create_subgraph;
+    DROP FUNCTION IF EXISTS public.update_building_store;
+    DROP FUNCTION IF EXISTS public.create_subgraphs;
     DROP FUNCTION IF EXISTS public.building_level;
     DROP FUNCTION IF EXISTS public.block_level;
     DROP FUNCTION IF EXISTS public.land_use;
     DROP FUNCTION IF EXISTS public.degurba;
     DROP FUNCTION IF EXISTS public.features;
+    DROP FUNCTION IF EXISTS public.features_prepare;
+    DROP FUNCTION IF EXISTS public.features_assemble;
     DROP FUNCTION IF EXISTS public.drop_temp_tables;
+    DROP FUNCTION IF EXISTS public.telemetry;
 '''
+
+"""
+ Persistent store of all buildings (polygon parts of OSM buildings) with stable IDs.
+ The ID of a building only depends on its OSM ID and part, so results of different runs refer to the same buildings.
+ """
+create_building_store = f'''
+    CREATE TABLE IF NOT EXISTS public.building_store (
+        id                          INTEGER PRIMARY KEY,
+        osm_id                      BIGINT NOT NULL,
+        part                        INTEGER NOT NULL,
+        building_key                TEXT,
+        house                       TEXT,
+        geom                        GEOMETRY(POLYGON, 3035),
+        geom_hash                   TEXT,
+        country                     VARCHAR(2),
+        UNIQUE (osm_id, part)
+    );
+    CREATE INDEX IF NOT EXISTS building_store_geom_idx ON public.building_store USING gist(geom);
+    CREATE INDEX IF NOT EXISTS building_store_geom_hash_idx ON public.building_store USING hash(geom_hash);
+'''
+
+# Land use polygons (UA and CLC) with their classes, subdivided into pieces of at most 256 vertices (`poly_id`: original
+# polygon). Created once, drop them after importing new land use data.
+create_land_use_reference = f'''
+    CREATE TABLE IF NOT EXISTS public.ua_subdivided AS
+    (
+        SELECT poly_id,
+               ua,
+               ST_Subdivide(geom, 256) AS geom
+        FROM (
+            SELECT ROW_NUMBER() OVER () AS poly_id,
+                   c.ua,
+                   a.geom
+            FROM public.urban_atlas a
+            JOIN public.ua_matches c
+            ON a.code_2018::INTEGER = c.ua_code
+            -- Unimportant transport units that lead to bad performance -> exclude them
+            WHERE NOT a.code_2018 = ANY(ARRAY['12210', '12220'])
+            AND ST_GeometryType(a.geom) = 'ST_Polygon'
+        ) polygons
+    );
+    CREATE INDEX IF NOT EXISTS ua_subdivided_geom_idx ON public.ua_subdivided USING gist(geom);
+
+    CREATE TABLE IF NOT EXISTS public.clc_subdivided AS
+    (
+        SELECT poly_id,
+               clc,
+               ST_Subdivide(geom, 256) AS geom
+        FROM (
+            SELECT ROW_NUMBER() OVER () AS poly_id,
+                   c.clc,
+                   a.geom
+            FROM public.clc a
+            JOIN public.clc_matches c
+            ON a.clc_code = c.clc_code
+            WHERE ST_GeometryType(a.geom) = 'ST_Polygon'
+        ) polygons
+    );
+    CREATE INDEX IF NOT EXISTS clc_subdivided_geom_idx ON public.clc_subdivided USING gist(geom);
+'''
+
 create_tables_n_hop = f'''
     DROP TABLE IF EXISTS public.node_features_with_labels_n_hop;
     CREATE TABLE public.node_features_with_labels_n_hop (
@@ -104,16 +169,487 @@ create_tables_circ = f'''
 '''
 
 
-def perform_computations(subsample_fraction, num_layers, buildings_in_graph, type, x_min, x_max, y_min, y_max):
-    computations = f"""   
-        SELECT public.extract_buildings({subsample_fraction}, {x_min}, {x_max}, {y_min}, {y_max});
-        SELECT public.create_subgraphs({num_layers}, {buildings_in_graph}, {type == "n_hop"});
-        SELECT public.features({type == "n_hop"});
-        
-        INSERT INTO public.node_features_with_labels_{type}
-        SELECT * FROM node_features_with_labels;
-        
-        INSERT INTO public.edges_{type}
-        SELECT * FROM edges;
+# Methods used to create the subgraphs.
+# circ_radius: 'loop' (grow the buffer of every center by 10 m per iteration) or 'knn' (radius of every center from the
+# distance to its k-th nearest building, all subgraphs in one pass)
+# circ_triangulation: 'per_center' (Delaunay triangulation of every subgraph) or 'global' (one triangulation of all
+# buildings, every subgraph gets the edges between its buildings)
+# center_sampling: 'random' (random order of all labeled buildings), 'hash' (Bernoulli sampling with a hash of the
+# building ID, no sorting), 'hash_label', 'hash_cell' or 'hash_label_cell' (hash sampling with the same expected number
+# of centers per label and/or spatial cell)
+default_modes = {'circ_radius': 'loop', 'circ_triangulation': 'per_center', 'center_sampling': 'random'}
+
+# Size of the spatial cells for stratified center sampling (in meters)
+sampling_cell_size = 1000
+# Seed of the hash sampling
+sampling_seed = 0
+
+
+def sampling_args(modes):
+    """
+    Arguments of `public.extract_buildings` for the center sampling
+    """
+    sampling = modes['center_sampling']
+    return f"{sampling != 'random'}, {'label' in sampling}, " \
+           f"{sampling_cell_size if 'cell' in sampling else 'NULL'}, {sampling_seed}"
+
+
+def modes_key(modes=None):
+    """
+    All modes (including defaults) as string, ex. to compare parameters of runs
+    """
+    return ';'.join(f'{name}={mode}' for name, mode in sorted({**default_modes, **(modes or {})}.items()))
+
+
+def computation_stages(subsample_fraction, num_layers, buildings_in_graph, type, x_min, x_max, y_min, y_max,
+                       in_db=None, modes=None):
+    """
+    Statements of the pipeline, one per stage.
+    All stages work on TEMP tables, so they have to be executed within the same DB session.
+    :param in_db: parts of stages that are computed in the DB, ex. {'building_level': False} if they are computed outside
+    of the DB (stages of their own). building_level: shared walls and touching buildings in `public.block_level`,
+    delaunay: triangulation in `public.create_subgraphs`, n_hop: expansion of the n-hop subgraphs in
+    `public.create_subgraphs`, hops: hops of the circ subgraphs in `public.features_assemble` (otherwise computed
+    when the dataset is exported), blocks: clustering of the buildings into blocks in `public.block_level`,
+    shared_walls: shared walls and touching buildings in `public.block_level` (without the other building-level
+    features), rasters: DEGURBA and CLC classes of all buildings from the polygons in `public.degurba` and
+    `public.land_use` (otherwise only of buildings at polygon borders, see `sample.dataset.rasters`).
+    :param modes: methods used to create the subgraphs, ex. {'circ_radius': 'knn'} (see `default_modes`)
+    :return: list of (stage name, statement)
+    """
+    modes = {**default_modes, **(modes or {})}
+    in_db = {'building_level': True, 'delaunay': True, 'n_hop': True, 'hops': True, 'blocks': True, 'shared_walls': True,
+             'rasters': True, **(in_db or {})}
+    if modes['circ_radius'] not in ['loop', 'knn']:
+        raise ValueError(f'Unknown mode for circ_radius: {modes["circ_radius"]}')
+    if modes['circ_triangulation'] not in ['per_center', 'global']:
+        raise ValueError(f'Unknown mode for circ_triangulation: {modes["circ_triangulation"]}')
+    if modes['center_sampling'] not in ['random', 'hash', 'hash_label', 'hash_cell', 'hash_label_cell']:
+        raise ValueError(f'Unknown mode for center_sampling: {modes["center_sampling"]}')
+    stages = [
+        ('update_building_store', f"""
+            SELECT public.update_building_store({x_min}, {x_max}, {y_min}, {y_max});
+        """),
+        ('extract_buildings', f"""
+            SELECT public.extract_buildings({subsample_fraction}, {x_min}, {x_max}, {y_min}, {y_max},
+                                            NULL, NULL, NULL, NULL, 0, {sampling_args(modes)});
+        """),
+        ('create_subgraphs', f"""
+            SELECT public.create_subgraphs({num_layers}, {buildings_in_graph}, {type == "n_hop"},
+                                           {modes['circ_radius'] == 'knn'},
+                                           {modes['circ_triangulation'] == 'global'}, {in_db['delaunay']},
+                                           {in_db['n_hop']});
+        """),
+        ('features_prepare', f"""
+            SELECT public.features_prepare({type == "n_hop"});
+        """),
+        ('building_level', """
+            SELECT public.building_level();
+        """),
+        ('block_level', f"""
+            SELECT public.block_level({in_db['building_level'] and in_db['shared_walls']}, {in_db['blocks']});
+        """),
+        ('land_use', f"""
+            SELECT public.land_use({in_db['rasters']});
+        """),
+        ('degurba', f"""
+            SELECT public.degurba({in_db['rasters']});
+        """),
+        ('features_assemble', f"""
+            SELECT public.features_assemble({type == "n_hop"}, {in_db['hops']});
+        """),
+        ('store_results', f"""
+            INSERT INTO public.node_features_with_labels_{type}
+            SELECT * FROM node_features_with_labels;
+
+            INSERT INTO public.edges_{type}
+            SELECT * FROM edges;
+        """)
+    ]
+    return stages
+
+
+"""
+ |---------------------------------------------------------------------------------------------------------------------|
+ | Checkpoints: the TEMP tables that a stage passes to later stages are copied into UNLOGGED tables, such that an
+ | interrupted run can be resumed after the last completed stage
+ |---------------------------------------------------------------------------------------------------------------------|
+"""
+
+# TEMP tables produced by every stage that are needed by later stages (only the tables that exist are stored)
+checkpoint_tables = {
+    'extract_buildings': ['buildings', 'buildings_with_labels', 'buildings_subset'],
+    'delaunay': ['delaunay', 'edges'],
+    'create_subgraphs': ['delaunay', 'nodes', 'edges'],
+    'n_hop': ['nodes', 'edges'],
+    'features_prepare': ['buildings_with_features'],
+    'building_level': ['building_level_features'],
+    'blocks': ['building_blocks'],
+    'shared_walls': ['building_level_features_interacting_blocks'],
+    'rasters': ['degurba_lookup', 'clc_lookup'],
+    'block_level': ['building_level_features_interacting_blocks', 'block_level_features_interacting_buildings',
+                    'block_level_features'],
+    'land_use': ['land_cover_category'],
+    'degurba': ['degurba_category'],
+    'features_assemble': ['node_features_with_labels', 'edges']
+}
+
+# Indexes of TEMP tables that are used by later stages
+checkpoint_indexes = {
+    'buildings': 'gist(geom)',
+    'buildings_with_features': 'gist(geom)'
+}
+
+create_checkpoint_tables = f'''
+    CREATE SCHEMA IF NOT EXISTS checkpoint;
+    CREATE TABLE IF NOT EXISTS checkpoint.stages (
+        run_key                     TEXT,
+        stage                       TEXT,
+        finished                    TIMESTAMPTZ,
+        PRIMARY KEY (run_key, stage)
+    );
+'''
+
+
+def completed_stages(run_key):
+    return f"SELECT stage FROM checkpoint.stages WHERE run_key = '{run_key}'"
+
+
+def existing_tables(tables, schema=None):
+    """
+    Tables of the list that exist (TEMP tables of the session if no schema is given)
+    """
+    names = ', '.join(f"'{schema}.{table}'" if schema else f"'{table}'" for table in tables)
+    return f"SELECT name FROM UNNEST(ARRAY[{names}]::TEXT[]) name WHERE TO_REGCLASS(name) IS NOT NULL"
+
+
+def save_checkpoint(run_key, stage, tables):
+    """
+    Copy the output of a stage into UNLOGGED tables and mark the stage as completed (in one transaction)
+    :param run_key: identifier of the run (digest of its parameters)
+    :param tables: TEMP tables that are stored (see `checkpoint_tables`)
+    """
+    query = ''
+    for table in tables:
+        query += f'''
+            DROP TABLE IF EXISTS checkpoint.{run_key}_{table};
+            CREATE UNLOGGED TABLE checkpoint.{run_key}_{table} AS
+            (
+                SELECT * FROM {table}
+            );
+        '''
+    query += f'''
+        INSERT INTO checkpoint.stages (run_key, stage, finished)
+        VALUES ('{run_key}', '{stage}', NOW())
+        ON CONFLICT (run_key, stage) DO UPDATE SET finished = EXCLUDED.finished;
+    '''
+    return query
+
+
+def restore_checkpoint(run_key, tables):
+    """
+    Recreate the TEMP tables of a completed stage in the current session
+    :param tables: TEMP tables that were stored
+    """
+    query = ''
+    for table in tables:
+        query += f'''
+            DROP TABLE IF EXISTS {table};
+            CREATE TEMP TABLE {table} AS
+            (
+                SELECT * FROM checkpoint.{run_key}_{table}
+            );
+        '''
+        if table in checkpoint_indexes:
+            query += f'''
+                CREATE INDEX ON {table} USING {checkpoint_indexes[table]};
+            '''
+        query += f'''
+            ANALYZE {table};
+        '''
+    return query
+
+
+def drop_checkpoint(run_key):
+    """
+    Drop all checkpoints of a run (after its results were stored)
+    """
+    query = f"DELETE FROM checkpoint.stages WHERE run_key = '{run_key}';"
+    for table in sorted(set(sum(checkpoint_tables.values(), []))):
+        query += f'''
+            DROP TABLE IF EXISTS checkpoint.{run_key}_{table};
+        '''
+    return query
+
+
+"""
+ |---------------------------------------------------------------------------------------------------------------------|
+ | Tiled execution: every tile writes its results into staging tables, which are merged afterwards
+ |---------------------------------------------------------------------------------------------------------------------|
+"""
+
+node_feature_columns = ['footprint_area', 'perimeter', 'phi', 'longest_axis_length', 'elongation', 'convexity',
+                        'orientation', 'corners', 'shared_wall_length', 'count_touches', 'block_length',
+                        'av_block_footprint_area', 'std_block_footprint_area', 'block_total_footprint_area',
+                        'block_perimeter', 'block_longest_axis_length', 'block_elongation', 'block_convexity',
+                        'block_orientation', 'block_corners', 'ua_coverage', 'land_cover_ua_clc', 'degurba', 'country',
+                        'osm_id']
+tile_feature_columns = ', '.join(f'f.{column}' for column in node_feature_columns)
+
+
+def create_tile_tables(type):
+    tables = f'''
+        DROP TABLE IF EXISTS public.node_features_with_labels_{type}_tiles;
+        CREATE TABLE public.node_features_with_labels_{type}_tiles (
+            LIKE public.node_features_with_labels_{type}
+        );
+        ALTER TABLE public.node_features_with_labels_{type}_tiles
+        ADD COLUMN tile_id INTEGER,
+        ADD COLUMN core BOOL;
+
+        DROP TABLE IF EXISTS public.edges_{type}_tiles;
+        CREATE TABLE public.edges_{type}_tiles (
+            LIKE public.edges_{type}
+        );
+        ALTER TABLE public.edges_{type}_tiles
+        ADD COLUMN tile_id INTEGER;
+
+        /*
+         Parameters and input data (digest of the OSM buildings) from which the results of each tile were computed
+         */
+        DROP TABLE IF EXISTS public.tile_state_{type};
+        CREATE TABLE public.tile_state_{type} (
+            tile_id                     INTEGER,
+            params                      TEXT,
+            digest                      TEXT
+        );
+    '''
+    return tables
+
+
+def drop_tile_tables(type):
+    tables = f'''
+        DROP TABLE IF EXISTS public.node_features_with_labels_{type}_tiles;
+        DROP TABLE IF EXISTS public.edges_{type}_tiles;
+        DROP TABLE IF EXISTS public.tile_state_{type};
+    '''
+    return tables
+
+
+def tile_tables_exist(type):
+    return f"SELECT TO_REGCLASS('public.tile_state_{type}') IS NOT NULL"
+
+
+def tile_state(type):
+    return f'SELECT tile_id, params, digest FROM public.tile_state_{type}'
+
+
+def tile_digest(x_min, x_max, y_min, y_max, tile_x_min, tile_x_max, tile_y_min, tile_y_max, halo):
+    """
+    Digest of all OSM buildings (geometry and tags) that are extracted for a tile (including its halo).
+    If the digest changes (ex. after an OSM diff update), the tile has to be recomputed.
+    """
+    query = f"""
+        SELECT COALESCE(MD5(STRING_AGG(a.osm_id::TEXT || ':' || MD5(ST_AsBinary(a.way)) || ':' || a.building || ':'
+                                       || COALESCE(a.tags::TEXT, ''), ',' ORDER BY a.osm_id, MD5(ST_AsBinary(a.way)))),
+                        '')
+        FROM public.planet_osm_polygon a
+        JOIN (
+            SELECT ST_Intersection(
+                ST_Transform(ST_MakeEnvelope({x_min}, {y_min}, {x_max}, {y_max}, 4326), 3035),
+                ST_Expand(ST_Transform(ST_MakeEnvelope({tile_x_min}, {tile_y_min}, {tile_x_max}, {tile_y_max}, 4326),
+                                       3035), {halo})
+            ) AS geom
+        ) d
+        ON ST_Within(a.way, d.geom)
+        WHERE a.building IS NOT NULL
+    """
+    return query
+
+
+def computation_stages_tile(subsample_fraction, num_layers, buildings_in_graph, type, x_min, x_max, y_min, y_max,
+                            tile_id, tile_x_min, tile_x_max, tile_y_min, tile_y_max, halo, params, digest,
+                            in_db=None, modes=None):
     """
-    return computations
\ No newline at end of file
+    Statements of the pipeline for one tile, one per stage (see `computation_stages`)
+    :param params: parameters of the run, stored with the results of the tile
+    :param digest: digest of the input data of the tile (see `tile_digest`), stored with the results of the tile
+    :return: list of (stage name, statement)
+    """
+    stages = computation_stages(subsample_fraction, num_layers, buildings_in_graph, type, x_min, x_max, y_min, y_max,
+                                in_db, modes)
+    # The building store is updated once for the whole extract before the tiles are computed
+    stages = stages[1:]
+    stages[0] = ('extract_buildings', f"""
+        SELECT public.extract_buildings({subsample_fraction}, {x_min}, {x_max}, {y_min}, {y_max},
+                                        {tile_x_min}, {tile_x_max}, {tile_y_min}, {tile_y_max}, {halo},
+                                        {sampling_args({**default_modes, **(modes or {})})});
+    """)
+    stages[-1] = ('store_results', f"""
+        DELETE FROM public.node_features_with_labels_{type}_tiles
+        WHERE tile_id = {tile_id};
+
+        DELETE FROM public.edges_{type}_tiles
+        WHERE tile_id = {tile_id};
+
+        /*
+         Buildings whose centroid is not in the tile itself (but in the halo) are marked, such that the merge step
+         takes their features from the tile they belong to.
+         */
+        INSERT INTO public.node_features_with_labels_{type}_tiles
+        SELECT  *,
+                {tile_id} AS tile_id,
+                ST_X(ST_Transform(ST_Centroid(geom), 4326)) >= {tile_x_min}
+                    AND ST_X(ST_Transform(ST_Centroid(geom), 4326)) < {tile_x_max}
+                    AND ST_Y(ST_Transform(ST_Centroid(geom), 4326)) >= {tile_y_min}
+                    AND ST_Y(ST_Transform(ST_Centroid(geom), 4326)) < {tile_y_max} AS core
+        FROM node_features_with_labels;
+
+        INSERT INTO public.edges_{type}_tiles
+        SELECT *, {tile_id} AS tile_id
+        FROM edges;
+
+        DELETE FROM public.tile_state_{type}
+        WHERE tile_id = {tile_id};
+
+        INSERT INTO public.tile_state_{type} (tile_id, params, digest)
+        VALUES ({tile_id}, '{params}', '{digest}');
+    """)
+    return stages
+
+
+merge_tiles_n_hop = f'''
+    /*
+     Building IDs are the same in all tiles (see `public.building_store`). The same physical building can be part of
+     several tiles (inside the tile itself and in the halo of neighboring tiles) -> merge its subgraph memberships.
+     */
+    DROP TABLE IF EXISTS tile_memberships;
+    CREATE TEMP TABLE tile_memberships AS
+    (
+        SELECT  a.id,
+                ARRAY_AGG(u.hop) AS hops,
+                ARRAY_AGG(u.center_id) AS center_ids
+        FROM public.node_features_with_labels_n_hop_tiles a
+        CROSS JOIN LATERAL UNNEST(a.hops, a.center_ids) AS u(hop, center_id)
+        GROUP BY a.id
+    );
+
+    /*
+     Features of a building are taken from the tile it belongs to (halo buildings may lack context at the border)
+     */
+    DROP TABLE IF EXISTS tile_features;
+    CREATE TEMP TABLE tile_features AS
+    (
+        SELECT DISTINCT ON (id) *
+        FROM public.node_features_with_labels_n_hop_tiles
+        ORDER BY id, core DESC
+    );
+
+    INSERT INTO public.node_features_with_labels_n_hop
+    SELECT  {tile_feature_columns},
+            f.id = ANY(b.center_ids) AS center_mask,
+            b.hops,
+            b.center_ids,
+            f.geom,
+            f.lon,
+            f.lat,
+            f.id,
+            f.numerical_label
+    FROM tile_features f
+    JOIN tile_memberships b
+    ON f.id = b.id;
+
+    INSERT INTO public.edges_n_hop
+    SELECT  a.start_id,
+            a.end_id,
+            MIN(a.distance) AS distance,
+            ARRAY_AGG(u.hop) AS hops,
+            ARRAY_AGG(u.center_id) AS center_ids
+    FROM public.edges_n_hop_tiles a
+    CROSS JOIN LATERAL UNNEST(a.hops, a.center_ids) AS u(hop, center_id)
+    GROUP BY a.start_id, a.end_id;
+
+    DROP TABLE IF EXISTS tile_memberships;
+    DROP TABLE IF EXISTS tile_features;
+'''
+
+merge_tiles_circ = f'''
+    /*
+     Centers are unique across tiles, so every row (building in a subgraph) is kept. Only renumber the rows.
+     Building IDs (`id_orig`, `center_id`) are the same in all tiles.
+     */
+    DROP TABLE IF EXISTS tile_rows;
+    CREATE TEMP TABLE tile_rows AS
+    (
+        SELECT  tile_id,
+                id AS local_id,
+                ROW_NUMBER() OVER (ORDER BY tile_id, id) - 1 AS id
+        FROM public.node_features_with_labels_circ_tiles
+    );
+
+    CREATE INDEX ON tile_rows (tile_id, local_id);
+
+    /*
+     Features of a building are taken from the tile it belongs to, see n_hop
+     */
+    DROP TABLE IF EXISTS tile_features;
+    CREATE TEMP TABLE tile_features AS
+    (
+        SELECT DISTINCT ON (id_orig) *
+        FROM public.node_features_with_labels_circ_tiles
+        ORDER BY id_orig, core DESC
+    );
+
+    CREATE INDEX ON tile_features (id_orig);
+
+    INSERT INTO public.node_features_with_labels_circ
+    SELECT  {tile_feature_columns},
+            a.center_mask,
+            a.center_id,
+            a.hop,
+            f.geom,
+            f.lon,
+            f.lat,
+            a.id_orig,
+            r.id,
+            f.numerical_label
+    FROM public.node_features_with_labels_circ_tiles a
+    JOIN tile_rows r
+    ON r.tile_id = a.tile_id AND r.local_id = a.id
+    JOIN tile_features f
+    ON f.id_orig = a.id_orig;
+
+    INSERT INTO public.edges_circ
+    SELECT  s.id AS start_id,
+            e.id AS end_id,
+            a.distance,
+            a.center_id
+    FROM public.edges_circ_tiles a
+    JOIN tile_rows s
+    ON s.tile_id = a.tile_id AND s.local_id = a.start_id
+    JOIN tile_rows e
+    ON e.tile_id = a.tile_id AND e.local_id = a.end_id;
+
+    DROP TABLE IF EXISTS tile_rows;
+    DROP TABLE IF EXISTS tile_features;
+'''
+
+
+"""
+ |---------------------------------------------------------------------------------------------------------------------|
+ | Global building graph (see `sample.dataset.building_graph`)
+ |---------------------------------------------------------------------------------------------------------------------|
+"""
+
+# All buildings are nodes (without subgraphs), such that features are computed for all of them
+building_graph_nodes = f'''
+    DROP TABLE IF EXISTS nodes;
+    CREATE TEMP TABLE nodes AS
+    (
+        SELECT  id,
+                false AS center_mask,
+                ARRAY[]::INTEGER[] AS hops,
+                ARRAY[]::INTEGER[] AS center_ids
+        FROM buildings
+    );
+'''
@@ -0,0 +1,201 @@
+"""
+ |---------------------------------------------------------------------------------------------------------------------|
+ | Create subgraphs on demand (during training) from a global building graph, instead of materializing all subgraphs
+ | in the DB. Subsample fraction, radius and number of buildings per subgraph can be changed without a new export.
+ |---------------------------------------------------------------------------------------------------------------------|
+"""
+
+import numpy as np
+import scipy.spatial
+import torch
+import torch_geometric
+
+import sample.dataset.preprocessing as pp
+import sample.dataset.engines.delaunay as dl
+import sample.dataset.engines.n_hop as nh
+
+
+class BuildingGraph:
+    """
+    All buildings of a region: node features, centroids (for the spatial index) and Delaunay edges.
+    The arrays can be memory-mapped (ex. `np.load(..., mmap_mode='r')`), only the rows of a subgraph are read.
+    """
+    def __init__(self, x, y, points, start=None, end=None, distance=None, adjacency=None):
+        """
+        :param x: node features, array of shape (number of buildings, number of features)
+        :param y: labels (9: no label)
+        :param points: centroids (EPSG:3035), array of shape (number of buildings, 2)
+        :param start, end, distance: Delaunay edges of all buildings (node indices). Computed if not given.
+        :param adjacency: Delaunay edges as symmetric CSR adjacency (pointer, neighbors, distances), instead of the
+        edge list (see `sample.dataset.building_graph`)
+        """
+        self.x = x
+        self.y = y
+        self.points = np.asarray(points)
+        self.num_nodes = len(self.points)
+        if adjacency is None:
+            if start is None:
+                start, end, distance = dl.delaunay_edges(np.arange(self.num_nodes), self.points)
+            adjacency = nh.csr_adjacency(np.asarray(start), np.asarray(end), np.asarray(distance), self.num_nodes)
+        self.pointer, self.neighbors, self.weights = adjacency
+        self.tree = scipy.spatial.cKDTree(self.points)
+        # Standardization of the edge weights (like `pp.scale_edge_weights_array`). Every edge is stored twice in the
+        # adjacency, which does not change mean and standard deviation.
+        self.distance_mean = float(np.mean(self.weights, dtype=np.float64)) if len(self.weights) else 0.0
+        std = float(np.std(self.weights, dtype=np.float64)) if len(self.weights) else 0.0
+        self.distance_std = std if std > 0 else 1.0
+
+
+class SubgraphGenerator:
+    def __init__(self, graph, type, buildings_in_graph=20, hops=4, max_radius=20010, triangulation='per_center'):
+        """
+        :param graph: global building graph (see `BuildingGraph`)
+        :param type: type of subgraph: `circ` or `n_hop`
+        :param buildings_in_graph: minimum number of buildings in a circ subgraph
+        :param hops: number of hops of n_hop subgraphs
+        :param max_radius: maximum radius of circ subgraphs (in meters)
+        :param triangulation: edges of circ subgraphs: `per_center` (Delaunay triangulation of the subgraph) or
+        `global` (edges of the global triangulation between buildings of the subgraph)
+        """
+        if type not in ['circ', 'n_hop']:
+            raise ValueError(f'Unknown subgraph type {type}')
+        if triangulation not in ['per_center', 'global']:
+            raise ValueError(f'Unknown triangulation {triangulation}')
+        self.graph = graph
+        self.type = type
+        self.buildings_in_graph = buildings_in_graph
+        self.hops = hops
+        self.max_radius = max_radius
+        self.triangulation = triangulation
+
+    def centers(self, subsample_fraction=1.0, seed=0):
+        """
+        Random subset of the labeled buildings
+        :return: node indices of the centers
+        """
+        labeled = np.flatnonzero(np.asarray(self.graph.y) != 9)
+        rng = np.random.default_rng(seed)
+        return np.sort(labeled[rng.random(len(labeled)) < subsample_fraction])
+
+    def radius(self, center):
+        """
+        Radius of the circ subgraph: distance to the k-th nearest building, rounded up to 10 m (like the `knn` mode of
+        `public.create_subgraphs`, but with distances between centroids)
+        """
+        if self.graph.num_nodes < self.buildings_in_graph:
+            return self.max_radius
+        distance, _ = self.graph.tree.query(self.graph.points[center], k=[self.buildings_in_graph])
+        return min(max(10, np.ceil(distance[0] / 10) * 10), self.max_radius)
+
+    def circ(self, center):
+        """
+        :return: node indices (sorted), hops of the nodes, edges (start, end as positions in the nodes, distance)
+        """
+        nodes = np.sort(np.asarray(self.graph.tree.query_ball_point(self.graph.points[center], self.radius(center)),
+                                   dtype=np.int64))
+        if self.triangulation == 'per_center':
+            start, end, distance = dl.delaunay_edges(np.arange(len(nodes)), self.graph.points[nodes])
+        else:
+            position, count = adjacency_ranges(self.graph.pointer, nodes)
+            start = np.repeat(np.arange(len(nodes)), count)
+            end = np.searchsorted(nodes, self.graph.neighbors[position])
+            inside = (end < len(nodes)) & (nodes[np.minimum(end, len(nodes) - 1)] == self.graph.neighbors[position])
+            # Every edge once (from the node with the lower index)
+            keep = inside & (start < np.minimum(end, len(nodes)))
+            start, end, distance = start[keep], end[keep], self.graph.weights[position][keep]
+        # Nodes that are not connected to the center are not part of the subgraph (like in `public.features_assemble`)
+        hops = pp.hops_from_centers(start, end, nodes == center)
+        keep = hops >= 0
+        edge_mask, start, end = pp.drop_nodes(keep, start, end)
+        return nodes[keep], hops[keep], (start, end, distance[edge_mask])
+
+    def n_hop(self, center):
+        """
+        Same subgraph as in `public.create_subgraphs` (n-hop method): in hop h, all edges of the nodes found in hop h - 1
+        are added, directed from the neighbor to the node
+        :return: node indices (sorted), hops of the nodes, edges (start, end as positions in the nodes, distance)
+        """
+        frontier = np.array([center], dtype=np.int64)
+        nodes, hops = [frontier], [np.zeros(1, dtype=np.int64)]
+        edges = [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0))]
+        seen = frontier
+        for hop in range(1, self.hops + 1):
+            neighbor, node, weight, _ = nh.expand(self.graph.pointer, self.graph.neighbors, self.graph.weights,
+                                                  frontier, np.zeros(len(frontier), dtype=np.int64))
+            edges.append((neighbor, node, weight))
+            frontier = np.setdiff1d(neighbor, seen)
+            if len(frontier) == 0:
+                break
+            seen = np.union1d(seen, frontier)
+            nodes.append(frontier)
+            hops.append(np.full(len(frontier), hop, dtype=np.int64))
+        nodes, hops = np.concatenate(nodes), np.concatenate(hops)
+        order = np.argsort(nodes)
+        nodes, hops = nodes[order], hops[order]
+        start, end, distance = (np.concatenate(values) for values in zip(*edges))
+        # Edges that were added in several hops are kept once (shortest, like `MIN(distance)`)
+        pairs, inverse = np.unique(np.stack([start, end]), axis=1, return_inverse=True)
+        shortest = np.full(pairs.shape[1], np.inf)
+        np.minimum.at(shortest, inverse.reshape(-1), distance)
+        return nodes, hops, (np.searchsorted(nodes, pairs[0]), np.searchsorted(nodes, pairs[1]), shortest)
+
+    def subgraph(self, center):
+        """
+        Subgraph around a building with the attributes of the `GNNDataset` (only the ones needed for training)
+        :param center: node index of the center
+        :return: PyG data object
+        """
+        if self.type == 'circ':
+            nodes, hops, (start, end, distance) = self.circ(center)
+        else:
+            nodes, hops, (start, end, distance) = self.n_hop(center)
+        graph = self.graph
+        y = torch.from_numpy(np.asarray(graph.y[nodes], dtype=np.int64))
+        distance = torch.from_numpy(np.asarray(distance, dtype=np.float32)).unsqueeze(1)
+        data = torch_geometric.data.Data(x=torch.from_numpy(np.asarray(graph.x[nodes], dtype=np.float32)),
+                                         edge_index=torch.from_numpy(np.stack([start, end]).astype(np.int64)),
+                                         center_mask=torch.from_numpy(nodes == center), distance=distance,
+                                         distance_std=(distance - graph.distance_mean) / graph.distance_std,
+                                         y=y, label_mask=y != 9, id_orig=torch.from_numpy(nodes),
+                                         hop=torch.from_numpy(hops),
+                                         center_id=torch.full((len(nodes),), int(center), dtype=torch.long))
+        return data
+
+
+def adjacency_ranges(pointer, nodes):
+    """
+    Positions of the adjacency entries of the nodes in the CSR adjacency
+    :return: positions, number of entries per node
+    """
+    count = pointer[nodes + 1] - pointer[nodes]
+    return np.repeat(pointer[nodes] - np.cumsum(count) + count, count) + np.arange(count.sum()), count
+
+
+class SubgraphDataset(torch.utils.data.Dataset):
+    """
+    One subgraph per center, created when it is requested
+    """
+    def __init__(self, generator, centers):
+        self.generator = generator
+        self.centers = centers
+
+    def __len__(self):
+        return len(self.centers)
+
+    def __getitem__(self, idx):
+        return self.generator.subgraph(self.centers[idx])
+
+
+def load_subgraphs(generator, centers, batch_size, shuffle, num_workers=4):
+    """
+    Batches of subgraphs that are created in background worker processes
+    :param generator: subgraph generator (see `SubgraphGenerator`)
+    :param centers: node indices of the centers
+    :param batch_size: number of subgraphs per batch
+    :param shuffle: randomly shuffle the centers?
+    :param num_workers: number of worker processes
+    :return: dataloader
+    """
+    dataset = SubgraphDataset(generator, centers)
+    return torch_geometric.loader.DataLoader(dataset, batch_size=batch_size, shuffle=shuffle, num_workers=num_workers,
+                                             persistent_workers=num_workers > 0)
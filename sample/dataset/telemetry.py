@@ -0,0 +1,132 @@
+"""
+ |---------------------------------------------------------------------------------------------------------------------|
+ | Timing and progress of the pipeline: collects the telemetry notices of the SQL functions (see `public.telemetry`)
+ | and the runtime of every stage, prints progress with an ETA and writes a JSON report
+ |---------------------------------------------------------------------------------------------------------------------|
+"""
+
+import os
+import json
+import time
+import threading
+import contextlib
+import datetime as dt
+
+notice_prefix = 'telemetry '
+
+
+class Telemetry:
+    """
+    Collector for the telemetry of one run. Can be shared by several sessions (ex. tiles computed in parallel).
+    The ETA is based on the stage runtimes of the previous run (stored in the report), if available.
+    """
+    def __init__(self, report_path=None, num_runs=1, num_stages=0):
+        """
+        :param report_path: path of the JSON report. The report of the previous run is used for the ETA.
+        :param num_runs: number of times the stages are run (ex. number of tiles)
+        :param num_stages: number of stages per run
+        """
+        self.report_path = report_path
+        self.num_runs = num_runs
+        self.num_stages = num_stages
+        self.start = time.time()
+        self.events = []
+        self.stages = []
+        self.lock = threading.Lock()
+        self.previous = {}
+        if report_path is not None and os.path.exists(report_path):
+            with open(report_path) as file:
+                previous = json.load(file)
+            for stage in previous['stages']:
+                self.previous[stage['stage']] = self.previous.get(stage['stage'], 0) + stage['runtime']
+            self.previous = {name: runtime / max(previous['num_runs'], 1) for name, runtime in self.previous.items()}
+
+    def append(self, notice):
+        """
+        Called by psycopg2 for every notice of the session (see `attach`)
+        """
+        message = notice.split(':', 1)[-1].strip()
+        if not message.startswith(notice_prefix):
+            return
+        event = json.loads(message[len(notice_prefix):])
+        event['time'] = round(time.time() - self.start, 3)
+        with self.lock:
+            self.events.append(event)
+        print(self.format_event(event))
+
+    @staticmethod
+    def format_event(event):
+        details = ', '.join(f'{key}: {value}' for key, value in event.items()
+                            if key not in ['stage', 'elapsed', 'time', 'loop'])
+        if 'loop' in event:
+            line = f'  {event["stage"]} ({event["loop"]} loop, {event["elapsed"]:.1f} s): {details}'
+            # Progress of the buffer loop: centers whose subgraph is still too small
+            if 'centers_left' in event and event['centers']:
+                line += f' ({100 * (1 - event["centers_left"] / event["centers"]):.0f}% of centers done)'
+            return line
+        return f'  {event["stage"]} ({event["elapsed"]:.1f} s): {details}'
+
+    @contextlib.contextmanager
+    def attach(self, connection):
+        """
+        Collect the notices of a session
+        :param connection: connection of a session (see `db.session`)
+        """
+        dbapi_connection = connection.connection.dbapi_connection
+        notices = dbapi_connection.notices
+        dbapi_connection.notices = self
+        try:
+            yield self
+        finally:
+            dbapi_connection.notices = notices
+
+    @contextlib.contextmanager
+    def stage(self, name, run=None):
+        """
+        Measure the runtime of a stage
+        :param name: name of the stage
+        :param run: identifier of the run (ex. tile ID)
+        """
+        start = time.time()
+        yield
+        stage = {'stage': name, 'run': run, 'start': round(start - self.start, 3), 'runtime': time.time() - start}
+        with self.lock:
+            self.stages.append(stage)
+        print(f'{name} done in {dt.timedelta(seconds=round(stage["runtime"]))}, ETA: {self.eta()}')
+
+    def eta(self):
+        """
+        Estimated remaining time of the whole run: remaining work (expected runtime of all stages that are not done)
+        divided by the rate at which work was done so far (accounts for stages that run in parallel)
+        """
+        with self.lock:
+            runtimes = {}
+            for stage in self.stages:
+                runtimes.setdefault(stage['stage'], []).append(stage['runtime'])
+        work_done = sum(sum(values) for values in runtimes.values())
+        if work_done == 0:
+            return 'unknown'
+        expected = {name: sum(values) / len(values) for name, values in runtimes.items()}
+        expected.update(self.previous)
+        # Stages without runtime (no previous run) are assumed to take as long as the average stage
+        num_unknown = max(self.num_stages - len(expected), 0)
+        expected_per_run = sum(expected.values()) + num_unknown * sum(expected.values()) / len(expected)
+        remaining_work = max(expected_per_run * self.num_runs - work_done, 0)
+        rate = work_done / (time.time() - self.start)
+        return dt.timedelta(seconds=round(remaining_work / rate))
+
+    def report(self):
+        with self.lock:
+            return {
+                'num_runs': self.num_runs,
+                'runtime': time.time() - self.start,
+                'stages': list(self.stages),
+                'events': list(self.events)
+            }
+
+    def save(self):
+        if self.report_path is None:
+            return
+        os.makedirs(os.path.dirname(self.report_path) or '.', exist_ok=True)
+        with open(self.report_path, 'w') as file:
+            json.dump(self.report(), file, indent=2)
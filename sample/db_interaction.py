@@ -5,13 +5,16 @@
 """
 
 import os
-import pandas as pd
-import sqlalchemy
+import contextlib
 
+# SQLAlchemy and Pandas are imported on first use, such that importing this module is fast
 
-def create_sqlalchemy_engine():
+
+def create_sqlalchemy_engine(pool_size=5, max_overflow=10):
     """
     Create engine in SQLAlchemy
+    :param pool_size: number of connections kept open in the connection pool
+    :param max_overflow: number of additional connections that can be opened when all pooled connections are in use
     :return: engine
     """
     user = 'postgres'
@@ -19,68 +22,172 @@ def create_sqlalchemy_engine():
     host = 'localhost'
     port = 5432
     database = 'osm'
-    return sqlalchemy.create_engine(f'postgresql://{user}:{password}@{host}:{port}/{database}')
+    import sqlalchemy
+    return sqlalchemy.create_engine(f'postgresql://{user}:{password}@{host}:{port}/{database}',
+                                    pool_size=pool_size, max_overflow=max_overflow, pool_pre_ping=True)
+
+
+engine = None
+
+
+def get_engine():
+    """
+    Engine is only created when the DB is used for the first time
+    :return: engine
+    """
+    global engine
+    if engine is None:
+        engine = create_sqlalchemy_engine()
+    return engine
+
+
+def configure_pool(pool_size):
+    """
+    Replace the connection pool by a bounded pool (ex. one connection per worker)
+    :param pool_size: maximum number of connections that are open at the same time
+    """
+    global engine
+    if engine is not None:
+        engine.dispose()
+    engine = create_sqlalchemy_engine(pool_size=pool_size, max_overflow=0)
 
 
-engine = create_sqlalchemy_engine()
+def text(query):
+    """
+    Wrap SQL query for execution with SQLAlchemy
+    :param query: SQL query as string
+    :return: executable SQL query
+    """
+    import sqlalchemy
+    return sqlalchemy.sql.text(query)
+
+
+@contextlib.contextmanager
+def session(settings=None):
+    """
+    Hand out one pooled connection for a group of statements. TEMP tables and session settings are shared by all
+    statements that are executed with this connection.
+    :param settings: session settings, ex. {'work_mem': '1GB', 'max_parallel_workers_per_gather': 4}
+    :return: connection
+    """
+    with get_engine().connect() as connection:
+        try:
+            for name, value in (settings or {}).items():
+                connection.execute(text('SELECT set_config(:name, :value, false)'),
+                                   {'name': name, 'value': str(value)})
+            connection.commit()
+            yield connection
+            connection.commit()
+        except BaseException:
+            # The state of the connection is unknown -> do not return it to the pool
+            connection.invalidate()
+            raise
+        # Do not pass TEMP tables and settings on to the next user of the connection
+        connection.execute(text('RESET ALL; DISCARD TEMP;'))
+        connection.commit()
 
 
-def execute_statement(query):
+def execute_statement(query, connection=None):
     """
     Execute query (without result)
     :param query: SQL query as string
+    :param connection: connection of a session (see `session`). If not set, a connection is taken from the pool.
     """
-    query = sqlalchemy.sql.text(query)
-    with engine.connect() as connection:
+    query = text(query)
+    if connection is None:
+        with get_engine().connect() as connection:
+            connection.execute(query)
+            connection.commit()
+    else:
         connection.execute(query)
         connection.commit()
 
 
-def sql_to_df(query):
+def sql_to_df(query, connection=None):
     """
     Execute a database query that loads SQL table into Pandas dataframe.
     :param query: SQL query as string
+    :param connection: connection of a session (see `session`). If not set, a connection is taken from the pool.
     :return: dataframe containing query result
     """
-    query = sqlalchemy.sql.text(query)
-    df = pd.read_sql_query(query, engine)
+    import pandas as pd
+    query = text(query)
+    df = pd.read_sql_query(query, get_engine() if connection is None else connection)
     return df
 
 
-def sql_to_float(query):
+def sql_to_float(query, connection=None):
     """
     Execute a database query that returns a single numerical value (like number of rows in a table) as float
     :param query: SQL query as string
+    :param connection: connection of a session (see `session`)
     :return: float containing the query result
     """
-    query = sqlalchemy.sql.text(query)
-    df = pd.read_sql_query(query, engine)
+    df = sql_to_df(query, connection)
     # Result is a dataframe with one row and one column. Convert this to float.
     lst = df.iloc[:, 0].tolist()
     return float(lst[0])
 
 
-def sql_to_string(query):
+def sql_to_string(query, connection=None):
     """
     Execute a database query that returns a single string (like one column value of a specific row)
     :param query: SQL query as string
+    :param connection: connection of a session (see `session`)
     :return: string containing the query result
     """
-    query = sqlalchemy.sql.text(query)
-    df = pd.read_sql_query(query, engine)
+    df = sql_to_df(query, connection)
     # Result is a dataframe with one row and one column. Convert this to float.
     lst = df.iloc[:, 0].tolist()
     return str(lst[0])
 
 
-def sql_to_bool(query):
+def sql_to_bool(query, connection=None):
     """
     Execute a database query that returns a single boolean
     :param query: SQL query as string
+    :param connection: connection of a session (see `session`)
     :return: bool containing the query result
     """
-    query = sqlalchemy.sql.text(query)
-    df = pd.read_sql_query(query, engine)
+    df = sql_to_df(query, connection)
     # Result is a dataframe with one row and one column. Convert this to float.
     lst = df.iloc[:, 0].tolist()
-    return bool(lst[0])
\ No newline at end of file
+    return bool(lst[0])
+
+
+def df_to_temp_table(df, table_name, connection, types=None):
+    """
+    Bulk-load a dataframe into a TEMP table (with COPY). Existing tables with the same name are replaced.
+    :param df: dataframe
+    :param table_name: name of the TEMP table
+    :param connection: connection of a session (see `session`). The table is only visible within this session.
+    :param types: PostgreSQL types of columns, ex. {'hops': 'INTEGER[]'}. Other types are derived from the dataframe.
+    """
+    import io
+    types = types or {}
+    columns = []
+    for column, dtype in df.dtypes.items():
+        if column in types:
+            columns.append(f'{column} {types[column]}')
+        elif dtype.kind in 'iu':
+            columns.append(f'{column} BIGINT')
+        elif dtype.kind == 'f':
+            columns.append(f'{column} DOUBLE PRECISION')
+        elif dtype.kind == 'b':
+            columns.append(f'{column} BOOL')
+        else:
+            columns.append(f'{column} TEXT')
+    # Arrays are written in the PostgreSQL array format
+    df = df.copy()
+    for column in types:
+        if types[column].endswith('[]'):
+            df[column] = ['{' + ','.join(str(value) for value in values) + '}' for values in df[column]]
+    execute_statement(f'''
+        DROP TABLE IF EXISTS {table_name};
+        CREATE TEMP TABLE {table_name} ({', '.join(columns)});
+    ''', connection)
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    connection.connection.cursor().copy_expert(f'COPY {table_name} FROM STDIN (FORMAT csv)', buffer)
+    connection.commit()
@@ -13,6 +13,8 @@ import sample.models.gat as gat
 import sample.models.transformer as trans
 import sample.models.gcn as gcn
 import sample.models.graphsage as sage
+import sample.dataset.shared_nodes as sn
+import sample.training.split_dataset as sd
 import sample.training.train as tr
 import sample.training.eval as ev
 
@@ -26,6 +28,46 @@ def train_and_eval_gnn(data, config, model_name, model_type):
     :param model_type: which kind of classifier? (ex. GAT)
     :return: model predictions
     """
+    if config.storage == 'shared':
+        dataloader_train, dataloader_val, dataloader_test = shared_dataloaders(data, config, model_type)
+    else:
+        dataloader_train, dataloader_val, dataloader_test = neighbor_dataloaders(data, config, model_type)
+    # Determine device. Train on GPU if available
+    device = (
+            'cuda'
+            if torch.cuda.is_available()
+            else 'mps'
+            if torch.backends.mps.is_available()
+            else 'cpu'
+    )
+    print(f'Device: {device}')
+    # Set loss function
+    loss_fn = nn.NLLLoss()
+    input_layer_size = 69
+    if model_type == 'gat':
+        model = gat.GAT(input_layer_size, config, 9).to(device)
+    elif model_type == 'transformer':
+        model = trans.GraphTransformer(input_layer_size, config, 9).to(device)
+    elif model_type == 'gcn':
+        model = gcn.GCN(input_layer_size, config, 9).to(device)
+    elif model_type == 'sage':
+        model = sage.GraphSAGE(input_layer_size, config, 9).to(device)
+    print(model)
+    tr.train_and_log(model, device, dataloader_train, dataloader_val,
+                  loss_fn, config, model_name, '', model_type)
+    y_predict, _ = ev.evaluate_and_log(dataloader_test, model, device, loss_fn, True, None, model_type, 'test',
+                                       config)
+    return y_predict
+
+
+def neighbor_dataloaders(data, config, model_type):
+    """
+    Data loaders for the expanded dataset (subgraphs are sampled around the center nodes)
+    :param data: graph data object with train/val/test masks
+    :param config: various hyperparameters
+    :param model_type: which kind of classifier? (ex. GAT)
+    :return: dataloaders for training, validation and test
+    """
     # Create undirected graph
     to_undirected = T.ToUndirected()
     data = to_undirected(data)
@@ -64,29 +106,21 @@ def train_and_eval_gnn(data, config, model_name, model_type):
                                             replace=False,
                                             shuffle=False,
                                             subgraph_type='induced')
-    # Determine device. Train on GPU if available
-    device = (
-            'cuda'
-            if torch.cuda.is_available()
-            else 'mps'
-            if torch.backends.mps.is_available()
-            else 'cpu'
-    )
-    print(f'Device: {device}')
-    # Set loss function
-    loss_fn = nn.NLLLoss()
-    input_layer_size = 69
-    if model_type == 'gat':
-        model = gat.GAT(input_layer_size, config, 9).to(device)
-    elif model_type == 'transformer':
-        model = trans.GraphTransformer(input_layer_size, config, 9).to(device)
-    elif model_type == 'gcn':
-        model = gcn.GCN(input_layer_size, config, 9).to(device)
-    elif model_type == 'sage':
-        model = sage.GraphSAGE(input_layer_size, config, 9).to(device)
-    print(model)
-    tr.train_and_log(model, device, dataloader_train, dataloader_val,
-                  loss_fn, config, model_name, '', model_type)
-    y_predict, _ = ev.evaluate_and_log(dataloader_test, model, device, loss_fn, True, None, model_type, 'test',
-                                       config)
-    return y_predict
+    return dataloader_train, dataloader_val, dataloader_test
+
+
+def shared_dataloaders(data, config, model_type):
+    """
+    Data loaders for a circ dataset in shared-node representation (see `sample.dataset.shared_nodes`). Every subgraph
+    has one center, so the subgraphs are split into train/val/test set and materialized batch by batch.
+    :param data: graph data object in shared-node representation
+    :param config: various hyperparameters
+    :param model_type: which kind of classifier? (ex. GAT)
+    :return: dataloaders for training, validation and test
+    """
+    transform = T.ToUndirected()
+    if model_type == 'sage' and config.aggr == 'lstm':
+        transform = T.Compose([transform, lambda batch: batch.sort(sort_by_row=False)])
+    train_mask, val_mask, test_mask = sd.split_train_val_test(torch.ones(sn.num_subgraphs(data), dtype=torch.bool))
+    return [sn.SubgraphLoader(data, mask.nonzero(as_tuple=True)[0], config.batch_size, shuffle, transform)
+            for mask, shuffle in [(train_mask, True), (val_mask, False), (test_mask, False)]]
@@ -1,10 +1,8 @@
 import json
 
-import sample.dataset.gnn_dataset as dsm
-import sample.training.split_dataset as sd
-import sample.training.train_and_eval_tree as tetree
-import sample.training.train_and_eval_fcnn as tefcnn
-import sample.training.train_and_eval_gnn as tegnn
+# PyTorch, PyG and scikit-learn are imported in `train`, such that configs can be loaded and checked quickly
+
+model_types = ['gat', 'gcn', 'transformer', 'sage', 'fcnn', 'dt', 'rf']
 
 
 class Config:
@@ -13,10 +11,12 @@ class Config:
             setattr(self, key, value)
 
 
-def train(args=None):
-    model_type = args.model_type
-    model_name = model_type
-
+def load_config(model_type):
+    """
+    Load hyperparameters of a model together with the general settings
+    :param model_type: which kind of classifier? (ex. GAT)
+    :return: dict with all settings
+    """
     with open(f'sample/training/config/{model_type}.json', 'r') as json_file:
         config_dict = json.load(json_file)
     with open(f'sample/training/config/general.json', 'r') as json_file:
@@ -24,12 +24,54 @@ def train(args=None):
         config_dict['only_center_labels'] = general_dict['only_center_labels']
         config_dict['subgraph_type'] = general_dict['subgraph_type']
         config_dict['hops'] = general_dict['hops']
+        config_dict['storage'] = general_dict.get('storage', 'expanded')
+    return config_dict
+
+
+def validate_config(model_type):
+    """
+    Check that the config of a model can be used for training
+    :param model_type: which kind of classifier? (ex. GAT)
+    :return: dict with all settings
+    """
+    if model_type not in model_types:
+        raise ValueError(f'Unknown model type {model_type}, expected one of {", ".join(model_types)}')
+    config_dict = load_config(model_type)
+    if config_dict['subgraph_type'] not in ['circ', 'n_hop']:
+        raise ValueError(f'Unknown subgraph type {config_dict["subgraph_type"]}')
+    if config_dict['storage'] not in ['expanded', 'shared']:
+        raise ValueError(f'Unknown storage {config_dict["storage"]}')
+    if config_dict['storage'] == 'shared':
+        # Subgraphs of the shared-node storage are materialized per batch, only GNNs are trained on batches of
+        # subgraphs, and the labels of the surrounding nodes are not split into train/val/test set
+        if config_dict['subgraph_type'] != 'circ':
+            raise ValueError('Shared-node storage is only available for circ subgraphs')
+        if model_type in ['dt', 'rf', 'fcnn']:
+            raise ValueError(f'Shared-node storage can only be used with GNNs, not with {model_type}')
+        if not config_dict['only_center_labels']:
+            raise ValueError('Shared-node storage requires only_center_labels')
+    return config_dict
+
+
+def train(args=None):
+    import sample.dataset.gnn_dataset as dsm
+    import sample.training.split_dataset as sd
+    import sample.training.train_and_eval_tree as tetree
+    import sample.training.train_and_eval_fcnn as tefcnn
+    import sample.training.train_and_eval_gnn as tegnn
+
+    model_type = args.model_type
+    model_name = model_type
+
+    config_dict = validate_config(model_type)
 
     path = f'./sample/dataset/{config_dict["subgraph_type"]}'
-    data = dsm.GNNDataset(path, config_dict['subgraph_type'])[0]
+    data = dsm.GNNDataset(path, config_dict['subgraph_type'], storage=config_dict['storage'])[0]
     config = Config(**config_dict)
-    data.train_mask, data.val_mask, data.test_mask = sd.split_train_val_test(data.center_mask)
-    if not config_dict['only_center_labels']:
+    # With shared-node storage, the subgraphs are split in `train_and_eval_gnn`
+    if config_dict['storage'] == 'expanded':
+        data.train_mask, data.val_mask, data.test_mask = sd.split_train_val_test(data.center_mask)
+    if config_dict['storage'] == 'expanded' and not config_dict['only_center_labels']:
         data.label_mask_train, data.label_mask_val, data.label_mask_test = sd.label_masks_train_val_test(data,
                                                                                                          data.train_mask,
                                                                                                          data.val_mask,
@@ -0,0 +1,73 @@
+"""
+ |---------------------------------------------------------------------------------------------------------------------|
+ | Building-level features of the Python engine on hand-built polygons, checked against values computed by hand from
+ | the definitions in `public.building_level` and `public.block_level`. Parity with the SQL engine is not checked here:
+ | `sample/benchmarks/building_level.py` needs a live database and fails if the engines differ by more than its
+ | tolerance.
+ |---------------------------------------------------------------------------------------------------------------------|
+"""
+
+import numpy as np
+import pytest
+import shapely
+
+import sample.dataset.engines.building_level as blp
+
+rectangle = shapely.box(0, 0, 10, 4)
+l_shape = shapely.Polygon([(0, 0), (10, 0), (10, 4), (4, 4), (4, 10), (0, 10)])
+rotated_square = shapely.affinity.rotate(shapely.box(0, 0, 2, 2), 30, origin=(0, 0))
+
+
+def features(geom):
+    values = blp.shape_features(np.array([geom]))
+    return {name: value[0] for name, value in values.items()}
+
+
+def test_rectangle():
+    values = features(rectangle)
+    assert values['footprint_area'] == pytest.approx(40)
+    assert values['perimeter'] == pytest.approx(28)
+    # Minimum bounding circle: half of the diagonal (radius^2 = 29)
+    assert values['phi'] == pytest.approx(40 / (29 * np.pi))
+    assert values['longest_axis_length'] == pytest.approx(np.sqrt(116))
+    assert values['elongation'] == pytest.approx(0.4)
+    assert values['convexity'] == pytest.approx(1)
+    assert values['orientation'] == pytest.approx(0, abs=1e-9)
+    assert values['corners'] == 4
+
+
+def test_l_shape():
+    values = features(l_shape)
+    assert values['footprint_area'] == pytest.approx(64)
+    assert values['perimeter'] == pytest.approx(40)
+    # Minimum bounding circle through (0, 0), (10, 0) and (0, 10)
+    assert values['phi'] == pytest.approx(64 / (50 * np.pi))
+    assert values['longest_axis_length'] == pytest.approx(2 * np.sqrt(50))
+    # The minimum rotated rectangle is the axis-aligned 10 x 10 square
+    assert values['elongation'] == pytest.approx(1)
+    # The convex hull misses the triangle (10, 4), (4, 10), (4, 4)
+    assert values['convexity'] == pytest.approx(64 / 82)
+    assert values['orientation'] == pytest.approx(0, abs=1e-9)
+    assert values['corners'] == 6
+
+
+def test_rotated_square():
+    values = features(rotated_square)
+    assert values['footprint_area'] == pytest.approx(4)
+    assert values['perimeter'] == pytest.approx(8)
+    assert values['phi'] == pytest.approx(4 / (2 * np.pi))
+    assert values['longest_axis_length'] == pytest.approx(2 * np.sqrt(2))
+    assert values['elongation'] == pytest.approx(1)
+    assert values['convexity'] == pytest.approx(1)
+    assert values['orientation'] == pytest.approx(30)
+    assert values['corners'] == 4
+
+
+def test_shared_wall():
+    # Two buildings with a common wall of 8 m, one free-standing building
+    geoms = np.array([shapely.box(0, 0, 10, 8), shapely.box(10, 0, 20, 8), shapely.box(50, 0, 60, 8)])
+    ids = np.array([1, 2, 3])
+    blp.init_worker(ids, shapely.to_wkb(geoms))
+    values = blp.interacting_features(ids, geoms)
+    np.testing.assert_allclose(values['shared_wall_length'], [8, 8, 0])
+    np.testing.assert_array_equal(values['count_touches'], [1, 1, 0])
@@ -0,0 +1,42 @@
+"""
+ |---------------------------------------------------------------------------------------------------------------------|
+ | Lookup of the DEGURBA / CLC classes in a rasterized grid: a building only gets a class if all cells covered by its
+ | bounding box have this class.
+ |---------------------------------------------------------------------------------------------------------------------|
+"""
+
+import numpy as np
+import shapely
+
+import sample.dataset.rasters as rs
+
+cell_size = 100
+shape = (20, 20)
+# Class 1 everywhere, with a small polygon of class 2 in the middle (smaller than a 2 x 2 window)
+geoms = np.array([shapely.box(0, 0, 2000, 2000), shapely.box(1000, 1000, 1150, 1150)])
+codes = np.array([1, 2], dtype=np.uint8)
+
+
+def grid():
+    values = np.full(shape, rs.no_data, dtype=np.uint8)
+    rs.rasterize(geoms, codes, 0, 0, shape, cell_size, values)
+    return values, {'x_min': 0, 'y_min': 0, 'cell_size': cell_size}
+
+
+def test_lookup():
+    values, meta = grid()
+    buildings = {
+        'small': (450, 460, 450, 460),
+        'wide_inside': (300, 750, 300, 340),
+        # The corners are all in class 1, the polygon of class 2 is in between
+        'wide_across': (600, 1550, 1050, 1060),
+        'outside': (5000, 5010, 5000, 5010),
+        'partly_outside': (1650, 2450, 500, 510)
+    }
+    bounds = np.array(list(buildings.values()), dtype=np.float64).T
+    result = dict(zip(buildings, rs.lookup(values, meta, *bounds)))
+    assert result['small'] == 1
+    assert result['wide_inside'] == 1
+    assert result['wide_across'] == rs.ambiguous
+    assert result['outside'] == rs.no_data
+    assert result['partly_outside'] == rs.ambiguous
@@ -0,0 +1,92 @@
+"""
+ |---------------------------------------------------------------------------------------------------------------------|
+ | Shared walls of the segment-matching engine on hand-built polygons, compared with the definition in
+ | `public.block_level`: the length of the buffered exterior ring (0.35 m) that lies within the touching buildings.
+ |---------------------------------------------------------------------------------------------------------------------|
+"""
+
+import numpy as np
+import pytest
+import shapely
+
+import sample.dataset.engines.shared_walls as sw
+
+wall = shapely.box(0, 0, 10, 8)
+# Length of a rounded corner of the buffered ring, which segment matching does not count
+corner = np.pi / 2 * sw.wall_distance
+
+
+def compute(geoms):
+    geoms = np.array(geoms)
+    ids = np.arange(1, len(geoms) + 1)
+    wkb = shapely.to_wkb(geoms)
+    sw.init_worker(ids, wkb)
+    return sw.compute_chunk(ids, wkb)
+
+
+def baseline(geoms):
+    """
+    Shared wall length and number of touching buildings as in `public.block_level`
+    """
+    lengths, touches = [], []
+    for i, geom in enumerate(geoms):
+        ring = shapely.boundary(shapely.buffer(geom, sw.wall_distance))
+        others = [other for j, other in enumerate(geoms) if j != i and shapely.dwithin(geom, other, sw.wall_distance)]
+        lengths.append(sum(shapely.length(shapely.intersection(ring, other)) for other in others))
+        touches.append(len(others))
+    return np.array(lengths), np.array(touches)
+
+
+def test_shared_wall():
+    geoms = [wall, shapely.box(10, 0, 20, 8), shapely.box(50, 0, 60, 8)]
+    values = compute(geoms)
+    lengths, touches = baseline(geoms)
+    np.testing.assert_allclose(values['shared_wall_length'], [8, 8, 0])
+    np.testing.assert_allclose(values['shared_wall_length'], lengths)
+    np.testing.assert_array_equal(values['count_touches'], touches)
+
+
+def test_split_collinear_wall():
+    # The wall of the first building is shared with two buildings that also touch each other
+    geoms = [wall, shapely.box(10, 0, 20, 4), shapely.box(10, 4, 20, 8)]
+    values = compute(geoms)
+    lengths, touches = baseline(geoms)
+    np.testing.assert_allclose(values['shared_wall_length'], [8, 14, 14])
+    np.testing.assert_array_equal(values['count_touches'], touches)
+    # The buffered rings of the split buildings additionally reach around one corner into the first building
+    assert values['shared_wall_length'][0] == pytest.approx(lengths[0])
+    np.testing.assert_allclose(values['shared_wall_length'][1:], lengths[1:] - corner, atol=0.01)
+
+
+def test_thin_neighbour():
+    # Both long sides of the neighbour are within 0.35 m of the wall, the wall is only counted once
+    geoms = [wall, shapely.box(10, 0, 10.2, 8)]
+    values = compute(geoms)
+    lengths, touches = baseline(geoms)
+    np.testing.assert_allclose(values['shared_wall_length'], [8, 8])
+    np.testing.assert_array_equal(values['count_touches'], touches)
+    assert values['shared_wall_length'][1] == pytest.approx(lengths[1])
+    # The buffered ring of the first building passes the neighbour, `public.block_level` does not count the wall
+    assert lengths[0] == pytest.approx(0)
+
+
+def test_overlapping_collinear_segments():
+    # The boundary of the neighbour (invalid, with a spike) runs along the wall twice between 2 m and 7 m
+    geoms = [wall, shapely.Polygon([(10, 0), (20, 0), (20, 8), (10, 8), (10, 2), (10, 7)])]
+    values = compute(geoms)
+    lengths, touches = baseline(geoms)
+    assert values['shared_wall_length'][0] == pytest.approx(8)
+    assert values['shared_wall_length'][0] == pytest.approx(lengths[0])
+    np.testing.assert_array_equal(values['count_touches'], touches)
+
+
+def test_diagonal_neighbour():
+    # A corner of the neighbour is 0.3 m away from the wall, no wall is shared
+    geoms = [wall, shapely.Polygon([(10.3, 4), (12.3, 2), (14.3, 4), (12.3, 6)])]
+    values = compute(geoms)
+    lengths, touches = baseline(geoms)
+    np.testing.assert_allclose(values['shared_wall_length'], [0, 0])
+    np.testing.assert_array_equal(values['count_touches'], [1, 1])
+    np.testing.assert_array_equal(values['count_touches'], touches)
+    # The buffered rings only cut through the corner
+    assert np.all(lengths < 2 * sw.wall_distance)
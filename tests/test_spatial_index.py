@@ -0,0 +1,58 @@
+"""
+ |---------------------------------------------------------------------------------------------------------------------|
+ | Bounding box and radius queries of the grid index, compared with a brute-force filter over all nodes
+ |---------------------------------------------------------------------------------------------------------------------|
+"""
+
+import numpy as np
+import pytest
+
+import sample.dataset.spatial_index as si
+
+rng = np.random.default_rng(0)
+# Nodes all over the world, with clusters at the antimeridian and close to the north pole
+lon = np.concatenate([rng.uniform(-180, 180, 20000), rng.uniform(179, 180, 2000), rng.uniform(-180, -179, 2000),
+                      rng.uniform(-180, 180, 2000)])
+lat = np.concatenate([rng.uniform(-90, 90, 20000), rng.uniform(-1, 1, 4000), rng.uniform(89, 90, 2000)])
+index = si.GridIndex.build(lon, lat)
+
+
+def brute_force_radius(center_lon, center_lat, distance):
+    phi_1, phi_2 = np.radians(center_lat), np.radians(lat)
+    a = np.sin((phi_2 - phi_1) / 2) ** 2 \
+        + np.cos(phi_1) * np.cos(phi_2) * np.sin(np.radians(lon - center_lon) / 2) ** 2
+    return np.flatnonzero(2 * si.earth_radius * np.arcsin(np.sqrt(np.minimum(a, 1.0))) <= distance)
+
+
+@pytest.mark.parametrize('lon_min, lon_max, lat_min, lat_max', [
+    (11.4, 11.7, 48.1, 48.3),
+    # Continent-sized
+    (-25, 45, 34, 72),
+    (-180, 180, -90, 90),
+    (10, 10, 0, 0)
+])
+def test_bbox(lon_min, lon_max, lat_min, lat_max):
+    expected = np.flatnonzero((lon >= lon_min) & (lon <= lon_max) & (lat >= lat_min) & (lat <= lat_max))
+    np.testing.assert_array_equal(index.bbox(lon_min, lon_max, lat_min, lat_max), expected)
+
+
+def test_bbox_across_antimeridian():
+    expected = np.flatnonzero(((lon >= 179.5) | (lon <= -179.5)) & (lat >= -0.5) & (lat <= 0.5))
+    assert len(expected) > 0
+    np.testing.assert_array_equal(index.bbox(179.5, 180.5, -0.5, 0.5), expected)
+    np.testing.assert_array_equal(index.bbox(-180.5, -179.5, -0.5, 0.5), expected)
+
+
+@pytest.mark.parametrize('center_lon, center_lat, distance', [
+    (11.5, 48.2, 500000),
+    # Across the antimeridian
+    (179.9, 0, 50000),
+    (-179.95, 0.5, 30000),
+    # Around the north pole
+    (0, 89.9, 100000),
+    (45, 60, 5000000)
+])
+def test_radius(center_lon, center_lat, distance):
+    expected = brute_force_radius(center_lon, center_lat, distance)
+    assert len(expected) > 0
+    np.testing.assert_array_equal(index.radius(center_lon, center_lat, distance), expected)